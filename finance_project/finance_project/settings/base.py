@@ -28,15 +28,12 @@ INSTALLED_APPS = [
     "django.contrib.humanize",
     
     # external apps
-    "django_extensions",
-    "debug_toolbar",
     "widget_tweaks",
     'allauth',
     'allauth.account',
     'allauth.socialaccount',
     'django_filters',
     'django_htmx',
-    'import_export',
     
     # project apps
     "tracker",
@@ -47,11 +44,13 @@ SITE_ID = 1
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
+    "tracker.metrics.MetricsMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
-    "debug_toolbar.middleware.DebugToolbarMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "tracker.sharding.ShardMiddleware",
+    "tracker.profiling.ProfilingMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "django_htmx.middleware.HtmxMiddleware",
@@ -112,6 +111,28 @@ DEFAULT_FILE_STORAGE = 'django.core.files.storage.FileSystemStorage'
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Cache backend, e.g. CACHE_URL=redis://localhost:6379/1; the default is per process
+CACHES = {"default": env.cache("CACHE_URL", default="locmemcache://")}
+
+# Optional per-user sharding of the tracker tables (see tracker.sharding): the database
+# aliases users are spread over. Left empty, everything stays in the default database.
+# Needs a shared CACHE_URL. Users are placed on a hash ring of these aliases unless
+# pinned, so to add or remove one without stranding anyone's data:
+#   1. run `pin_user_shards` with the current list, pinning every user where their data is
+#   2. change the list and migrate the new database
+#   3. optionally run `rebalance_shards`, moving pinned users to their new place on the ring
+TRACKER_SHARDS = env.list('TRACKER_SHARDS', default=[])
+DATABASE_ROUTERS = ['tracker.sharding.ShardRouter']
+
+# Request profiling captures (see tracker.profiling)
+PROFILING_ROOT = BASE_DIR / 'profiles'
+
+# Per-process metrics files merged by the /metrics endpoint (see tracker.metrics). The
+# endpoint requires "Authorization: Bearer <METRICS_TOKEN>", and is closed without a
+# token unless DEBUG is on
+METRICS_ROOT = BASE_DIR / 'metrics'
+METRICS_TOKEN = env('METRICS_TOKEN', default=None)
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
@@ -2,6 +2,8 @@ from .base import *
 
 DEBUG = False
 
+# Only the base apps and middleware are loaded; dev tools are added in staging
+
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.postgresql",
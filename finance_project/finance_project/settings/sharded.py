@@ -0,0 +1,30 @@
+from .base import *
+
+DEBUG = True
+
+# Local sharding setup: users and sessions in db.sqlite3, tracker data spread over two
+# more SQLite files. Create them with `migrate --database=<alias>` for each alias.
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "db.sqlite3",
+    },
+    "shard_1": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "shard_1.sqlite3",
+    },
+    "shard_2": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "shard_2.sqlite3",
+    },
+}
+
+TRACKER_SHARDS = ["shard_1", "shard_2"]
+
+# Shard assignments are cached, in a cache every local process shares
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": BASE_DIR / "cache",
+    }
+}
@@ -2,6 +2,17 @@ from .base import *
 
 DEBUG = True
 
+# Development-only apps, kept out of the production profile
+INSTALLED_APPS += [
+    "django_extensions",
+    "debug_toolbar",
+]
+
+MIDDLEWARE.insert(
+    MIDDLEWARE.index("django.middleware.csrf.CsrfViewMiddleware") + 1,
+    "debug_toolbar.middleware.DebugToolbarMiddleware",
+)
+
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.postgresql",
@@ -0,0 +1,43 @@
+import os
+import tempfile
+
+# The test run needs no real secret
+os.environ.setdefault("SECRET_KEY", "insecure-test-key")
+
+from .base import *
+
+# Tests run on SQLite unless TEST_DATABASE_NAME points them at PostgreSQL, which
+# the row lock tests (ConcurrentBalanceUpdateTests, marked stress) need and are
+# skipped without. CI runs them on their own against PostgreSQL:
+#   TEST_DATABASE_NAME=tracker TEST_DATABASE_USER=... pytest -m stress
+# The shard databases are only used by the tests that turn sharding on (ShardingTests)
+database_suffixes = {"default": "", "shard_1": "_shard_1", "shard_2": "_shard_2", "shard_3": "_shard_3"}
+if env("TEST_DATABASE_NAME", default=None):
+    DATABASES = {
+        alias: {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": env("TEST_DATABASE_NAME") + suffix,
+            "USER": env("TEST_DATABASE_USER", default="postgres"),
+            "PASSWORD": env("TEST_DATABASE_PASSWORD", default=""),
+            "HOST": env("TEST_DATABASE_HOST", default="localhost"),
+            "PORT": env("TEST_DATABASE_PORT", default="5432"),
+        }
+        for alias, suffix in database_suffixes.items()
+    }
+else:
+    # Kept out of the project directory like the files below
+    DATABASE_ROOT = Path(tempfile.mkdtemp(prefix="tracker-test-db-"))
+    DATABASES = {
+        alias: {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": DATABASE_ROOT / f"test{suffix}.sqlite3",
+        }
+        for alias, suffix in database_suffixes.items()
+    }
+
+TRACKER_SHARDS = []
+
+# Files written by tests stay out of the project directory
+MEDIA_ROOT = Path(tempfile.mkdtemp(prefix="tracker-test-media-"))
+PROFILING_ROOT = Path(tempfile.mkdtemp(prefix="tracker-test-profiles-"))
+METRICS_ROOT = Path(tempfile.mkdtemp(prefix="tracker-test-metrics-"))
@@ -1,9 +1,16 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 
+from tracker.views import ProfileCaptureListView, ProfileCaptureDetailView
+
 urlpatterns = [
+    path("admin/profiles/", ProfileCaptureListView.as_view(), name='profile-captures'),
+    path("admin/profiles/<str:capture_id>/", ProfileCaptureDetailView.as_view(), name='profile-capture'),
     path("admin/", admin.site.urls),
     path('', include('tracker.urls')),
-    path('__debug__/', include('debug_toolbar.urls')),
     path('accounts/', include('allauth.urls')),
 ]
+
+if "debug_toolbar" in settings.INSTALLED_APPS:
+    urlpatterns.append(path('__debug__/', include('debug_toolbar.urls')))
@@ -0,0 +1,126 @@
+from typing import NamedTuple
+from decimal import Decimal
+
+from django.core.cache import cache
+
+from tracker.models import Account
+
+ACCOUNT_DIRECTORY_TIMEOUT = 60 * 60
+
+# In-process copy of each user's directory, keyed by user id: (version, directory)
+_local_directories = {}
+
+
+class AccountEntry(NamedTuple):
+    id: int
+    name: str
+    account_type: str
+    balance: Decimal
+
+
+class AccountDirectory:
+    """
+    A user's accounts by id, in name order, with an index of the ids using each
+    name. Account names are not unique, so resolving a name used by more than
+    one account is an error rather than a guess.
+    """
+
+    def __init__(self, entries):
+        self.accounts = {}
+        self.names = {}
+        for entry in entries:
+            self.accounts[entry.id] = entry
+            self.names.setdefault(entry.name, []).append(entry.id)
+
+    def __iter__(self):
+        return iter(self.accounts.values())
+
+    def __len__(self):
+        return len(self.accounts)
+
+    def get(self, account_id):
+        return self.accounts.get(account_id)
+
+    def resolve(self, name):
+        """
+        Returns the entry of the one account with the given name, raising ValueError when there is none or several.
+        """
+        account_ids = self.names.get(name)
+        if not account_ids:
+            raise ValueError(f"Account not found: {name}")
+        if len(account_ids) > 1:
+            raise ValueError(f"Account name is ambiguous: {len(account_ids)} accounts are named {name}")
+        return self.accounts[account_ids[0]]
+
+
+def _version_key(user_id):
+    return f'tracker:account-directory-version:{user_id}'
+
+
+def _directory_key(user_id, version):
+    return f'tracker:account-directory:{user_id}:{version}'
+
+
+def get_directory_version(user_id):
+    """
+    Returns the current directory version for the user, initialising it if missing.
+    """
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        cache.add(_version_key(user_id), 1, timeout=None)
+        version = cache.get(_version_key(user_id), 1)
+    return version
+
+
+def get_account_directory(user):
+    """
+    Returns the user's accounts as an AccountDirectory.
+
+    The directory is served from an in-process copy when its version matches the
+    one stored in Django's cache, then from Django's cache, and only hits the
+    database when both are stale.
+    """
+    user_id = user.pk if hasattr(user, 'pk') else user
+    version = get_directory_version(user_id)
+
+    # Step 1: In-process copy
+    local = _local_directories.get(user_id)
+    if local and local[0] == version:
+        return local[1]
+
+    # Step 2: Shared cache
+    directory = cache.get(_directory_key(user_id, version))
+
+    # Step 3: Database
+    if directory is None:
+        directory = AccountDirectory(
+            AccountEntry(*row)
+            for row in Account.objects.filter(user_id=user_id)
+            .order_by('name', 'pk')
+            .values_list('pk', 'name', 'account_type', 'balance')
+        )
+        cache.set(_directory_key(user_id, version), directory, timeout=ACCOUNT_DIRECTORY_TIMEOUT)
+
+    _local_directories[user_id] = (version, directory)
+    return directory
+
+
+def invalidate_account_directory(user_id):
+    """
+    Bumps the user's directory version so every process reloads it on next access.
+    """
+    try:
+        cache.incr(_version_key(user_id))
+    except ValueError:
+        # The version key was evicted or never set
+        cache.set(_version_key(user_id), get_directory_version(user_id) + 1, timeout=None)
+    _local_directories.pop(user_id, None)
+
+
+def get_account_choices(user):
+    """
+    Returns (id, name) choices for the user's accounts, for use in form select fields.
+    """
+    return [('', '---------')] + [
+        (entry.id, entry.name) for entry in get_account_directory(user)
+    ]
@@ -1,11 +1,302 @@
 from django.contrib import admin
-from tracker.models import User, Account, AccountBalanceHistory, Transaction, Income, Expense, Tax
-
-# Register your models here.
-admin.site.register(User)
-admin.site.register(Account)
-admin.site.register(AccountBalanceHistory)
-admin.site.register(Transaction)
-admin.site.register(Income)
-admin.site.register(Expense)
-admin.site.register(Tax)
+from django.contrib.auth.admin import UserAdmin
+from tracker.models import (
+    User, Account, AccountBalanceHistory, Transaction, Income, Expense, Tax, Budget, CategorySpend,
+    ArchivedTransaction, ArchivedIncome, ArchivedExpense, OpeningBalance, ArchiveCheckpoint, IngestionBatch, SyncSource,
+    CategoryRule, TaxReport, ShardAssignment, ApiToken,
+)
+from tracker.ledger import schedule_queryset_update, schedule_transaction_update
+from tracker.budgets import apply_spend_changes, collect_expense_spend, diff_spend
+from tracker.pagination import EstimatedCountPaginator
+from tracker.tracker_helpers import schedule_directory_invalidation
+from tracker.description_index import invalidate_description_index
+from tracker import sharding
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Base admin for tables that grow without bound: no full-table COUNT(*) on the
+    changelist, and approximate page counts when the table is unfiltered.
+    """
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+    list_per_page = 100
+
+
+@admin.register(Account)
+class AccountAdmin(admin.ModelAdmin):
+    list_display = ('name', 'user', 'account_type', 'balance')
+    list_select_related = ('user',)
+    list_filter = ('account_type',)
+    search_fields = ('name',)
+    autocomplete_fields = ('user',)
+
+
+@admin.register(AccountBalanceHistory)
+class AccountBalanceHistoryAdmin(LargeTableAdmin):
+    """
+    Drops the cached account directory, which net worth series are keyed by, of
+    the owners of edited and deleted history rows.
+    """
+    list_display = ('account', 'balance', 'timestamp')
+    list_select_related = ('account',)
+    autocomplete_fields = ('account',)
+    date_hierarchy = 'timestamp'
+
+    def save_model(self, request, obj, form, change):
+        user_ids = {obj.account.user_id}
+        if change:
+            user_ids.add(AccountBalanceHistory.objects.values_list('account__user_id', flat=True).get(pk=obj.pk))
+        super().save_model(request, obj, form, change)
+        for user_id in user_ids:
+            schedule_directory_invalidation(user_id)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        schedule_directory_invalidation(obj.account.user_id)
+
+    def delete_queryset(self, request, queryset):
+        user_ids = set(queryset.values_list('account__user_id', flat=True).distinct())
+        super().delete_queryset(request, queryset)
+        for user_id in user_ids:
+            schedule_directory_invalidation(user_id)
+
+
+@admin.register(Transaction)
+class TransactionAdmin(LargeTableAdmin):
+    """
+    Sends admin edits through the ledger, so the balances of the accounts a
+    transaction moved from and to are recalculated once the change commits,
+    keeps the Income/Expense row and the budget spend counters in step with
+    it, and drops the description suggestions of the owners of deleted
+    transactions.
+    """
+    list_display = ('date', 'type', 'description', 'amount', 'origin_account', 'destination_account', 'user')
+    list_select_related = ('origin_account', 'destination_account', 'user')
+    list_filter = ('type',)
+    autocomplete_fields = ('user', 'origin_account', 'destination_account')
+    raw_id_fields = ('sync_source',)
+    date_hierarchy = 'date'
+
+    def save_model(self, request, obj, form, change):
+        with sharding.atomic():
+            expenses = Expense.objects.filter(transaction=obj)
+            original_spend = collect_expense_spend(expenses) if change else {}
+            if change:
+                # The accounts and report year the transaction is moved away from change too
+                schedule_transaction_update(Transaction.objects.get(pk=obj.pk))
+            super().save_model(request, obj, form, change)
+
+            # Update the Income/Expense record as the edit view does
+            for model in (Income, Expense):
+                account_field = Transaction.REQUIRED_ACCOUNTS[model.__name__.lower()]
+                model.objects.filter(transaction=obj).update(
+                    amount=obj.amount, date=obj.date, account=getattr(obj, account_field),
+                )
+            apply_spend_changes(diff_spend(original_spend, collect_expense_spend(expenses)))
+            schedule_transaction_update(obj)
+
+    def delete_model(self, request, obj):
+        with sharding.atomic():
+            spend = collect_expense_spend(Expense.objects.filter(transaction=obj))
+            super().delete_model(request, obj)
+            schedule_transaction_update(obj)
+            apply_spend_changes(spend, sign=-1)
+            sharding.on_commit(lambda: invalidate_description_index(obj.user_id))
+
+    def delete_queryset(self, request, queryset):
+        with sharding.atomic():
+            spend = collect_expense_spend(Expense.objects.filter(transaction__in=queryset))
+            schedule_queryset_update(queryset)
+            user_ids = set(queryset.values_list('user_id', flat=True).distinct())
+            super().delete_queryset(request, queryset)
+            apply_spend_changes(spend, sign=-1)
+            for user_id in user_ids:
+                sharding.on_commit(lambda user_id=user_id: invalidate_description_index(user_id))
+
+
+@admin.register(Income)
+class IncomeAdmin(LargeTableAdmin):
+    list_display = ('date', 'category', 'amount', 'account')
+    list_select_related = ('account',)
+    list_filter = ('category',)
+    raw_id_fields = ('transaction',)
+    autocomplete_fields = ('account',)
+    date_hierarchy = 'date'
+
+
+class ExpenseSpendAdmin(LargeTableAdmin):
+    """
+    Base admin for the Expense and ArchivedExpense tables, applying the spend of
+    edited and deleted rows to the budget counters in the same atomic block.
+    """
+
+    def save_model(self, request, obj, form, change):
+        with sharding.atomic():
+            expenses = self.model.objects.filter(pk=obj.pk)
+            original_spend = collect_expense_spend(expenses) if change else {}
+            super().save_model(request, obj, form, change)
+            apply_spend_changes(diff_spend(original_spend, collect_expense_spend(expenses)))
+
+    def delete_model(self, request, obj):
+        with sharding.atomic():
+            spend = collect_expense_spend(self.model.objects.filter(pk=obj.pk))
+            super().delete_model(request, obj)
+            apply_spend_changes(spend, sign=-1)
+
+    def delete_queryset(self, request, queryset):
+        with sharding.atomic():
+            spend = collect_expense_spend(queryset)
+            super().delete_queryset(request, queryset)
+            apply_spend_changes(spend, sign=-1)
+
+
+@admin.register(Expense)
+class ExpenseAdmin(ExpenseSpendAdmin):
+    list_display = ('date', 'category', 'amount', 'source', 'fixed_or_variable', 'account')
+    list_select_related = ('account',)
+    list_filter = ('category',)
+    raw_id_fields = ('transaction',)
+    autocomplete_fields = ('account',)
+    date_hierarchy = 'date'
+
+
+@admin.register(Tax)
+class TaxAdmin(admin.ModelAdmin):
+    list_display = ('year', 'amount', 'date', 'account')
+    list_select_related = ('account',)
+    raw_id_fields = ('transaction',)
+    autocomplete_fields = ('account',)
+
+
+@admin.register(Budget)
+class BudgetAdmin(admin.ModelAdmin):
+    list_display = ('category', 'amount', 'user')
+    list_select_related = ('user',)
+    autocomplete_fields = ('user',)
+
+
+@admin.register(CategorySpend)
+class CategorySpendAdmin(LargeTableAdmin):
+    list_display = ('month', 'category', 'amount', 'user')
+    list_select_related = ('user',)
+    autocomplete_fields = ('user',)
+
+
+@admin.register(ArchivedTransaction)
+class ArchivedTransactionAdmin(LargeTableAdmin):
+    """
+    Takes the spend of the archived expenses deleted along with archived
+    transactions off the budget counters.
+    """
+    list_display = ('date', 'type', 'description', 'amount', 'origin_account', 'destination_account', 'user')
+    list_select_related = ('origin_account', 'destination_account', 'user')
+    autocomplete_fields = ('user', 'origin_account', 'destination_account')
+    date_hierarchy = 'date'
+
+    def delete_model(self, request, obj):
+        with sharding.atomic():
+            spend = collect_expense_spend(ArchivedExpense.objects.filter(transaction=obj))
+            super().delete_model(request, obj)
+            apply_spend_changes(spend, sign=-1)
+
+    def delete_queryset(self, request, queryset):
+        with sharding.atomic():
+            spend = collect_expense_spend(ArchivedExpense.objects.filter(transaction__in=queryset))
+            super().delete_queryset(request, queryset)
+            apply_spend_changes(spend, sign=-1)
+
+
+@admin.register(ArchivedIncome)
+class ArchivedIncomeAdmin(LargeTableAdmin):
+    list_display = ('date', 'category', 'amount', 'account')
+    list_select_related = ('account',)
+    raw_id_fields = ('transaction',)
+    autocomplete_fields = ('account',)
+
+
+@admin.register(ArchivedExpense)
+class ArchivedExpenseAdmin(ExpenseSpendAdmin):
+    list_display = ('date', 'category', 'amount', 'account')
+    list_select_related = ('account',)
+    raw_id_fields = ('transaction',)
+    autocomplete_fields = ('account',)
+
+
+@admin.register(OpeningBalance)
+class OpeningBalanceAdmin(admin.ModelAdmin):
+    list_display = ('account', 'balance')
+    list_select_related = ('account',)
+    autocomplete_fields = ('account',)
+
+
+@admin.register(ArchiveCheckpoint)
+class ArchiveCheckpointAdmin(admin.ModelAdmin):
+    list_display = ('user', 'cutoff', 'income', 'expenses')
+    list_select_related = ('user',)
+    autocomplete_fields = ('user',)
+
+
+@admin.register(IngestionBatch)
+class IngestionBatchAdmin(admin.ModelAdmin):
+    list_display = ('key', 'user', 'rows', 'created', 'created_at')
+    list_select_related = ('user',)
+    autocomplete_fields = ('user',)
+
+
+@admin.register(SyncSource)
+class SyncSourceAdmin(admin.ModelAdmin):
+    list_display = ('name', 'provider', 'account', 'user', 'watermark', 'last_synced_at')
+    list_select_related = ('account', 'user')
+    autocomplete_fields = ('user', 'account')
+
+
+@admin.register(CategoryRule)
+class CategoryRuleAdmin(admin.ModelAdmin):
+    list_display = (
+        'pattern', 'match_type', 'priority', 'transaction_type', 'expense_category', 'income_category', 'is_active', 'user',
+    )
+    list_select_related = ('user',)
+    list_filter = ('match_type', 'is_active')
+    search_fields = ('pattern',)
+    autocomplete_fields = ('user', 'account')
+
+
+@admin.register(TaxReport)
+class TaxReportAdmin(admin.ModelAdmin):
+    list_display = ('year', 'user', 'status', 'is_stale', 'requested_at', 'generated_at')
+    list_select_related = ('user',)
+    list_filter = ('status', 'is_stale')
+    autocomplete_fields = ('user',)
+    readonly_fields = ('data',)
+
+
+@admin.register(ShardAssignment)
+class ShardAssignmentAdmin(admin.ModelAdmin):
+    """
+    Read only: assignments are changed by the move_user_shard command, which moves the user's data with them.
+    """
+    list_display = ('user', 'database', 'assigned_at')
+    list_select_related = ('user',)
+    list_filter = ('database',)
+    readonly_fields = ('user', 'database', 'assigned_at')
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(ApiToken)
+class ApiTokenAdmin(admin.ModelAdmin):
+    """
+    Tokens are created by the create_api_token command, which shows the token once; delete one here to revoke it.
+    """
+    list_display = ('name', 'user', 'created_at')
+    list_select_related = ('user',)
+    search_fields = ('name', 'user__username')
+    readonly_fields = ('user', 'name', 'key_hash', 'created_at')
+
+    def has_add_permission(self, request):
+        return False
+
+
+admin.site.register(User, UserAdmin)
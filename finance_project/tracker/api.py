@@ -0,0 +1,144 @@
+import base64
+import hashlib
+import heapq
+import itertools
+import json
+import secrets
+from datetime import datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+from tracker.exporters import EXPORT_COLUMNS
+from tracker.models import ApiToken
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 5000
+
+# Output field -> queryset lookup, read with .values_list() so no model instances are built
+API_FIELDS = {'id': 'pk', **EXPORT_COLUMNS}
+
+
+def hash_token(key):
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def create_api_token(user, name):
+    """
+    Creates a token for the user and returns it; only its hash is stored.
+    """
+    key = secrets.token_urlsafe(32)
+    ApiToken.objects.create(user=user, name=name, key_hash=hash_token(key))
+    return key
+
+
+def authenticate_token(key):
+    """
+    Returns the active user a token belongs to, or None.
+    """
+    token = ApiToken.objects.select_related('user').filter(key_hash=hash_token(key)).first()
+    if token is None or not token.user.is_active:
+        return None
+    return token.user
+
+
+def parse_fields(value):
+    """
+    Returns the requested output fields in order, or every field when none are given.
+    """
+    if not value:
+        return list(API_FIELDS)
+
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in API_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return list(dict.fromkeys(fields))
+
+
+def parse_limit(value):
+    if not value:
+        return DEFAULT_PAGE_SIZE
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError(f"Invalid limit: {value}")
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    return limit
+
+
+def encode_cursor(date, pk):
+    return base64.urlsafe_b64encode(f'{date.isoformat()}|{pk}'.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Returns the (date, id) position encoded in a cursor.
+    """
+    try:
+        date, pk = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode().split('|')
+        return datetime.fromisoformat(date), int(pk)
+    except ValueError:
+        raise ValueError("Invalid cursor")
+
+
+def apply_cursor(queryset, cursor):
+    """
+    Orders the queryset newest first and, given a cursor, keeps only the rows after it.
+
+    Rows are positioned by (date, id), so pages stay stable while transactions
+    are added and each page is an index range scan rather than an OFFSET.
+    """
+    queryset = queryset.order_by('-date', '-pk')
+    if cursor:
+        date, pk = decode_cursor(cursor)
+        queryset = queryset.filter(Q(date__lt=date) | Q(date=date, pk__lt=pk))
+    return queryset
+
+
+def get_cursor_page(querysets, cursor, limit):
+    """
+    Returns up to `limit` transactions after the cursor and the cursor of the next
+    batch, or None on the last one.
+
+    Each queryset is read from the same cursor and the rows are merged by
+    (date, id), so hot transactions dated before the archive cutoff, such as
+    tax rows or rows created after archiving, are listed among the archived ones.
+    """
+    batches = [apply_cursor(queryset, cursor)[:limit + 1] for queryset in querysets]
+    rows = list(itertools.islice(heapq.merge(*batches, key=get_position, reverse=True), limit + 1))
+
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].date, rows[-1].pk)
+
+
+def get_position(transaction):
+    return transaction.date, transaction.pk
+
+
+def stream_page(queryset, fields, limit):
+    """
+    Yields one page of transactions as a JSON document, row by row.
+
+    The document is {"results": [...], "next": cursor or null}. One extra row is
+    read to tell whether there is a next page.
+    """
+    lookups = [API_FIELDS[field] for field in fields]
+    rows = queryset.values_list('date', 'pk', *lookups)[:limit + 1].iterator(chunk_size=min(limit + 1, 2000))
+
+    yield '{"results": ['
+    last = None
+    has_next = False
+    for count, row in enumerate(rows):
+        if count == limit:
+            has_next = True
+            break
+        prefix = ',' if count else ''
+        yield prefix + json.dumps(dict(zip(fields, row[2:])), cls=DjangoJSONEncoder)
+        last = row
+
+    next_cursor = encode_cursor(last[0], last[1]) if has_next else None
+    yield '], "next": ' + json.dumps(next_cursor) + '}'
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class TrackerConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "tracker"
+
+    def ready(self):
+        from django.core import checks
+        from tracker import signals  # noqa: F401
+        from tracker.sharding import check_shard_cache
+
+        checks.register(check_shard_cache)
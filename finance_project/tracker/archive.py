@@ -0,0 +1,185 @@
+import heapq
+import itertools
+
+from django.db.models import F, Sum
+
+from tracker.models import (
+    Account, Transaction, Income, Expense,
+    ArchivedTransaction, ArchivedIncome, ArchivedExpense, OpeningBalance, ArchiveCheckpoint,
+)
+from tracker.tracker_helpers import get_affected_account_ids, get_movement_totals, calculate_balance
+from tracker import sharding
+from tracker.pagination import schedule_count_invalidation
+from tracker.api import get_position
+
+ARCHIVE_BATCH_SIZE = 1000
+
+# Hot model -> archive model, in the order rows must be copied
+ARCHIVE_MODELS = (
+    (Transaction, ArchivedTransaction),
+    (Income, ArchivedIncome),
+    (Expense, ArchivedExpense),
+)
+
+
+def get_archived_transactions(user):
+    return ArchivedTransaction.objects.filter(user=user).select_related('expense_transaction', 'income_transaction')
+
+
+def copy_rows(model, archive_model, queryset):
+    """
+    Copies the rows of a hot table into its archive table, keeping their primary keys.
+    """
+    fields = [field.attname for field in model._meta.concrete_fields]
+    archive_model.objects.bulk_create(archive_model(**values) for values in queryset.values(*fields))
+
+
+@sharding.atomic
+def archive_batch(user, transaction_ids, cutoff):
+    """
+    Moves one batch of transactions to the archive tables.
+
+    The balance and income/expense totals the batch contributes are added to the
+    opening balances and the user's checkpoint first, so balances and totals
+    computed from the hot table do not change.
+    """
+    batch = Transaction.objects.filter(pk__in=transaction_ids)
+
+    # Step 1: Carry the batch's contribution over to each account's opening balance
+    account_ids = get_affected_account_ids(batch)
+    totals = get_movement_totals(account_ids, transactions=batch)
+    for account in Account.objects.filter(pk__in=account_ids):
+        opening_balance, _ = OpeningBalance.objects.get_or_create(account=account)
+        OpeningBalance.objects.filter(pk=opening_balance.pk).update(
+            balance=F('balance') + calculate_balance(account.account_type, totals[account.pk]),
+        )
+
+    # Step 2: Carry the income and expense totals over to the checkpoint
+    amounts = dict(batch.order_by().values('type').annotate(total=Sum('amount')).values_list('type', 'total'))
+    checkpoint, _ = ArchiveCheckpoint.objects.get_or_create(user=user, defaults={'cutoff': cutoff})
+    ArchiveCheckpoint.objects.filter(pk=checkpoint.pk).update(
+        income=F('income') + amounts.get('income', 0),
+        expenses=F('expenses') + amounts.get('expense', 0),
+    )
+
+    # Step 3: Copy the rows and remove them from the hot tables
+    for model, archive_model in ARCHIVE_MODELS:
+        rows = batch if model is Transaction else model.objects.filter(transaction__in=transaction_ids)
+        copy_rows(model, archive_model, rows)
+    batch.delete()
+    schedule_count_invalidation([user.pk])
+
+
+def archive_transactions(user, cutoff, batch_size=ARCHIVE_BATCH_SIZE):
+    """
+    Archives the user's transactions dated before the cutoff, one batch per database
+    transaction. Returns the number of transactions archived.
+    """
+    # Tax rows have no archive table, so their transactions stay in the hot table
+    candidates = Transaction.objects.filter(user=user, date__lt=cutoff, tax_transaction__isnull=True).order_by('pk')
+    archived = 0
+
+    while True:
+        transaction_ids = list(candidates.values_list('pk', flat=True)[:batch_size])
+        if not transaction_ids:
+            break
+        archive_batch(user, transaction_ids, cutoff)
+        archived += len(transaction_ids)
+
+    # The cutoff is recorded even when nothing was old enough to move
+    checkpoint, created = ArchiveCheckpoint.objects.get_or_create(user=user, defaults={'cutoff': cutoff})
+    if not created and checkpoint.cutoff < cutoff:
+        checkpoint.cutoff = cutoff
+        checkpoint.save(update_fields=['cutoff'])
+
+    return archived
+
+
+class CombinedResults:
+    """
+    Read-only sequence over several querysets one after the other, so the hot
+    and archived transactions can be paginated as a single list.
+
+    Hot transactions dated before the archive cutoff (tax rows, rows created
+    after archiving) are given as `backdated` and merged into the last queryset
+    by (date, id) instead of being listed before it.
+    """
+
+    def __init__(self, *querysets, backdated=None):
+        self.merged = backdated is not None
+        if self.merged:
+            querysets = (*querysets[:-1], backdated, querysets[-1])
+        self.querysets = querysets
+        self.counts = None
+
+    def count(self):
+        if self.counts is None:
+            self.counts = [queryset.count() for queryset in self.querysets]
+        return sum(self.counts)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+
+        start, stop = index.start or 0, index.stop if index.stop is not None else self.count()
+        self.count()
+        results = []
+        listed = len(self.querysets) - (2 if self.merged else 1)
+        for queryset, count in zip(self.querysets[:listed], self.counts):
+            if start < count and stop > 0:
+                results.extend(queryset[max(start, 0):min(stop, count)])
+            start -= count
+            stop -= count
+
+        # The last part is read past its count, which may be an estimate
+        if stop > 0 and self.merged:
+            results.extend(get_merged_slice(self.querysets[-1], self.querysets[-2], max(start, 0), stop))
+        elif stop > 0:
+            results.extend(self.querysets[-1][max(start, 0):stop])
+        return results
+
+
+def get_merged_slice(queryset, backdated, start, stop):
+    """
+    Returns rows start to stop of a queryset and a few backdated rows merged
+    newest first by (date, id).
+
+    Only the backdated rows are read from the start. At most len(backdated) of
+    them come before any row of the queryset, so its rows before
+    start - len(backdated) cannot reach the slice and are skipped.
+    """
+    extra = list(backdated.order_by('-date', '-pk')[:stop])
+    skipped = max(start - len(extra), 0)
+    rows = list(queryset.order_by('-date', '-pk')[skipped:stop])
+
+    position = 0
+    if skipped:
+        if not rows:
+            return []
+        # Backdated rows newer than the first row read are all before start
+        older = [row for row in extra if get_position(row) < get_position(rows[0])]
+        position = skipped + len(extra) - len(older)
+        extra = older
+        if position >= stop:
+            return []
+
+    merged = heapq.merge(rows, extra, key=get_position, reverse=True)
+    return list(itertools.islice(merged, start - position, stop - position))
+
+
+def combine_with_archive(user, transactions, archived_transactions):
+    """
+    Returns the user's hot and archived transactions as one CombinedResults,
+    newest first, with the hot ones dated before the archive cutoff merged into the archive.
+    """
+    cutoff = ArchiveCheckpoint.objects.filter(user=user).values_list('cutoff', flat=True).first()
+    if cutoff is None:
+        return CombinedResults(transactions, archived_transactions)
+    return CombinedResults(
+        transactions.filter(date__gte=cutoff),
+        archived_transactions,
+        backdated=transactions.filter(date__lt=cutoff),
+    )
@@ -0,0 +1,103 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+
+from tracker.models import Budget, CategorySpend, Expense, ArchivedExpense
+
+
+def get_spend_month(date):
+    """
+    Returns the first day of the month the expense date falls in, in the current timezone.
+    """
+    if hasattr(date, 'hour'):
+        date = timezone.localdate(date) if timezone.is_aware(date) else date.date()
+    return date.replace(day=1)
+
+
+def collect_expense_spend(expenses):
+    """
+    Sums the given Expense queryset per (user_id, category, month) in one grouped query.
+    """
+    spend = defaultdict(Decimal)
+    rows = (
+        expenses.order_by()
+        .annotate(month=TruncMonth('date'))
+        .values('transaction__user_id', 'category', 'month')
+        .annotate(total=Sum('amount'))
+        .values_list('transaction__user_id', 'category', 'month', 'total')
+    )
+    for user_id, category, month, total in rows:
+        spend[(user_id, category, get_spend_month(month))] += total
+    return spend
+
+
+def diff_spend(before, after):
+    """
+    Returns the per-key change between two spend snapshots.
+    """
+    return {key: after.get(key, 0) - before.get(key, 0) for key in set(before) | set(after)}
+
+
+def apply_spend_changes(changes, sign=1):
+    """
+    Applies the spend deltas with one atomic UPDATE ... SET amount = amount + delta per key.
+    """
+    for (user_id, category, month), delta in changes.items():
+        if not delta:
+            continue
+        spend, _ = CategorySpend.objects.get_or_create(user_id=user_id, category=category, month=month)
+        CategorySpend.objects.filter(pk=spend.pk).update(amount=F('amount') + sign * delta)
+
+
+def record_expense(expense, sign=1):
+    """
+    Adds (or with sign=-1 removes) a single expense to its spend counter.
+    """
+    apply_spend_changes(
+        {(expense.transaction.user_id, expense.category, get_spend_month(expense.date)): expense.amount},
+        sign=sign,
+    )
+
+
+def rebuild_spend(user=None):
+    """
+    Recomputes the spend counters from the Expense and ArchivedExpense tables, for one user or everyone.
+
+    Write paths keep the counters exact by passing their changes to
+    apply_spend_changes or record_expense in the same transaction. Raw ORM
+    writes to either table do not, and need a rebuild afterwards.
+    """
+    expenses = Expense.objects.all()
+    archived_expenses = ArchivedExpense.objects.all()
+    counters = CategorySpend.objects.all()
+    if user is not None:
+        expenses = expenses.filter(transaction__user=user)
+        archived_expenses = archived_expenses.filter(transaction__user=user)
+        counters = counters.filter(user=user)
+
+    spend = collect_expense_spend(expenses)
+    for key, amount in collect_expense_spend(archived_expenses).items():
+        spend[key] += amount
+
+    counters.delete()
+    CategorySpend.objects.bulk_create(
+        CategorySpend(user_id=user_id, category=category, month=month, amount=amount)
+        for (user_id, category, month), amount in spend.items()
+    )
+
+
+def get_budget_status(user, month=None):
+    """
+    Returns the user's budgets for the month, annotated with spent and remaining amounts.
+    """
+    month = get_spend_month(month or timezone.now())
+    spent = CategorySpend.objects.filter(user=user, month=month, category=OuterRef('category')).values('amount')[:1]
+
+    return (
+        Budget.objects.filter(user=user)
+        .annotate(spent=Coalesce(Subquery(spent), Value(Decimal(0)), output_field=DecimalField(max_digits=12, decimal_places=2)))
+        .annotate(remaining=F('amount') - F('spent'))
+    )
@@ -0,0 +1,350 @@
+import logging
+import re
+from collections import defaultdict
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+
+from tracker.models import CategoryRule, Income, Expense
+from tracker.budgets import apply_spend_changes, get_spend_month
+from tracker.tax_reports import get_report_year, mark_reports_stale
+from tracker.pagination import schedule_count_invalidation
+from tracker import sharding
+
+logger = logging.getLogger(__name__)
+
+RULE_BATCH_SIZE = 5000
+
+# Fields a rule can set, per transaction type
+RULE_FIELDS = {
+    'income': {'category': 'income_category'},
+    'expense': {'category': 'expense_category', 'source': 'source', 'fixed_or_variable': 'fixed_or_variable'},
+}
+
+# Import columns filled by rules, per transaction type; rule fields are named after them
+COLUMN_FIELDS = {
+    transaction_type: {rule_field: rule_field for rule_field in fields.values()}
+    for transaction_type, fields in RULE_FIELDS.items()
+}
+
+# Backreferences would point at the wrong group once rules are combined
+BACKREFERENCE = re.compile(r'\\[1-9]|\(\?P=|\\g<')
+
+
+def compile_pattern(pattern):
+    """
+    Compiles a regular expression rule the way RuleSet uses it, on its own and as
+    part of the combined filter, raising re.error when either fails.
+    """
+    compiled = re.compile(pattern, re.IGNORECASE)
+    re.compile(f'(?:{pattern})', re.IGNORECASE)
+    if compiled.groupindex or BACKREFERENCE.search(pattern):
+        raise re.error("named groups and backreferences are not supported")
+    return compiled
+
+
+def validate_pattern(match_type, pattern):
+    """
+    Raises ValidationError unless the pattern can be combined with other rules.
+    """
+    if match_type != 'regex':
+        return
+    try:
+        compile_pattern(pattern)
+    except re.error as e:
+        raise ValidationError({'pattern': f"Invalid regular expression: {e}"})
+
+
+def get_rule_order(rule):
+    return (rule.priority, rule.pk)
+
+
+def check_conditions(rule, amount, account_id):
+    if rule.min_amount is not None and (amount is None or amount < rule.min_amount):
+        return False
+    if rule.max_amount is not None and (amount is None or amount > rule.max_amount):
+        return False
+    if rule.account_id is not None and account_id != rule.account_id:
+        return False
+    return True
+
+
+def build_trie_pattern(words):
+    """
+    Returns a regular expression matching the longest of the words starting at a
+    position, with the words merged into a trie so each position costs one
+    character test rather than one test per word.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def to_pattern(node):
+        branches = [re.escape(char) + to_pattern(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        return f'(?:{body})?' if '' in node else body
+
+    return to_pattern(trie)
+
+
+class RuleSet:
+    """
+    The rules for one transaction type, compiled for matching many descriptions.
+
+    Substring rules are merged into a single trie-shaped regular expression run
+    on the lowercased description, which finds every rule text it contains in
+    one scan. Regular expression rules are combined into one expression used as
+    a filter: only descriptions it matches are tried against them one by one,
+    and only while they could still outrank the best substring rule. Scan
+    results are remembered per distinct description, as imports repeat them.
+    """
+
+    def __init__(self, rules):
+        # Step 1: Substring rules, by lowercased text
+        self.literal_rules = defaultdict(list)
+        for rule in rules:
+            if rule.match_type == 'contains' and rule.pattern:
+                self.literal_rules[rule.pattern.lower()].append(rule)
+        self.literals = None
+        if self.literal_rules:
+            self.literals = re.compile(f'(?=({build_trie_pattern(self.literal_rules)}))')
+
+        # Step 2: Regular expression rules, behind one combined filter. Rules saved
+        # without validation that do not compile are left out rather than failing the import
+        self.regex_rules = []
+        for rule in rules:
+            if rule.match_type != 'regex':
+                continue
+            try:
+                self.regex_rules.append((rule, compile_pattern(rule.pattern)))
+            except re.error as e:
+                logger.warning("Skipping category rule %s with an invalid pattern: %s", rule.pk, e)
+        self.any_regex = None
+        if self.regex_rules:
+            self.any_regex = re.compile('|'.join(f'(?:{rule.pattern})' for rule, _ in self.regex_rules), re.IGNORECASE)
+
+        self._scans = {}
+        self._prefix_rules = {}
+
+    def get_prefix_rules(self, text):
+        """
+        Returns the substring rules whose text is a prefix of the given rule text, in priority order.
+        """
+        rules = self._prefix_rules.get(text)
+        if rules is None:
+            rules = self._prefix_rules[text] = sorted(
+                (rule for end in range(1, len(text) + 1) for rule in self.literal_rules.get(text[:end], ())),
+                key=get_rule_order,
+            )
+        return rules
+
+    def scan(self, description):
+        """
+        Returns the substring rules found in the description, in priority order,
+        and whether any regular expression rule can match it.
+        """
+        result = self._scans.get(description)
+        if result is None:
+            literal_rules = []
+            if self.literals is not None:
+                # The trie matches the longest rule text at each position, and the shorter ones are its prefixes
+                found = {match.group(1) for match in self.literals.finditer(description.lower())}
+                if len(found) == 1:
+                    literal_rules = self.get_prefix_rules(found.pop())
+                elif found:
+                    literal_rules = sorted(
+                        {rule for text in found for rule in self.get_prefix_rules(text)}, key=get_rule_order,
+                    )
+            regex_possible = self.any_regex is not None and self.any_regex.search(description) is not None
+            result = self._scans[description] = (literal_rules, regex_possible)
+        return result
+
+    def match(self, description, amount=None, account_id=None):
+        literal_rules, regex_possible = self.scan(description)
+        best = None
+        for rule in literal_rules:
+            if check_conditions(rule, amount, account_id):
+                best = rule
+                break
+
+        if regex_possible:
+            for rule, regex in self.regex_rules:
+                if best is not None and get_rule_order(rule) > get_rule_order(best):
+                    break
+                if check_conditions(rule, amount, account_id) and regex.search(description):
+                    return rule
+        return best
+
+
+class RuleMatcher:
+    """
+    Finds the first matching rule of a user for incomes and expenses.
+    """
+
+    def __init__(self, rules):
+        rules = sorted(rules, key=get_rule_order)
+        self.rule_sets = {}
+        for transaction_type, fields in RULE_FIELDS.items():
+            applicable = [
+                rule for rule in rules
+                if rule.transaction_type in ('', transaction_type)
+                and any(getattr(rule, field) for field in fields.values())
+            ]
+            if applicable:
+                self.rule_sets[transaction_type] = RuleSet(applicable)
+
+    def __bool__(self):
+        return bool(self.rule_sets)
+
+    def match(self, transaction_type, description, amount=None, account_id=None):
+        rule_set = self.rule_sets.get(transaction_type)
+        return rule_set.match(description or '', amount, account_id) if rule_set else None
+
+    def categorize(self, transaction_type, description, amount, account_id, values, overwrite=False):
+        """
+        Returns the values (field -> value, using the Income/Expense field names)
+        with the first matching rule applied; only empty values are replaced
+        unless overwrite is set.
+        """
+        fields = RULE_FIELDS.get(transaction_type)
+        if not fields or (not overwrite and all(values.get(field) for field in fields)):
+            return values
+
+        rule = self.match(transaction_type, description, amount, account_id)
+        if rule is None:
+            return values
+
+        values = dict(values)
+        for field, rule_field in fields.items():
+            value = getattr(rule, rule_field)
+            if value and (overwrite or not values.get(field)):
+                values[field] = value
+        return values
+
+    def fill_columns(self, transaction_type, description, amount, account_id, current):
+        """
+        Returns the import columns (column -> value) that the first matching rule
+        sets among the empty ones in current.
+        """
+        column_fields = COLUMN_FIELDS.get(transaction_type)
+        if not column_fields or all(current.get(column) for column in column_fields):
+            return {}
+
+        rule = self.match(transaction_type, description, amount, account_id)
+        if rule is None:
+            return {}
+        return {
+            column: getattr(rule, rule_field)
+            for column, rule_field in column_fields.items()
+            if not current.get(column) and getattr(rule, rule_field)
+        }
+
+    def categorize_columns(self, columns, indexes=None):
+        """
+        Fills empty category columns of an import batch in place, for the given row indexes or all rows.
+        """
+        if not self:
+            return
+        if indexes is None:
+            indexes = range(len(columns['type']))
+
+        for index in indexes:
+            transaction_type = columns['type'][index]
+            if transaction_type not in COLUMN_FIELDS:
+                continue
+            account_column = 'destination_account' if transaction_type == 'income' else 'origin_account'
+            current = {column: columns[column][index] for column in COLUMN_FIELDS[transaction_type]}
+            filled = self.fill_columns(
+                transaction_type, columns['description'][index], columns['amount'][index], columns[account_column][index],
+                current,
+            )
+            for column, value in filled.items():
+                columns[column][index] = value
+
+    def categorize_record(self, record):
+        """
+        Fills empty category columns of one import row, a dict keyed by column name, in place.
+        """
+        transaction_type = record.get('type')
+        if not self or transaction_type not in COLUMN_FIELDS:
+            return
+        account_column = 'destination_account' if transaction_type == 'income' else 'origin_account'
+        record.update(self.fill_columns(
+            transaction_type, record.get('description'), record.get('amount'), record.get(account_column), record,
+        ))
+
+
+def get_rule_matcher(user):
+    """
+    Returns a RuleMatcher with the user's active rules, compiled once per import.
+    """
+    return RuleMatcher(CategoryRule.objects.filter(user=user, is_active=True))
+
+
+def iter_rows(queryset, fields, batch_size):
+    batch = []
+    for row in queryset.order_by('pk').values_list('pk', *fields).iterator(chunk_size=batch_size):
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def apply_rules_to_batch(model, transaction_type, matcher, rows, value_fields, overwrite):
+    """
+    Recategorises one batch of Income or Expense rows, with one UPDATE per distinct
+    outcome, and returns the number of rows changed and the budget spend changes.
+    """
+    updates = defaultdict(list)
+    spend_changes = defaultdict(Decimal)
+    report_years = set()
+    for pk, user_id, description, amount, account_id, date, *current in rows:
+        values = dict(zip(value_fields, current))
+        new_values = matcher.categorize(transaction_type, description, amount, account_id, values, overwrite=overwrite)
+        if new_values == values:
+            continue
+        updates[tuple(new_values[field] for field in value_fields)].append(pk)
+        report_years.add((user_id, get_report_year(date)))
+        if model is Expense and new_values['category'] != values['category']:
+            month = get_spend_month(date)
+            spend_changes[(user_id, values['category'], month)] -= amount
+            spend_changes[(user_id, new_values['category'], month)] += amount
+
+    for new_values, pks in updates.items():
+        model.objects.filter(pk__in=pks).update(**dict(zip(value_fields, new_values)))
+    mark_reports_stale(report_years)
+    schedule_count_invalidation(user_id for user_id, _ in report_years)
+    return sum(len(pks) for pks in updates.values()), spend_changes
+
+
+def apply_category_rules(user, overwrite=False, batch_size=RULE_BATCH_SIZE):
+    """
+    Re-applies the user's rules to their existing incomes and expenses.
+
+    Rows are read in primary key order in batches of plain tuples, and each batch
+    is written in its own transaction together with its budget spend changes.
+    Only empty values are filled unless overwrite is set. Returns the number of
+    rows changed per transaction type.
+    """
+    matcher = get_rule_matcher(user)
+    changed = {'income': 0, 'expense': 0}
+    if not matcher:
+        return changed
+
+    for model, transaction_type in ((Income, 'income'), (Expense, 'expense')):
+        value_fields = list(RULE_FIELDS[transaction_type])
+        rows = model.objects.filter(transaction__user=user)
+        fields = ('transaction__user_id', 'transaction__description', 'amount', 'account_id', 'date', *value_fields)
+        for batch in iter_rows(rows, fields, batch_size):
+            with sharding.atomic():
+                count, spend_changes = apply_rules_to_batch(model, transaction_type, matcher, batch, value_fields, overwrite)
+                apply_spend_changes(spend_changes)
+            changed[transaction_type] += count
+    return changed
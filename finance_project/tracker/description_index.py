@@ -0,0 +1,214 @@
+import heapq
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db.models import Count, Max
+
+from tracker.models import Transaction, ArchivedTransaction
+from tracker.duplicates import get_day
+from tracker import sharding
+
+DESCRIPTION_INDEX_TIMEOUT = 60 * 60
+
+MAX_SUGGESTIONS = 8
+
+# Suggestions are remembered for prefixes up to this length, whose ranges can span most of the index
+SHORT_PREFIX_LENGTH = 3
+
+# Sorts after any character a description can contain, to find the end of a prefix range
+PREFIX_END = '\U0010ffff'
+
+# In-process copy of each user's index, keyed by user id: (version, index)
+_local_indexes = {}
+
+
+class DescriptionIndex:
+    """
+    A user's distinct transaction descriptions, sorted case-insensitively so the
+    descriptions starting with a prefix are one contiguous range found by bisection.
+    Each description keeps [times used, day last used] to rank suggestions.
+
+    A published index is shared by the threads of a process and only read; updates
+    are made on a copy (see flush_description_updates).
+    """
+
+    def __init__(self, stats, keys=None):
+        self.stats = stats
+        self.keys = keys if keys is not None else sorted((description.lower(), description) for description in stats)
+        self.short_prefixes = {}
+
+    def copy(self):
+        index = DescriptionIndex({description: list(entry) for description, entry in self.stats.items()}, list(self.keys))
+        index.short_prefixes.update(self.short_prefixes)
+        return index
+
+    def add(self, description, day):
+        if not description:
+            return
+        key = description.lower()
+        for length in range(1, SHORT_PREFIX_LENGTH + 1):
+            self.short_prefixes.pop(key[:length], None)
+
+        entry = self.stats.get(description)
+        if entry is None:
+            self.stats[description] = [1, day]
+            insort(self.keys, (key, description))
+        else:
+            entry[0] += 1
+            entry[1] = max(entry[1], day)
+
+    def suggest(self, prefix, limit=MAX_SUGGESTIONS):
+        """
+        Returns up to `limit` descriptions starting with the prefix, most used first,
+        then most recently used.
+        """
+        prefix = prefix.lower()
+        if not prefix:
+            return []
+        short = len(prefix) <= SHORT_PREFIX_LENGTH and limit == MAX_SUGGESTIONS
+        if short and prefix in self.short_prefixes:
+            return self.short_prefixes[prefix]
+
+        start = bisect_left(self.keys, (prefix,))
+        end = bisect_left(self.keys, (prefix + PREFIX_END,), start)
+        suggestions = heapq.nlargest(limit, (description for _, description in self.keys[start:end]), key=self.stats.get)
+        if short:
+            self.short_prefixes[prefix] = suggestions
+        return suggestions
+
+
+def _version_key(user_id):
+    return f'tracker:description-index-version:{user_id}'
+
+
+def _index_key(user_id, version):
+    return f'tracker:description-index:{user_id}:{version}'
+
+
+def get_index_version(user_id):
+    """
+    Returns the current index version for the user, initialising it if missing.
+    """
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        cache.add(_version_key(user_id), 1, timeout=None)
+        version = cache.get(_version_key(user_id), 1)
+    return version
+
+
+def bump_index_version(user_id):
+    try:
+        return cache.incr(_version_key(user_id))
+    except ValueError:
+        # The version key was evicted or never set
+        version = get_index_version(user_id) + 1
+        cache.set(_version_key(user_id), version, timeout=None)
+        return version
+
+
+def build_description_index(user_id):
+    """
+    Builds the index with one grouped query per table, archived transactions included.
+    """
+    stats = {}
+    for model in (Transaction, ArchivedTransaction):
+        rows = (
+            model.objects.filter(user_id=user_id)
+            .exclude(description='')
+            .order_by()
+            .values('description')
+            .annotate(count=Count('pk'), last=Max('date'))
+            .values_list('description', 'count', 'last')
+        )
+        for description, count, last in rows:
+            entry = stats.setdefault(description, [0, 0])
+            entry[0] += count
+            entry[1] = max(entry[1], get_day(last))
+    return DescriptionIndex(stats)
+
+
+def load_description_index(user_id):
+    """
+    Returns (index, built), where built tells whether the index was just read from the database.
+
+    Like the account directory, the index is served from an in-process copy when
+    its version matches the one in Django's cache, then from Django's cache, and
+    only built from the database when both are stale.
+    """
+    version = get_index_version(user_id)
+
+    # Step 1: In-process copy
+    local = _local_indexes.get(user_id)
+    if local and local[0] == version:
+        return local[1], False
+
+    # Step 2: Shared cache
+    index = cache.get(_index_key(user_id, version))
+    built = index is None
+
+    # Step 3: Database
+    if built:
+        index = build_description_index(user_id)
+        cache.set(_index_key(user_id, version), index, timeout=DESCRIPTION_INDEX_TIMEOUT)
+
+    _local_indexes[user_id] = (version, index)
+    return index, built
+
+
+def get_description_suggestions(user, prefix, limit=MAX_SUGGESTIONS):
+    user_id = user.pk if hasattr(user, 'pk') else user
+    index, _ = load_description_index(user_id)
+    return index.suggest(prefix, limit)
+
+
+def schedule_description_update(user_id, entries):
+    """
+    Queues (description, date) pairs of new transactions to be added to the user's
+    index once the outermost atomic block commits, or right away outside of one.
+    """
+    entries = [(description, date) for description, date in entries if description]
+    if not entries:
+        return
+
+    pending = sharding.get_commit_batch('description-updates', lambda: defaultdict(list), flush_description_updates)
+    if pending is None:
+        flush_description_updates({user_id: entries})
+    else:
+        pending[user_id].extend(entries)
+
+
+def flush_description_updates(pending):
+    """
+    Adds the pending descriptions to each user's index and publishes it under a new version.
+
+    The index is updated on a copy that then replaces the in-process one, so
+    threads reading the published index never see it change. An index that had
+    to be built from the database already contains the committed rows, so the
+    pending entries are not added to it again. Two processes publishing at the
+    same time can lose each other's additions until the index expires and is rebuilt.
+    """
+    for user_id, entries in pending.items():
+        index, built = load_description_index(user_id)
+        if built:
+            continue
+        index = index.copy()
+        for description, date in entries:
+            index.add(description, get_day(date))
+
+        version = bump_index_version(user_id)
+        cache.set(_index_key(user_id, version), index, timeout=DESCRIPTION_INDEX_TIMEOUT)
+        _local_indexes[user_id] = (version, index)
+
+
+def invalidate_description_index(user_id):
+    """
+    Bumps the user's index version so every process rebuilds it on next access,
+    used after edits and deletes, which the index cannot take back.
+    """
+    bump_index_version(user_id)
+    _local_indexes.pop(user_id, None)
+
+
+def schedule_description_invalidation(user_id):
+    sharding.on_commit(lambda: invalidate_description_index(user_id))
@@ -0,0 +1,155 @@
+import re
+from collections import defaultdict, deque
+from datetime import timedelta
+from difflib import SequenceMatcher
+from typing import NamedTuple
+
+from django.utils import timezone
+
+from tracker.models import Transaction
+
+# Transactions this many days apart or less can be the same bank movement
+DUPLICATE_DATE_WINDOW = 1
+
+# Minimum description similarity, between 0 and 1, for two transactions to be flagged
+SIMILARITY_THRESHOLD = 0.8
+
+# Blocks that saw no transaction within the window are dropped every this many rows
+PRUNE_INTERVAL = 10000
+
+NON_WORD = re.compile(r'[\W_]+')
+
+BLOCK_FIELDS = ('type', 'origin_account_id', 'destination_account_id', 'amount')
+
+
+class DuplicatePair(NamedTuple):
+    first_id: int
+    second_id: int
+    similarity: float
+
+
+def normalize_description(description):
+    """
+    Lowercases the description and collapses punctuation and whitespace, which
+    bank exports tend to vary between downloads.
+    """
+    return NON_WORD.sub(' ', (description or '').lower()).strip()
+
+
+def get_similarity(first, second, threshold=SIMILARITY_THRESHOLD):
+    """
+    Returns the similarity ratio of two normalised descriptions, or 0 as soon as
+    the cheap upper bounds show it is below the threshold.
+    """
+    if first == second:
+        return 1.0
+    matcher = SequenceMatcher(None, first, second, autojunk=False)
+    if matcher.real_quick_ratio() < threshold or matcher.quick_ratio() < threshold:
+        return 0.0
+    return matcher.ratio()
+
+
+def get_day(date):
+    """
+    Returns the day number of a transaction date in the current timezone.
+    """
+    if timezone.is_aware(date):
+        date = timezone.localtime(date)
+    return date.toordinal()
+
+
+def find_duplicates(transactions, window=DUPLICATE_DATE_WINDOW, threshold=SIMILARITY_THRESHOLD):
+    """
+    Returns the pairs of transactions that look like the same bank movement.
+
+    Transactions are only compared within a block: same type, accounts and amount,
+    and dates at most `window` days apart. They are streamed in date order and each
+    block only keeps the transactions still inside the window, so the work grows
+    with the number of transactions rather than the number of pairs, and memory
+    with the size of the window.
+    """
+    rows = (
+        transactions.order_by('date', 'pk')
+        .values_list('pk', 'date', 'description', *BLOCK_FIELDS)
+        .iterator(chunk_size=PRUNE_INTERVAL)
+    )
+    blocks = defaultdict(deque)
+    pairs = []
+
+    for count, (pk, date, description, *key) in enumerate(rows, 1):
+        day = get_day(date)
+        block = blocks[tuple(key)]
+        while block and block[0][0] < day - window:
+            block.popleft()
+
+        description = normalize_description(description)
+        for other_day, other_pk, other_description in block:
+            similarity = get_similarity(other_description, description, threshold)
+            if similarity >= threshold:
+                pairs.append(DuplicatePair(other_pk, pk, similarity))
+        block.append((day, pk, description))
+
+        if count % PRUNE_INTERVAL == 0:
+            for block_key in [block_key for block_key, block in blocks.items() if block[-1][0] < day - window]:
+                del blocks[block_key]
+
+    return pairs
+
+
+def find_user_duplicates(user, **kwargs):
+    return find_duplicates(Transaction.objects.filter(user=user), **kwargs)
+
+
+def find_stored_duplicates(user, columns, indexes, window=DUPLICATE_DATE_WINDOW, threshold=SIMILARITY_THRESHOLD):
+    """
+    Returns the indexes, among the given rows of an import batch, of the rows that
+    look like a transaction already stored for the user.
+
+    Stored transactions are read once for the batch, restricted to its dates and
+    amounts, and grouped into the same blocks as in find_duplicates.
+    """
+    indexes = list(indexes)
+    if not indexes:
+        return set()
+
+    dates = [columns['date'][index] for index in indexes]
+    stored = Transaction.objects.filter(
+        user=user,
+        date__range=(min(dates) - timedelta(days=window + 1), max(dates) + timedelta(days=window + 1)),
+        amount__in={columns['amount'][index] for index in indexes},
+    )
+    blocks = defaultdict(list)
+    for date, description, *key in stored.values_list('date', 'description', *BLOCK_FIELDS).iterator():
+        blocks[tuple(key)].append((get_day(date), normalize_description(description)))
+
+    duplicates = set()
+    for index in indexes:
+        key = (
+            columns['type'][index],
+            columns['origin_account'][index],
+            columns['destination_account'][index],
+            columns['amount'][index],
+        )
+        day = get_day(columns['date'][index])
+        description = normalize_description(columns['description'][index])
+        if any(
+            abs(day - other_day) <= window and get_similarity(other_description, description, threshold) >= threshold
+            for other_day, other_description in blocks.get(key, ())
+        ):
+            duplicates.add(index)
+    return duplicates
+
+
+def is_stored_duplicate(user, date, transaction_type, description, amount, origin_account_id, destination_account_id):
+    """
+    Single-row form of find_stored_duplicates, for the row by row CSV import.
+    """
+    columns = {
+        'date': [date],
+        'type': [transaction_type],
+        'description': [description],
+        'amount': [amount],
+        'origin_account': [origin_account_id],
+        'destination_account': [destination_account_id],
+    }
+    return bool(find_stored_duplicates(user, columns, [0]))
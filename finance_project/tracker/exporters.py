@@ -0,0 +1,258 @@
+import csv
+import functools
+import importlib.util
+import io
+import itertools
+import json
+import tempfile
+import zlib
+
+from tracker.models import Transaction
+
+EXPORT_BATCH_SIZE = 5000
+
+# Output column -> queryset lookup, read with .values() so no model instances are built
+EXPORT_COLUMNS = {
+    'date': 'date',
+    'type': 'type',
+    'description': 'description',
+    'amount': 'amount',
+    'income_category': 'income_transaction__category',
+    'expense_category': 'expense_transaction__category',
+    'source': 'expense_transaction__source',
+    'fixed_or_variable': 'expense_transaction__fixed_or_variable',
+    'origin_account': 'origin_account__name',
+    'destination_account': 'destination_account__name',
+}
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'transactions.csv'),
+    'ndjson': ('application/x-ndjson', 'transactions.ndjson'),
+    'parquet': ('application/vnd.apache.parquet', 'transactions.parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'transactions.arrows'),
+}
+
+
+def iter_export_batches(*querysets, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Yields the querysets, one after the other, as lists of rows keyed by export column,
+    batch_size rows at a time.
+    """
+    rows = itertools.chain.from_iterable(
+        queryset.order_by('date', 'pk').values_list(*EXPORT_COLUMNS.values()).iterator(chunk_size=batch_size)
+        for queryset in querysets
+    )
+
+    batch = []
+    for row in rows:
+        batch.append(dict(zip(EXPORT_COLUMNS, row)))
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# Encoding -> (file extension, content type when sent as a compressed file)
+COMPRESSIONS = {
+    'gzip': ('gz', 'application/gzip'),
+    'zstd': ('zst', 'application/zstd'),
+}
+
+
+def stream_csv(*querysets):
+    """
+    Yields the transactions as CSV through TransactionExportResource, one batch of rows at a time.
+    """
+    from tracker.resources import TransactionExportResource
+
+    resource = TransactionExportResource()
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(resource.get_export_headers())
+
+    transactions = itertools.chain.from_iterable(resource.iter_queryset(queryset) for queryset in querysets)
+    for count, transaction in enumerate(transactions, start=1):
+        writer.writerow(resource.export_resource(transaction))
+        if count % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue().encode()
+
+
+@functools.cache
+def get_available_compressions():
+    # zstd is optional and only offered when the zstandard package is installed
+    has_zstandard = importlib.util.find_spec('zstandard') is not None
+    return [encoding for encoding in COMPRESSIONS if encoding != 'zstd' or has_zstandard]
+
+
+class EncodingNotAcceptable(Exception):
+    """
+    Raised when the client refuses every encoding the export could be sent in, identity included.
+    """
+
+
+def parse_accept_encoding(header):
+    """
+    Returns the encodings of an Accept-Encoding header with their quality values.
+    Refusals (q=0) are kept, so an explicit "zstd;q=0" wins over "*".
+    """
+    accepted = {}
+    for value in header.split(','):
+        encoding, *params = [part.strip() for part in value.split(';')]
+        quality = 1.0
+        for param in params:
+            name, _, number = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(number)
+                except ValueError:
+                    quality = 0.0
+        if encoding:
+            accepted[encoding.lower()] = quality
+    return accepted
+
+
+def get_encoding_quality(accepted, encoding):
+    """
+    Returns the quality the client gives an encoding: its own entry, else the
+    wildcard's, else 0, except for identity, which is acceptable unless refused.
+    """
+    if encoding in accepted:
+        return accepted[encoding]
+    if '*' in accepted:
+        return accepted['*']
+    return 1.0 if encoding == 'identity' else 0.0
+
+
+def negotiate_compression(request):
+    """
+    Picks the export compression for the request.
+
+    Returns (encoding, as_file): an explicit ?compress= parameter sends a
+    compressed file, while Accept-Encoding negotiation compresses the transfer
+    only, preferring the client's highest quality value and then zstd. Raises
+    ValueError for a ?compress= value that is not available, and
+    EncodingNotAcceptable when the client refuses every compression and identity.
+    """
+    requested = request.GET.get('compress')
+    if requested:
+        if requested not in get_available_compressions():
+            raise ValueError(
+                f"Unsupported compression: {requested}. Available: {', '.join(get_available_compressions())}"
+            )
+        return requested, True
+
+    accepted = parse_accept_encoding(request.headers.get('Accept-Encoding', ''))
+    candidates = [
+        encoding for encoding in ('zstd', 'gzip')
+        if encoding in get_available_compressions() and get_encoding_quality(accepted, encoding) > 0
+    ]
+    if candidates:
+        return max(candidates, key=lambda encoding: get_encoding_quality(accepted, encoding)), False
+    if get_encoding_quality(accepted, 'identity') <= 0:
+        raise EncodingNotAcceptable("None of the accepted encodings is available")
+    return None, False
+
+
+def compress_stream(chunks, encoding):
+    """
+    Compresses the chunks as they are produced, without buffering the whole output.
+    """
+    if encoding == 'zstd':
+        import zstandard
+
+        compressor = zstandard.ZstdCompressor().compressobj()
+    else:
+        # wbits=31 writes a gzip header and trailer
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def stream_ndjson(*querysets):
+    """
+    Yields the transactions as JSON Lines, one encoded batch at a time.
+    """
+    for batch in iter_export_batches(*querysets):
+        lines = []
+        for row in batch:
+            row['date'] = row['date'].isoformat()
+            # Amounts have at most 10 digits, so they round-trip exactly as JSON numbers
+            row['amount'] = float(row['amount'])
+            lines.append(json.dumps(row, ensure_ascii=False))
+        yield ('\n'.join(lines) + '\n').encode()
+
+
+def get_arrow_schema():
+    import pyarrow as pa
+
+    categorical = pa.dictionary(pa.int16(), pa.string())
+    return pa.schema([
+        ('date', pa.timestamp('us', tz='UTC')),
+        ('type', categorical),
+        ('description', pa.string()),
+        ('amount', pa.decimal128(Transaction._meta.get_field('amount').max_digits, 2)),
+        ('income_category', categorical),
+        ('expense_category', categorical),
+        ('source', categorical),
+        ('fixed_or_variable', categorical),
+        ('origin_account', categorical),
+        ('destination_account', categorical),
+    ])
+
+
+def iter_record_batches(*querysets):
+    """
+    Yields the transactions as typed Arrow record batches.
+    """
+    import pyarrow as pa
+
+    schema = get_arrow_schema()
+    for batch in iter_export_batches(*querysets):
+        columns = [
+            pa.array([row[field.name] for row in batch], type=field.type)
+            for field in schema
+        ]
+        yield pa.RecordBatch.from_arrays(columns, schema=schema)
+
+
+def stream_arrow(*querysets):
+    """
+    Yields the transactions in the Arrow IPC streaming format, flushing after every batch.
+    """
+    import pyarrow as pa
+
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, get_arrow_schema()) as writer:
+        for record_batch in iter_record_batches(*querysets):
+            writer.write_batch(record_batch)
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+    yield sink.getvalue()
+
+
+def write_parquet(*querysets):
+    """
+    Writes the transactions to a Parquet file and returns it rewound.
+
+    Parquet keeps its metadata in a footer, so the file is spooled to disk
+    batch by batch rather than streamed.
+    """
+    import pyarrow.parquet as pq
+
+    output = tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024)
+    with pq.ParquetWriter(output, get_arrow_schema(), compression='zstd') as writer:
+        for record_batch in iter_record_batches(*querysets):
+            writer.write_batch(record_batch)
+
+    output.seek(0)
+    return output
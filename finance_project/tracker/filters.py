@@ -38,6 +38,20 @@ class TransactionFilter(django_filters.FilterSet):
         widget=forms.CheckboxSelectMultiple()
     )
 
+    # Archived transactions live in their own table, so this flag is read by the
+    # views to add them to the results instead of filtering the queryset
+    include_archive = django_filters.BooleanFilter(
+        method='filter_include_archive',
+        label="Include archive",
+        widget=forms.CheckboxInput(),
+    )
+
     class Meta:
         model = Transaction
-        fields = ("transaction_type", "start_date", "end_date", "expense_category", "income_category")
+        fields = ("transaction_type", "start_date", "end_date", "expense_category", "income_category", "include_archive")
+
+    def filter_include_archive(self, queryset, name, value):
+        return queryset
+
+    def includes_archive(self):
+        return self.is_bound and self.form.is_valid() and bool(self.form.cleaned_data.get('include_archive'))
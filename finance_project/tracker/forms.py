@@ -1,7 +1,9 @@
 from django import forms
 
-from tracker.models import Transaction, Expense, Income
-from tracker.tracker_helpers import adjust_account_balances
+from tracker.models import Transaction, Expense, Income, Account
+from tracker.ledger import schedule_transaction_update
+from tracker.account_directory import get_account_choices
+from tracker.budgets import record_expense
 
 
 class TransactionForm(forms.ModelForm):
@@ -33,12 +35,29 @@ class TransactionForm(forms.ModelForm):
         required=False
     )
 
+    def __init__(self, *args, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # Restrict account choices to the user's accounts, served from the account directory
+        if user is not None:
+            account_choices = get_account_choices(user)
+            for field_name in ('origin_account', 'destination_account'):
+                self.fields[field_name].queryset = Account.objects.filter(user=user)
+                self.fields[field_name].choices = account_choices
+
     def clean_amount(self):
         amount = self.cleaned_data['amount']
         if amount <= 0:
             raise forms.ValidationError("Amount must be a positive number")
         return amount
 
+    def clean(self):
+        cleaned_data = super().clean()
+        field = Transaction.REQUIRED_ACCOUNTS.get(cleaned_data.get('type'))
+        if field and not cleaned_data.get(field):
+            self.add_error(field, f"{cleaned_data['type'].capitalize()} transactions need this account")
+        return cleaned_data
+
     class Meta:
         model = Transaction
         fields = (
@@ -71,6 +90,7 @@ class TransactionForm(forms.ModelForm):
             )
             if commit:
                 expense.save()
+                record_expense(expense)
 
         elif transaction.type == 'income':
             income = Income(
@@ -83,7 +103,63 @@ class TransactionForm(forms.ModelForm):
             if commit:
                 income.save()
 
-        # Adjust the account balance after saving the transaction
-        adjust_account_balances(transaction)
+        # Update the account balances once the saved transaction commits
+        if commit:
+            schedule_transaction_update(transaction)
 
         return transaction
+
+
+class TransactionBulkUpdateForm(forms.Form):
+    expense_category = forms.ChoiceField(
+        choices=[('', 'Keep current')] + list(Expense.EXPENSE_CATEGORIES),
+        label="Expense Category",
+        required=False
+    )
+
+    expense_source = forms.ChoiceField(
+        choices=[('', 'Keep current')] + list(Expense.SOURCES),
+        label="Expense Source",
+        required=False
+    )
+
+    expense_type = forms.ChoiceField(
+        choices=[('', 'Keep current')] + list(Expense.TYPES),
+        label="Expense Type",
+        required=False
+    )
+
+    income_category = forms.ChoiceField(
+        choices=[('', 'Keep current')] + list(Income.INCOME_CATEGORIES),
+        label="Income Category",
+        required=False
+    )
+
+    origin_account = forms.ModelChoiceField(
+        queryset=Account.objects.none(),
+        empty_label='Keep current',
+        label="Origin Account",
+        required=False
+    )
+
+    destination_account = forms.ModelChoiceField(
+        queryset=Account.objects.none(),
+        empty_label='Keep current',
+        label="Destination Account",
+        required=False
+    )
+
+    def __init__(self, *args, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        if user is not None:
+            account_choices = [('', 'Keep current')] + get_account_choices(user)[1:]
+            for field_name in ('origin_account', 'destination_account'):
+                self.fields[field_name].queryset = Account.objects.filter(user=user)
+                self.fields[field_name].choices = account_choices
+
+    def get_changes(self):
+        """
+        Returns only the fields that were given a new value.
+        """
+        return {name: value for name, value in self.cleaned_data.items() if value not in (None, '')}
@@ -0,0 +1,433 @@
+import json
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.utils import timezone
+
+from tracker.models import Transaction, Income, Expense, ArchivedTransaction, ArchiveCheckpoint, IngestionBatch
+from tracker.account_directory import get_account_directory
+from tracker.ledger import schedule_balance_update
+from tracker.pagination import schedule_count_invalidation
+from tracker.metrics import instrument
+from tracker.budgets import apply_spend_changes, get_spend_month
+from tracker.categorization import get_rule_matcher
+from tracker.duplicates import find_stored_duplicates
+from tracker.description_index import schedule_description_update
+from tracker.tax_reports import get_report_year, mark_reports_stale
+from tracker import sharding
+
+IMPORT_BATCH_SIZE = 5000
+
+ARROW_EXTENSIONS = ('.parquet', '.arrow', '.arrows', '.feather')
+
+MAX_INGEST_ROWS = 50000
+
+OPTIONAL_COLUMNS = (
+    'income_category',
+    'expense_category',
+    'source',
+    'fixed_or_variable',
+    'origin_account',
+    'destination_account',
+)
+
+# Optional columns restricted to the same choices as in TransactionForm
+CHOICE_COLUMNS = {
+    'income_category': dict(Income.INCOME_CATEGORIES),
+    'expense_category': dict(Expense.EXPENSE_CATEGORIES),
+    'source': dict(Expense.SOURCES),
+    'fixed_or_variable': dict(Expense.TYPES),
+}
+
+
+def iter_record_batches(file, filename):
+    """
+    Yields record batches from an uploaded Parquet or Arrow IPC (file or stream) upload.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if filename.endswith('.parquet'):
+        yield from pq.ParquetFile(file).iter_batches(batch_size=IMPORT_BATCH_SIZE)
+        return
+
+    try:
+        reader = pa.ipc.open_file(file)
+        for i in range(reader.num_record_batches):
+            yield reader.get_batch(i)
+    except pa.ArrowInvalid:
+        file.seek(0)
+        yield from pa.ipc.open_stream(file)
+
+
+def find_invalid_row(mask, offset):
+    """
+    Returns the file row number of the first false value in a boolean array.
+    """
+    import pyarrow.compute as pc
+
+    return offset + pc.index(mask, False).as_py() + 1
+
+
+def validate_batch(batch, offset, account_directory):
+    """
+    Validates and normalises one record batch column-wise.
+
+    Returns a dict of Python lists, one per column, ready to build model instances from.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    missing = {'date', 'type', 'description', 'amount'} - set(batch.schema.names)
+    if missing:
+        raise ValueError(f"Missing required columns: {', '.join(sorted(missing))}")
+
+    # Step 1: Parse and validate the date
+    dates = batch.column('date')
+    if pa.types.is_string(dates.type) or pa.types.is_large_string(dates.type):
+        try:
+            dates = pc.strptime(dates, format='%d-%m-%Y', unit='s')
+        except pa.ArrowInvalid as e:
+            raise ValueError(f"Error parsing dates: Expected format is dd-mm-yyyy. {e}") from e
+    elif pa.types.is_date(dates.type):
+        dates = dates.cast(pa.timestamp('s'))
+    elif not pa.types.is_timestamp(dates.type):
+        raise ValueError(f"Invalid date column type: {dates.type}")
+    if dates.null_count:
+        raise ValueError(f"Row {find_invalid_row(pc.is_valid(dates), offset)}: missing date")
+
+    # Step 2: Parse and validate the amount
+    try:
+        amounts = batch.column('amount').cast(pa.decimal128(10, 2))
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+        raise ValueError(f"Invalid amounts: {e}") from e
+    valid_amounts = pc.fill_null(pc.greater(amounts, 0), False)
+    if not pc.all(valid_amounts).as_py():
+        raise ValueError(f"Row {find_invalid_row(valid_amounts, offset)}: amount must be a positive number")
+
+    # Step 3: Validate the transaction type
+    types = batch.column('type').cast(pa.string())
+    valid_types = pc.fill_null(pc.is_in(types, value_set=pa.array(list(dict(Transaction.TRANSACTION_TYPES)))), False)
+    if not pc.all(valid_types).as_py():
+        row_number = find_invalid_row(valid_types, offset)
+        raise ValueError(f"Row {row_number}: invalid transaction type: {types[row_number - offset - 1].as_py()}")
+
+    columns = {
+        'date': dates.to_pylist(),
+        'type': types.to_pylist(),
+        'description': pc.fill_null(batch.column('description').cast(pa.string()), '').to_pylist(),
+        'amount': amounts.to_pylist(),
+    }
+    for name in OPTIONAL_COLUMNS:
+        if name in batch.schema.names:
+            columns[name] = pc.fill_null(batch.column(name).cast(pa.string()), '').to_pylist()
+        else:
+            columns[name] = [''] * batch.num_rows
+
+    for row_number, (transaction_type, origin, destination) in enumerate(
+        zip(columns['type'], columns['origin_account'], columns['destination_account']), start=offset + 1,
+    ):
+        try:
+            check_required_account(transaction_type, {'origin_account': origin, 'destination_account': destination})
+        except ValueError as e:
+            raise ValueError(f"Row {row_number}: {e}") from e
+
+    # Step 4: Resolve account names with one lookup per distinct name
+    for name in ('origin_account', 'destination_account'):
+        account_ids = {}
+        for account_name in set(columns[name]) - {''}:
+            account_ids[account_name] = account_directory.resolve(account_name).id
+        columns[name] = [account_ids.get(account_name) for account_name in columns[name]]
+
+    # Naive timestamps are interpreted in the current timezone, like the CSV import
+    current_timezone = timezone.get_current_timezone()
+    columns['date'] = [
+        date if timezone.is_aware(date) else timezone.make_aware(date, current_timezone)
+        for date in columns['date']
+    ]
+
+    return columns
+
+
+def check_required_account(transaction_type, accounts):
+    """
+    Raises ValueError when a row lacks the account its type needs (Transaction.REQUIRED_ACCOUNTS).
+    accounts maps origin_account and destination_account to the row's values.
+    """
+    field = Transaction.REQUIRED_ACCOUNTS.get(transaction_type)
+    if field and not accounts.get(field):
+        raise ValueError(f"{transaction_type} transactions need {field} set")
+
+
+def get_existing_keys(user, columns):
+    """
+    Returns the dedup keys of stored transactions that could match rows in the batch,
+    looking in the archive too when the batch reaches back before the archive cutoff.
+    """
+    date_range = (min(columns['date']), max(columns['date']))
+    key_fields = ('date', 'type', 'description', 'amount', 'origin_account_id', 'destination_account_id')
+
+    existing = set(Transaction.objects.filter(user=user, date__range=date_range).values_list(*key_fields))
+    if ArchiveCheckpoint.objects.filter(user=user, cutoff__gt=date_range[0]).exists():
+        existing.update(ArchivedTransaction.objects.filter(user=user, date__range=date_range).values_list(*key_fields))
+    return existing
+
+
+def create_transactions(
+    user, columns, num_rows, affected_account_ids, spend_changes, skip_existing=True, rule_matcher=None,
+    skip_duplicates=False, **fields,
+):
+    """
+    Creates the transactions of one validated batch, skipping rows that match an
+    existing transaction, and returns how many were created.
+
+    The ids of the accounts involved and the budget spend of the new expenses are
+    added to affected_account_ids and spend_changes. Callers that already removed
+    known rows pass skip_existing=False; extra fields are set on every transaction,
+    and an optional external_id column is stored per row. Empty categories of the
+    new rows are filled by rule_matcher when given, and with skip_duplicates rows
+    that look like a stored transaction (see tracker.duplicates) are skipped too.
+    """
+    # Step 5: Skip transactions that already exist, including repeats within the batch
+    seen = get_existing_keys(user, columns) if skip_existing else set()
+    related = []
+    for row in zip(*(columns[name] for name in ('date', 'type', 'description', 'amount', 'origin_account', 'destination_account')), range(num_rows)):
+        key = row[:6]
+        if skip_existing and key in seen:
+            continue
+        seen.add(key)
+        related.append(row[6])
+
+    if skip_duplicates:
+        duplicates = find_stored_duplicates(user, columns, related)
+        related = [index for index in related if index not in duplicates]
+
+    external_ids = columns.get('external_id') or [None] * num_rows
+    transactions = []
+    for index in related:
+        transactions.append(Transaction(
+            user=user,
+            date=columns['date'][index],
+            type=columns['type'][index],
+            description=columns['description'][index],
+            amount=columns['amount'][index],
+            origin_account_id=columns['origin_account'][index],
+            destination_account_id=columns['destination_account'][index],
+            external_id=external_ids[index],
+            **fields,
+        ))
+        affected_account_ids.update((columns['origin_account'][index], columns['destination_account'][index]))
+
+    if rule_matcher:
+        rule_matcher.categorize_columns(columns, related)
+
+    # Step 6: Create the transactions and their Income/Expense records in bulk
+    Transaction.objects.bulk_create(transactions, batch_size=IMPORT_BATCH_SIZE)
+    schedule_description_update(user.pk, ((transaction.description, transaction.date) for transaction in transactions))
+    mark_reports_stale({(user.pk, get_report_year(transaction.date)) for transaction in transactions})
+    schedule_count_invalidation([user.pk])
+
+    incomes = []
+    expenses = []
+    for transaction, index in zip(transactions, related):
+        if transaction.type == 'income':
+            incomes.append(Income(
+                transaction=transaction,
+                category=columns['income_category'][index],
+                amount=transaction.amount,
+                account_id=transaction.destination_account_id,
+                date=transaction.date,
+            ))
+        elif transaction.type == 'expense':
+            expenses.append(Expense(
+                transaction=transaction,
+                category=columns['expense_category'][index],
+                source=columns['source'][index],
+                fixed_or_variable=columns['fixed_or_variable'][index],
+                amount=transaction.amount,
+                account_id=transaction.origin_account_id,
+                date=transaction.date,
+            ))
+    Income.objects.bulk_create(incomes, batch_size=IMPORT_BATCH_SIZE)
+    Expense.objects.bulk_create(expenses, batch_size=IMPORT_BATCH_SIZE)
+
+    for expense in expenses:
+        spend_changes[(user.pk, expense.category, get_spend_month(expense.date))] += expense.amount
+
+    return len(transactions)
+
+
+@instrument('import_arrow')
+@sharding.atomic
+def import_arrow_transactions(file, filename, user, skip_duplicates=False):
+    """
+    Imports transactions from a Parquet or Arrow file in record batches.
+
+    Rows matching an existing transaction are skipped, like in the CSV import, and
+    every affected account balance is recomputed once at the end. Any invalid row
+    rolls back the whole import. With skip_duplicates, rows that look like a stored
+    transaction are skipped as well. Returns the number of transactions created.
+    """
+    account_directory = get_account_directory(user)
+    rule_matcher = get_rule_matcher(user)
+    affected_account_ids = set()
+    spend_changes = defaultdict(Decimal)
+    created = 0
+    offset = 0
+
+    for batch in iter_record_batches(file, filename):
+        if not batch.num_rows:
+            continue
+        columns = validate_batch(batch, offset, account_directory)
+        offset += batch.num_rows
+        created += create_transactions(
+            user, columns, batch.num_rows, affected_account_ids, spend_changes,
+            rule_matcher=rule_matcher, skip_duplicates=skip_duplicates,
+        )
+
+    # Step 7: Recompute each affected account once after commit and update the budget spend counters
+    schedule_balance_update(affected_account_ids)
+    apply_spend_changes(spend_changes)
+
+    return created
+
+
+def parse_record_date(value):
+    """
+    Parses an ISO 8601 date or datetime, or a dd-mm-yyyy date like in the CSV import.
+    """
+    try:
+        date = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        try:
+            date = datetime.strptime(value, '%d-%m-%Y')
+        except (TypeError, ValueError):
+            raise ValueError(f"invalid date: {value!r}, expected YYYY-MM-DD or dd-mm-yyyy")
+    return date if timezone.is_aware(date) else timezone.make_aware(date, timezone.get_current_timezone())
+
+
+def parse_record_amount(value):
+    """
+    Parses a positive amount that fits the Transaction.amount column.
+    """
+    try:
+        amount = Decimal(str(value).replace(',', ''))
+    except InvalidOperation:
+        raise ValueError(f"invalid amount: {value!r}")
+    if not amount.is_finite() or amount <= 0:
+        raise ValueError("amount must be a positive number")
+    if amount.as_tuple().exponent < -2 or amount >= 10 ** 8:
+        raise ValueError(f"amount out of range: {value!r}")
+    return amount
+
+
+def validate_records(records, offset, account_directory):
+    """
+    Validates and normalises a batch of decoded NDJSON records.
+
+    Returns the same dict of column lists as validate_batch, so both paths create
+    their transactions with create_transactions.
+    """
+    columns = {name: [] for name in ('date', 'type', 'description', 'amount', *OPTIONAL_COLUMNS)}
+
+    for row_number, record in enumerate(records, start=offset + 1):
+        try:
+            if not isinstance(record, dict):
+                raise ValueError("expected a JSON object")
+
+            # Step 1: Parse and validate the date and the amount
+            columns['date'].append(parse_record_date(record.get('date')))
+            columns['amount'].append(parse_record_amount(record.get('amount')))
+
+            # Step 2: Validate the transaction type and the category choices
+            if record.get('type') not in dict(Transaction.TRANSACTION_TYPES):
+                raise ValueError(f"invalid transaction type: {record.get('type')!r}")
+            columns['type'].append(record['type'])
+            columns['description'].append(str(record.get('description') or ''))
+
+            for name, choices in CHOICE_COLUMNS.items():
+                value = record.get(name) or ''
+                if value and value not in choices:
+                    raise ValueError(f"invalid {name}: {value!r}")
+                columns[name].append(value)
+
+            # Step 3: Resolve account names from the user's account directory
+            for name in ('origin_account', 'destination_account'):
+                account_name = record.get(name) or ''
+                columns[name].append(account_directory.resolve(account_name).id if account_name else None)
+
+            # Step 4: Check the type has the account it is booked on
+            check_required_account(record['type'], record)
+        except ValueError as e:
+            raise ValueError(f"Row {row_number}: {e}") from e
+
+    return columns
+
+
+def iter_ndjson_batches(lines, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Yields lists of decoded records from NDJSON lines, skipping blank lines.
+    """
+    batch = []
+    row_number = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        row_number += 1
+        if row_number > MAX_INGEST_ROWS:
+            raise ValueError(f"Too many rows: at most {MAX_INGEST_ROWS} per request")
+        try:
+            batch.append(json.loads(line))
+        except ValueError as e:
+            raise ValueError(f"Row {row_number}: invalid JSON: {e}") from e
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+@instrument('import_ndjson')
+@sharding.atomic
+def import_ndjson_transactions(lines, user, idempotency_key=None, skip_duplicates=False):
+    """
+    Imports transactions from NDJSON lines, one JSON object per transaction.
+
+    Works like the Arrow import: every row is validated, existing transactions
+    are skipped, and any invalid row rolls back the whole request. When an
+    idempotency key is given and was already used, nothing is imported and the
+    stored outcome is returned. skip_duplicates is passed on to create_transactions.
+    Returns a dict with rows, created and replayed.
+    """
+    ingestion_batch = None
+    if idempotency_key:
+        ingestion_batch, new = IngestionBatch.objects.get_or_create(user=user, key=idempotency_key)
+        if not new:
+            return {'rows': ingestion_batch.rows, 'created': ingestion_batch.created, 'replayed': True}
+
+    account_directory = get_account_directory(user)
+    rule_matcher = get_rule_matcher(user)
+    affected_account_ids = set()
+    spend_changes = defaultdict(Decimal)
+    created = 0
+    offset = 0
+
+    for records in iter_ndjson_batches(lines):
+        columns = validate_records(records, offset, account_directory)
+        offset += len(records)
+        created += create_transactions(
+            user, columns, len(records), affected_account_ids, spend_changes,
+            rule_matcher=rule_matcher, skip_duplicates=skip_duplicates,
+        )
+
+    # Step 7: Recompute each affected account once after commit and update the budget spend counters
+    schedule_balance_update(affected_account_ids)
+    apply_spend_changes(spend_changes)
+
+    if ingestion_batch:
+        ingestion_batch.rows = offset
+        ingestion_batch.created = created
+        ingestion_batch.save(update_fields=['rows', 'created'])
+
+    return {'rows': offset, 'created': created, 'replayed': False}
@@ -0,0 +1,59 @@
+from tracker.tracker_helpers import get_affected_account_ids, update_account_balances
+from tracker.metrics import track
+from tracker.pagination import schedule_count_invalidation
+from tracker.tax_reports import mark_queryset_stale, mark_transactions_stale
+from tracker import sharding
+
+
+def schedule_balance_update(account_ids):
+    """
+    Marks accounts as changed; their balance and history are updated once the
+    outermost atomic block commits, or right away outside of one.
+
+    Every account marked before the commit is updated exactly once, however many
+    writes touched it. Accounts marked in a block that rolls back are dropped
+    with it.
+    """
+    account_ids = set(account_ids) - {None}
+    if not account_ids:
+        return
+
+    pending = sharding.get_commit_batch('balance-updates', set, flush_balance_updates)
+    if pending is None:
+        flush_balance_updates(account_ids)
+    else:
+        pending.update(account_ids)
+
+
+def schedule_transaction_update(*transactions):
+    """
+    Schedules a balance update for every account the given transactions move money
+    between, marks the tax reports of their years as stale and drops the cached
+    list counts of their owners.
+    """
+    mark_transactions_stale(*transactions)
+    schedule_count_invalidation(transaction.user_id for transaction in transactions)
+    schedule_balance_update(
+        account_id
+        for transaction in transactions
+        for account_id in (transaction.origin_account_id, transaction.destination_account_id)
+    )
+
+
+def schedule_queryset_update(transactions):
+    """
+    Schedules a balance update for every account touched by a transactions queryset,
+    marks the tax reports of the years it has rows in as stale and drops the
+    cached list counts of their owners.
+    """
+    mark_queryset_stale(transactions)
+    schedule_count_invalidation(transactions.order_by().values_list('user_id', flat=True).distinct())
+    schedule_balance_update(get_affected_account_ids(transactions))
+
+
+def flush_balance_updates(account_ids):
+    """
+    Updates the balance and history of the given accounts.
+    """
+    with track('ledger_flush'):
+        update_account_balances(account_ids)
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from tracker.models import User
+from tracker.categorization import RULE_BATCH_SIZE, apply_category_rules
+from tracker import sharding
+
+
+class Command(BaseCommand):
+    help = "Re-applies the categorisation rules to existing incomes and expenses"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help="Only apply the rules of this user id")
+        parser.add_argument('--overwrite', action='store_true', help="Replace categories that are already set")
+        parser.add_argument('--batch-size', type=int, default=RULE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        for alias in sharding.iter_shards():
+            # Users are mirrored into their shard, so the join to their rules runs there
+            users = User.objects.using(alias).filter(category_rules__is_active=True).distinct()
+            if options['user']:
+                users = users.filter(pk=options['user'])
+
+            for user in users:
+                changed = apply_category_rules(user, overwrite=options['overwrite'], batch_size=options['batch_size'])
+                self.stdout.write(
+                    f"{user}: {changed['income']} incomes and {changed['expense']} expenses recategorised"
+                )
+
+        self.stdout.write(self.style.SUCCESS("Categorisation rules applied."))
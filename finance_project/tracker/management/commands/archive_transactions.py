@@ -0,0 +1,37 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from tracker.models import User
+from tracker.archive import ARCHIVE_BATCH_SIZE, archive_transactions
+from tracker import sharding
+
+
+class Command(BaseCommand):
+    help = "Moves transactions dated before a cutoff to the archive tables, keeping balances and totals exact"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', required=True, help="Cutoff date (YYYY-MM-DD); older transactions are archived")
+        parser.add_argument('--user', type=int, help="Only archive transactions of this user id")
+        parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE, help="Transactions moved per database transaction")
+
+    def handle(self, *args, **options):
+        try:
+            cutoff = timezone.make_aware(datetime.strptime(options['before'], '%Y-%m-%d'))
+        except ValueError:
+            raise CommandError("Invalid --before date: expected format is YYYY-MM-DD.")
+
+        users = User.objects.order_by('pk')
+        if options['user']:
+            users = users.filter(pk=options['user'])
+
+        total = 0
+        for user in users:
+            with sharding.use_user_shard(user):
+                archived = archive_transactions(user, cutoff, batch_size=options['batch_size'])
+            if archived:
+                self.stdout.write(f"{user}: archived {archived} transactions.")
+            total += archived
+
+        self.stdout.write(self.style.SUCCESS(f"Archived {total} transactions dated before {cutoff:%Y-%m-%d}."))
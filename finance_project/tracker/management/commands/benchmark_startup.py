@@ -0,0 +1,76 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Runs in a fresh interpreter: loads the WSGI application, then serves one request
+CHILD_SCRIPT = """
+import io, json, sys, time
+start = time.perf_counter()
+
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+loaded = time.perf_counter()
+
+status = []
+environ = {
+    'REQUEST_METHOD': 'GET', 'PATH_INFO': sys.argv[1], 'QUERY_STRING': '',
+    'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'HTTP_HOST': 'localhost',
+    'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+}
+body = b''.join(application(environ, lambda code, headers, exc_info=None: status.append(code)))
+served = time.perf_counter()
+
+print(json.dumps({'load': loaded - start, 'first_request': served - loaded, 'status': status[0]}))
+"""
+
+
+class Command(BaseCommand):
+    help = "Measures cold start: WSGI load time, time to first request and import time per module"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/', help="Path of the first request")
+        parser.add_argument('--runs', type=int, default=5, help="Number of cold starts to time")
+        parser.add_argument('--top', type=int, default=20, help="Number of slowest imports to list")
+
+    def run_child(self, path, importtime=False):
+        command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', CHILD_SCRIPT, path]
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': settings.SETTINGS_MODULE}
+        result = subprocess.run(command, capture_output=True, text=True, cwd=settings.BASE_DIR, env=env)
+        if result.returncode:
+            raise RuntimeError(result.stderr)
+        return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Settings: {settings.SETTINGS_MODULE}")
+
+        # Step 1: Time to first request, over several cold starts
+        timings = [self.run_child(options['path'])[0] for _ in range(options['runs'])]
+        load = statistics.median(timing['load'] for timing in timings)
+        first_request = statistics.median(timing['first_request'] for timing in timings)
+        self.stdout.write(
+            f"Median over {options['runs']} runs: load {load * 1000:.1f} ms, "
+            f"first request {first_request * 1000:.1f} ms (status {timings[0]['status']}), "
+            f"total {(load + first_request) * 1000:.1f} ms"
+        )
+
+        # Step 2: Import time per module from `python -X importtime`
+        _, importtime = self.run_child(options['path'], importtime=True)
+        modules = []
+        for line in importtime.splitlines():
+            if not line.startswith('import time:') or 'self [us]' in line:
+                continue
+            self_us, cumulative_us, name = line.removeprefix('import time:').split('|')
+            # Only top-level imports, whose cumulative time includes everything they import
+            if name.startswith('  '):
+                continue
+            modules.append((int(cumulative_us), int(self_us), name.strip()))
+
+        self.stdout.write("\nSlowest top-level imports (cumulative / self, ms):")
+        for cumulative_us, self_us, name in sorted(modules, reverse=True)[:options['top']]:
+            self.stdout.write(f"  {cumulative_us / 1000:8.1f} {self_us / 1000:8.1f}  {name}")
+        self.stdout.write(f"Total import time: {sum(module[0] for module in modules) / 1000:.1f} ms")
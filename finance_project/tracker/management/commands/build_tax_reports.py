@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from tracker.models import TaxReport
+from tracker.tax_reports import generate_tax_report
+from tracker import sharding
+
+
+class Command(BaseCommand):
+    help = "Rebuilds stale or failed tax reports in the foreground, e.g. from a nightly job"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help="Only rebuild the reports of this user id")
+        parser.add_argument('--year', type=int, help="Only rebuild the reports of this year")
+        parser.add_argument('--all', action='store_true', help="Rebuild up-to-date reports too")
+
+    def handle(self, *args, **options):
+        rebuilt = 0
+        for _ in sharding.iter_shards():
+            reports = TaxReport.objects.all()
+            if not options['all']:
+                reports = reports.filter(Q(is_stale=True) | Q(status='failed'))
+            if options['user']:
+                reports = reports.filter(user_id=options['user'])
+            if options['year']:
+                reports = reports.filter(year=options['year'])
+
+            report_ids = list(reports.values_list('pk', flat=True))
+            for report_id in report_ids:
+                generate_tax_report(report_id)
+            rebuilt += len(report_ids)
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rebuilt} tax reports."))
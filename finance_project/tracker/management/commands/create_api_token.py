@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tracker.api import create_api_token
+from tracker.models import User
+
+
+class Command(BaseCommand):
+    help = "Creates an API token for a user and prints it; it cannot be shown again"
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--name', default='API client', help="What the token is used by, shown in the admin")
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options['username']).first()
+        if user is None:
+            raise CommandError(f"No user named {options['username']}")
+
+        key = create_api_token(user, options['name'])
+        self.stdout.write(f"Authorization: Bearer {key}")
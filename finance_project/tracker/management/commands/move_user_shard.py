@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tracker.models import User
+from tracker import sharding
+
+
+class Command(BaseCommand):
+    help = "Moves a user's data to another shard and pins them to it; run while the user is inactive"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, required=True, help="Id of the user to move")
+        parser.add_argument('--to', required=True, help="Database alias of the target shard")
+        parser.add_argument('--batch-size', type=int, default=sharding.MOVE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if not sharding.is_sharding_enabled():
+            raise CommandError("Sharding is off: set TRACKER_SHARDS first.")
+        try:
+            user = User.objects.get(pk=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['user']} not found.")
+
+        source = sharding.get_user_shard(user)
+        try:
+            moved = sharding.move_user_data(user, options['to'], batch_size=options['batch_size'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if not moved:
+            self.stdout.write(f"{user} is already in {source}.")
+            return
+        for model, count in moved.items():
+            self.stdout.write(f"{model}: {count} rows")
+        self.stdout.write(self.style.SUCCESS(f"Moved {user} from {source} to {options['to']}."))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tracker.models import User
+from tracker import sharding
+
+
+class Command(BaseCommand):
+    help = (
+        "Pins the users without a shard assignment to the shard holding their data, so a "
+        "change to TRACKER_SHARDS does not move them; run it before the change. --database "
+        "pins them all to one database instead, e.g. to the default one before turning "
+        "sharding on for a deployment that already has data"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', help="Database alias to pin every user to, only when all their data is in it"
+        )
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        if alias and alias != 'default' and alias not in sharding.get_shard_aliases():
+            raise CommandError(f"{alias} is not one of the shards: {', '.join(sharding.get_shard_aliases())}")
+
+        users = User.objects.filter(shard_assignment__isnull=True).order_by('pk')
+        pinned = {}
+        for user in users.iterator():
+            database = alias or sharding.get_user_shard(user)
+            sharding.assign_user_shard(user.pk, database)
+            sharding.mirror_user(user, database)
+            pinned[database] = pinned.get(database, 0) + 1
+
+        for database, count in sorted(pinned.items()):
+            self.stdout.write(f"{database}: {count} users")
+        self.stdout.write(self.style.SUCCESS(f"Pinned {sum(pinned.values())} users."))
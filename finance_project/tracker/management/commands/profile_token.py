@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from tracker.profiling import PROFILE_HEADER, PROFILE_MODES, make_profile_token
+
+
+class Command(BaseCommand):
+    help = "Prints a signed header value that enables request profiling"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=PROFILE_MODES, default='sql', help="Capture SQL only, or SQL plus cProfile stats")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{PROFILE_HEADER}: {make_profile_token(options['mode'])}")
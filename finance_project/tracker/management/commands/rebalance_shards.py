@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tracker.models import ShardAssignment
+from tracker import sharding
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves the pinned users whose place on the hash ring is now another shard to it, "
+        "e.g. onto a shard just added to TRACKER_SHARDS; run while the users are inactive"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, help="Move at most this many users")
+        parser.add_argument('--dry-run', action='store_true', help="List the moves without making them")
+        parser.add_argument('--batch-size', type=int, default=sharding.MOVE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if not sharding.is_sharding_enabled():
+            raise CommandError("Sharding is off: set TRACKER_SHARDS first.")
+
+        assignments = ShardAssignment.objects.select_related('user').order_by('user_id')
+        moved = 0
+        for assignment in assignments.iterator():
+            if options['limit'] is not None and moved >= options['limit']:
+                break
+            target = sharding.get_hashed_shard(assignment.user_id)
+            if target == assignment.database:
+                continue
+            if not options['dry_run']:
+                sharding.move_user_data(assignment.user, target, batch_size=options['batch_size'])
+            self.stdout.write(f"{assignment.user}: {assignment.database} -> {target}")
+            moved += 1
+
+        verb = "Would move" if options['dry_run'] else "Moved"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {moved} users."))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from tracker.models import User
+from tracker.budgets import rebuild_spend
+from tracker import sharding
+
+
+class Command(BaseCommand):
+    help = "Recomputes the monthly budget spend counters from the Expense records"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help="Only rebuild the counters of this user id")
+
+    def handle(self, *args, **options):
+        if options['user']:
+            user = User.objects.get(pk=options['user'])
+            with sharding.use_user_shard(user), sharding.atomic():
+                rebuild_spend(user)
+        else:
+            for _ in sharding.iter_shards():
+                with sharding.atomic():
+                    rebuild_spend()
+
+        self.stdout.write(self.style.SUCCESS("Budget spend counters rebuilt."))
@@ -0,0 +1,192 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import os
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import F, OuterRef, Subquery
+
+from tracker.models import Account, AccountBalanceHistory, Transaction, Income, Expense
+from tracker.tracker_helpers import get_movement_totals, get_opening_balances, calculate_balance, update_account_balance, record_account_balance
+from tracker.budgets import apply_spend_changes, collect_expense_spend, diff_spend
+from tracker.tax_reports import mark_queryset_stale
+from tracker.pagination import schedule_count_invalidation
+from tracker import sharding
+
+# Which account each mirror model must point at, on its Transaction
+MIRRORS = (
+    (Income, 'income', 'destination_account'),
+    (Expense, 'expense', 'origin_account'),
+)
+
+
+def close_inherited_connections():
+    # Forked workers must not share the parent's database connections
+    connections.close_all()
+
+
+def check_accounts(account_ids):
+    """
+    Reconciles a partition of accounts without writing anything.
+
+    Returns a list of (message, repair) pairs, where repair describes the fix to
+    apply or is None when the issue needs manual attention.
+    """
+    issues = []
+    accounts = Account.objects.filter(pk__in=account_ids).annotate(
+        last_recorded_balance=Subquery(
+            AccountBalanceHistory.objects.filter(account=OuterRef('pk')).order_by('-timestamp').values('balance')[:1]
+        )
+    )
+    totals = get_movement_totals(account_ids)
+    opening_balances = get_opening_balances(account_ids)
+
+    # Step 1: Recompute balances and compare with the stored balance and the latest history entry
+    for account in accounts:
+        expected = opening_balances[account.pk] + calculate_balance(account.account_type, totals[account.pk])
+
+        if account.balance != expected:
+            issues.append((
+                f"Account {account.pk} ({account.name}): balance {account.balance} != ledger {expected}",
+                ('balance', account.pk),
+            ))
+            continue
+
+        # Accounts that never moved have no history yet
+        last_recorded_balance = account.last_recorded_balance
+        if last_recorded_balance is None and account.balance == 0:
+            continue
+
+        if last_recorded_balance != account.balance:
+            issues.append((
+                f"Account {account.pk} ({account.name}): last history entry {last_recorded_balance} != balance {account.balance}",
+                ('history', account.pk),
+            ))
+
+    # Step 2: Cross-check the Income/Expense mirrors against their Transaction
+    for model, transaction_type, account_field in MIRRORS:
+        label = model.__name__
+        mirrors = model.objects.filter(**{f'transaction__{account_field}_id__in': account_ids})
+
+        drifted = (
+            mirrors.exclude(
+                amount=F('transaction__amount'),
+                date=F('transaction__date'),
+                account_id=F(f'transaction__{account_field}_id'),
+            )
+            .values_list('pk', 'transaction_id', 'transaction__amount', 'transaction__date', f'transaction__{account_field}_id')
+        )
+        for pk, transaction_id, amount, date, account_id in drifted:
+            issues.append((
+                f"{label} {pk}: does not match transaction {transaction_id}",
+                ('mirror', label, pk, {'amount': amount, 'date': date, 'account_id': account_id}),
+            ))
+
+        wrong_type = mirrors.exclude(transaction__type=transaction_type).values_list('pk', 'transaction_id')
+        for pk, transaction_id in wrong_type:
+            issues.append((f"{label} {pk}: transaction {transaction_id} is not of type {transaction_type}", None))
+
+        missing = Transaction.objects.filter(
+            type=transaction_type,
+            **{f'{account_field}_id__in': account_ids, f'{transaction_type}_transaction__isnull': True},
+        ).values_list('pk', flat=True)
+        for transaction_id in missing:
+            issues.append((f"Transaction {transaction_id}: missing {label} record", None))
+
+    return issues
+
+
+def check_shard_accounts(alias, account_ids):
+    # Worker processes do not inherit the parent's shard, so it is passed along
+    with sharding.use_shard(alias):
+        return check_accounts(account_ids)
+
+
+def apply_repairs(repairs):
+    """
+    Applies the repairs collected by check_accounts in a single transaction.
+    """
+    mirror_models = {model.__name__: model for model, _, _ in MIRRORS}
+
+    with sharding.atomic():
+        for repair in repairs:
+            if repair[0] == 'balance':
+                update_account_balance(Account.objects.get(pk=repair[1]))
+            elif repair[0] == 'history':
+                record_account_balance(Account.objects.get(pk=repair[1]))
+            elif repair[0] == 'mirror':
+                _, label, pk, values = repair
+                mirrors = mirror_models[label].objects.filter(pk=pk)
+                # The report years before and after a date repair both change
+                mark_queryset_stale(mirrors, user_field='transaction__user_id')
+                if label == 'Expense':
+                    # Keep the budget spend counters in step with the repaired amount/date
+                    original_spend = collect_expense_spend(mirrors)
+                    mirrors.update(**values)
+                    apply_spend_changes(diff_spend(original_spend, collect_expense_spend(mirrors)))
+                else:
+                    mirrors.update(**values)
+                mark_queryset_stale(mirrors, user_field='transaction__user_id')
+                schedule_count_invalidation(mirrors.values_list('transaction__user_id', flat=True))
+
+
+class Command(BaseCommand):
+    help = "Checks that account balances, balance history and Income/Expense records agree with transactions"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repair', action='store_true', help="Fix balance, history and mirror drift")
+        parser.add_argument('--user', type=int, help="Only check accounts of this user id")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Number of worker processes")
+        parser.add_argument('--batch-size', type=int, default=500, help="Accounts per partition")
+
+    def handle(self, *args, **options):
+        checked = 0
+        issues = []
+        for alias in sharding.iter_shards():
+            accounts = Account.objects.order_by('pk')
+            if options['user']:
+                accounts = accounts.filter(user_id=options['user'])
+
+            account_ids = list(accounts.values_list('pk', flat=True))
+            batch_size = options['batch_size']
+            partitions = [account_ids[i:i + batch_size] for i in range(0, len(account_ids), batch_size)]
+            if not partitions:
+                continue
+            checked += len(account_ids)
+
+            # Run inline when a pool would not help
+            workers = min(options['workers'], len(partitions))
+            if workers <= 1:
+                results = [check_accounts(partition) for partition in partitions]
+            else:
+                # Closed before the pool starts, so forked workers open their own connections.
+                # Spawned workers (macOS, Python 3.14+) start without Django, so each sets it up first
+                close_inherited_connections()
+                with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as executor:
+                    results = list(executor.map(partial(check_shard_accounts, alias), partitions))
+
+            shard_issues = [issue for partition_issues in results for issue in partition_issues]
+            for message, _ in shard_issues:
+                self.stdout.write(message)
+
+            # Repairs run in this process only, so workers never contend for write locks
+            if options['repair']:
+                apply_repairs([repair for _, repair in shard_issues if repair])
+            issues.extend(shard_issues)
+
+        if not checked:
+            self.stdout.write(self.style.WARNING("No accounts to check."))
+            return
+
+        manual = sum(1 for _, repair in issues if repair is None)
+        if not issues:
+            self.stdout.write(self.style.SUCCESS(f"Checked {checked} accounts: no drift found."))
+        elif options['repair']:
+            message = f"Checked {checked} accounts: found {len(issues)} issues, {len(issues) - manual} repaired"
+            if manual:
+                self.stdout.write(self.style.ERROR(f"{message}, {manual} need manual attention."))
+            else:
+                self.stdout.write(self.style.WARNING(f"{message}."))
+        else:
+            self.stdout.write(self.style.ERROR(f"Checked {checked} accounts: found {len(issues)} issues."))
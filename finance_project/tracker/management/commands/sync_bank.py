@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tracker.models import SyncSource
+from tracker.bank_sync import sync_source
+from tracker import sharding
+
+
+class Command(BaseCommand):
+    help = "Imports new statement rows from the bank feeds of the configured sync sources"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', type=int, help="Only sync this sync source id")
+        parser.add_argument('--user', type=int, help="Only sync the sources of this user id")
+
+    def handle(self, *args, **options):
+        synced = 0
+        for _ in sharding.iter_shards():
+            sources = SyncSource.objects.order_by('pk')
+            if options['source']:
+                sources = sources.filter(pk=options['source'])
+            if options['user']:
+                sources = sources.filter(user_id=options['user'])
+
+            for source in sources:
+                result = sync_source(source)
+                self.stdout.write(
+                    f"{source}: fetched {result.fetched} rows, {result.below_watermark} before the watermark, "
+                    f"{result.already_seen} already imported, {result.created} created."
+                )
+                synced += 1
+
+        if not synced:
+            raise CommandError("No sync sources found.")
+
+        self.stdout.write(self.style.SUCCESS("Sync complete."))
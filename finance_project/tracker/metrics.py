@@ -0,0 +1,377 @@
+import atexit
+import bisect
+import functools
+import json
+import os
+import threading
+import uuid
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+from time import monotonic, perf_counter, time
+
+from django.conf import settings
+from django.db import connections
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+# Seconds between writes of this process's values to its metrics file
+FLUSH_INTERVAL = 1.0
+
+# Values of exited processes, folded together so their files can be removed
+EXITED_FILENAME = 'metrics-exited.json'
+
+# A prune lock older than this was left by a process that died while pruning
+PRUNE_LOCK_TIMEOUT = 60
+
+
+def is_process_alive(pid):
+    if os.name == 'nt':
+        # os.kill() terminates the process on Windows rather than probing it
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def get_file_pid(path):
+    """
+    Returns the process id a metrics file was written by, or None for the file of exited processes.
+    """
+    _, _, rest = path.name.partition('-')
+    pid = rest.split('-')[0]
+    return int(pid) if pid.isdigit() else None
+
+
+def read_values(path):
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def merge_values(counters, histograms, data):
+    for name, labels, value in data['counters']:
+        key = (name, tuple(labels))
+        counters[key] = counters.get(key, 0) + value
+
+    for name, labels, bucket_counts, total, count in data['histograms']:
+        key = (name, tuple(labels))
+        merged = histograms.setdefault(key, [[0] * len(bucket_counts), 0.0, 0])
+        merged[0] = [a + b for a, b in zip(merged[0], bucket_counts)]
+        merged[1] += total
+        merged[2] += count
+
+
+def dump_values(counters, histograms):
+    return {
+        'counters': [[name, list(labels), value] for (name, labels), value in counters.items()],
+        'histograms': [[name, list(labels), *values] for (name, labels), values in histograms.items()],
+    }
+
+
+def write_atomically(path, data):
+    temp_path = path.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+    temp_path.write_text(json.dumps(data))
+    os.replace(temp_path, path)
+
+
+class MetricsRegistry:
+    """
+    In-process counters and fixed-bucket histograms shared between worker processes through files.
+
+    Each process keeps its values in memory and periodically writes them to its
+    own JSON file in METRICS_ROOT. Scraping merges the files of every process,
+    so counts survive across workers; clear the directory on deploy to reset them.
+    The files of exited processes are folded into one on scrape, so recycled
+    workers do not leave a file each behind and their counts are kept.
+
+    The file is named after the process that writes it, checked on every write,
+    so workers forked from a master that imported the app (gunicorn --preload)
+    each start their own file and values, rather than sharing the master's.
+    """
+
+    def __init__(self):
+        self.definitions = {}
+        self.reset()
+
+    def reset(self):
+        """
+        Starts empty values under a new file for the current process.
+        """
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.pid = os.getpid()
+        self.filename = f'metrics-{self.pid}-{uuid.uuid4().hex[:8]}.json'
+        self.last_flush = 0.0
+
+    def check_process(self):
+        # The values held at fork time stay the parent's, which writes them to its own file
+        if os.getpid() != self.pid:
+            self.reset()
+
+    @property
+    def directory(self):
+        return Path(getattr(settings, 'METRICS_ROOT', settings.BASE_DIR / 'metrics'))
+
+    def counter(self, name, documentation, labelnames=()):
+        self.definitions[name] = ('counter', documentation, labelnames, None)
+        return Counter(self, name, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        self.definitions[name] = ('histogram', documentation, labelnames, tuple(buckets))
+        return Histogram(self, name, labelnames, tuple(buckets))
+
+    def inc(self, name, labels, amount=1):
+        self.check_process()
+        with self.lock:
+            key = (name, labels)
+            self.counters[key] = self.counters.get(key, 0) + amount
+        self.maybe_flush()
+
+    def observe(self, name, labels, value, buckets):
+        self.check_process()
+        with self.lock:
+            key = (name, labels)
+            # Per-bucket counts plus a final +Inf bucket, then sum and count
+            histogram = self.histograms.setdefault(key, [[0] * (len(buckets) + 1), 0.0, 0])
+            histogram[0][bisect.bisect_left(buckets, value)] += 1
+            histogram[1] += value
+            histogram[2] += 1
+        self.maybe_flush()
+
+    def maybe_flush(self):
+        if monotonic() - self.last_flush >= FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes this process's values to its metrics file, atomically.
+        """
+        self.check_process()
+        with self.lock:
+            self.last_flush = monotonic()
+            data = dump_values(self.counters, self.histograms)
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        write_atomically(self.directory / self.filename, data)
+
+    def prune(self):
+        """
+        Folds the files of exited processes into the exited file and removes them.
+
+        Runs under a lock file, so concurrent scrapes never fold a file twice; a
+        scrape that finds the lock taken leaves pruning to the other one.
+        """
+        lock_path = self.directory / 'metrics.lock'
+        try:
+            lock = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                if time() - lock_path.stat().st_mtime > PRUNE_LOCK_TIMEOUT:
+                    lock_path.unlink()
+            except FileNotFoundError:
+                pass
+            return
+
+        try:
+            exited = [
+                path for path in self.directory.glob('metrics-*.json')
+                if get_file_pid(path) is not None and not is_process_alive(get_file_pid(path))
+            ]
+            if not exited:
+                return
+
+            counters = {}
+            histograms = {}
+            for path in [self.directory / EXITED_FILENAME, *exited]:
+                data = read_values(path)
+                if data is not None:
+                    merge_values(counters, histograms, data)
+
+            # Written before the originals are removed, so a crash in between can only count them twice, never lose them
+            write_atomically(self.directory / EXITED_FILENAME, dump_values(counters, histograms))
+            for path in exited:
+                path.unlink(missing_ok=True)
+        finally:
+            os.close(lock)
+            lock_path.unlink(missing_ok=True)
+
+    def collect(self):
+        """
+        Merges the values written by every process.
+        """
+        self.flush()
+        self.prune()
+
+        counters = {}
+        histograms = {}
+        for path in self.directory.glob('metrics-*.json'):
+            data = read_values(path)
+            if data is not None:
+                merge_values(counters, histograms, data)
+
+        return counters, histograms
+
+    def render(self):
+        """
+        Returns every metric in the Prometheus text exposition format.
+        """
+        counters, histograms = self.collect()
+        lines = []
+
+        for name, (metric_type, documentation, labelnames, buckets) in sorted(self.definitions.items()):
+            lines.append(f'# HELP {name} {documentation}')
+            lines.append(f'# TYPE {name} {metric_type}')
+
+            if metric_type == 'counter':
+                for (metric_name, labels), value in sorted(counters.items()):
+                    if metric_name == name:
+                        lines.append(f'{name}{format_labels(labelnames, labels)} {value}')
+                continue
+
+            for (metric_name, labels), (bucket_counts, total, count) in sorted(histograms.items()):
+                if metric_name != name:
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip((*buckets, '+Inf'), bucket_counts):
+                    cumulative += bucket_count
+                    lines.append(f'{name}_bucket{format_labels(labelnames, labels, le=bound)} {cumulative}')
+                lines.append(f'{name}_sum{format_labels(labelnames, labels)} {total}')
+                lines.append(f'{name}_count{format_labels(labelnames, labels)} {count}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labelnames, labels, **extra):
+    pairs = list(zip(labelnames, labels)) + list(extra.items())
+    if not pairs:
+        return ''
+
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in pairs) + '}'
+
+
+class Counter:
+    def __init__(self, registry, name, labelnames):
+        self.registry = registry
+        self.name = name
+        self.labelnames = labelnames
+
+    def inc(self, amount=1, **labels):
+        self.registry.inc(self.name, tuple(str(labels[name]) for name in self.labelnames), amount)
+
+
+class Histogram:
+    def __init__(self, registry, name, labelnames, buckets):
+        self.registry = registry
+        self.name = name
+        self.labelnames = labelnames
+        self.buckets = buckets
+
+    def observe(self, value, **labels):
+        self.registry.observe(self.name, tuple(str(labels[name]) for name in self.labelnames), value, self.buckets)
+
+
+registry = MetricsRegistry()
+atexit.register(registry.flush)
+
+REQUESTS = registry.counter(
+    'tracker_requests_total', 'Requests handled, by view, method and status code', ('view', 'method', 'status'),
+)
+REQUEST_DURATION = registry.histogram(
+    'tracker_request_duration_seconds', 'Time spent handling requests, by view', ('view',),
+)
+REQUEST_QUERIES = registry.histogram(
+    'tracker_request_queries', 'Database queries per request, by view', ('view',), buckets=QUERY_BUCKETS,
+)
+OPERATION_DURATION = registry.histogram(
+    'tracker_operation_duration_seconds', 'Time spent in instrumented hot paths', ('operation',),
+)
+OPERATION_QUERIES = registry.histogram(
+    'tracker_operation_queries', 'Database queries per call of instrumented hot paths', ('operation',), buckets=QUERY_BUCKETS,
+)
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def count_queries():
+    """
+    Counts the queries run on every database connection inside the block.
+    """
+    counter = QueryCounter()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(counter))
+        yield counter
+
+
+@contextmanager
+def track(operation):
+    """
+    Records the duration and query count of the block under the given operation name.
+    """
+    start = perf_counter()
+    with count_queries() as counter:
+        try:
+            yield
+        finally:
+            OPERATION_DURATION.observe(perf_counter() - start, operation=operation)
+            OPERATION_QUERIES.observe(counter.count, operation=operation)
+
+
+def instrument(operation):
+    """
+    Decorator recording the duration and query count of every call.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with track(operation):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def track_stream(operation, chunks):
+    """
+    Wraps a streaming response body so the time spent producing it is recorded.
+    """
+    with track(operation):
+        yield from chunks
+
+
+class MetricsMiddleware:
+    """
+    Records the count, duration and query count of every request by URL name.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = perf_counter()
+        with count_queries() as counter:
+            response = self.get_response(request)
+
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        REQUESTS.inc(view=view, method=request.method, status=response.status_code)
+        REQUEST_DURATION.observe(perf_counter() - start, view=view)
+        REQUEST_QUERIES.observe(counter.count, view=view)
+        return response
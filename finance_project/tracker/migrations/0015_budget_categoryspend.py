@@ -0,0 +1,147 @@
+# Generated by Django 4.2 on 2026-10-19 09:38
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("tracker", "0014_alter_expense_category"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CategorySpend",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "category",
+                    models.CharField(
+                        choices=[
+                            ("accessories", "Accessories"),
+                            ("car", "Car"),
+                            ("cash", "Cash"),
+                            ("clothing", "Clothing"),
+                            ("coffees & snacks", "Coffees & Snacks"),
+                            ("dining out", "Dining Out"),
+                            ("entertainment", "Entertainment"),
+                            ("farm", "Farm"),
+                            ("fees", "Fees"),
+                            ("gifts", "Gifts"),
+                            ("groceries", "Groceries"),
+                            ("gym", "Gym"),
+                            ("housing", "Housing"),
+                            ("medical appointments", "Medical Appointments"),
+                            ("miscellaneous", "Miscellaneous"),
+                            ("personal care", "Personal Care"),
+                            ("personal development", "Personal Development"),
+                            ("pet", "Pet"),
+                            ("petrol", "Petrol"),
+                            ("pharmacy", "Pharmacy"),
+                            ("phone", "Phone"),
+                            ("sports", "Sports"),
+                            ("supplements", "Supplements"),
+                            ("tattoos", "Tattoos"),
+                            ("taxes", "Taxes"),
+                            ("transportation", "Transportation"),
+                            ("utilities", "Utilities"),
+                            ("vacation", "Vacation"),
+                            ("wedding", "Wedding"),
+                            ("workspace", "Workspace"),
+                        ],
+                        max_length=50,
+                    ),
+                ),
+                ("month", models.DateField()),
+                (
+                    "amount",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=12),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="category_spends",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("user", "month", "category")},
+            },
+        ),
+        migrations.CreateModel(
+            name="Budget",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "category",
+                    models.CharField(
+                        choices=[
+                            ("accessories", "Accessories"),
+                            ("car", "Car"),
+                            ("cash", "Cash"),
+                            ("clothing", "Clothing"),
+                            ("coffees & snacks", "Coffees & Snacks"),
+                            ("dining out", "Dining Out"),
+                            ("entertainment", "Entertainment"),
+                            ("farm", "Farm"),
+                            ("fees", "Fees"),
+                            ("gifts", "Gifts"),
+                            ("groceries", "Groceries"),
+                            ("gym", "Gym"),
+                            ("housing", "Housing"),
+                            ("medical appointments", "Medical Appointments"),
+                            ("miscellaneous", "Miscellaneous"),
+                            ("personal care", "Personal Care"),
+                            ("personal development", "Personal Development"),
+                            ("pet", "Pet"),
+                            ("petrol", "Petrol"),
+                            ("pharmacy", "Pharmacy"),
+                            ("phone", "Phone"),
+                            ("sports", "Sports"),
+                            ("supplements", "Supplements"),
+                            ("tattoos", "Tattoos"),
+                            ("taxes", "Taxes"),
+                            ("transportation", "Transportation"),
+                            ("utilities", "Utilities"),
+                            ("vacation", "Vacation"),
+                            ("wedding", "Wedding"),
+                            ("workspace", "Workspace"),
+                        ],
+                        max_length=50,
+                    ),
+                ),
+                ("amount", models.DecimalField(decimal_places=2, max_digits=10)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="budgets",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["category"],
+                "unique_together": {("user", "category")},
+            },
+        ),
+    ]
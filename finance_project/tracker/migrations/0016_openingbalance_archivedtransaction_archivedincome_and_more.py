@@ -0,0 +1,246 @@
+# Generated by Django 4.2 on 2026-10-19 09:42
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("tracker", "0015_budget_categoryspend"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OpeningBalance",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "balance",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=12),
+                ),
+                (
+                    "account",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="opening_balance",
+                        to="tracker.account",
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="ArchivedTransaction",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("description", models.TextField()),
+                (
+                    "type",
+                    models.CharField(
+                        choices=[
+                            ("income", "Income"),
+                            ("expense", "Expense"),
+                            ("internal", "Internal"),
+                            ("tax", "Tax"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("amount", models.DecimalField(decimal_places=2, max_digits=10)),
+                ("date", models.DateTimeField()),
+                (
+                    "archived_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                (
+                    "destination_account",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="archived_transactions_to",
+                        to="tracker.account",
+                    ),
+                ),
+                (
+                    "origin_account",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="archived_transactions_from",
+                        to="tracker.account",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="archived_transactions",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["-date"],
+            },
+        ),
+        migrations.CreateModel(
+            name="ArchivedIncome",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("amount", models.DecimalField(decimal_places=2, max_digits=10)),
+                (
+                    "category",
+                    models.CharField(
+                        choices=[
+                            ("salary", "Salary"),
+                            ("interest", "Interest"),
+                            ("parents", "Parents"),
+                            ("joint transfer", "Joint Transfer"),
+                            ("birthday", "Birthday"),
+                            ("christmas", "Christmas"),
+                            ("tax", "Tax"),
+                            ("other", "Other"),
+                        ],
+                        max_length=50,
+                    ),
+                ),
+                ("notes", models.TextField(blank=True, null=True)),
+                ("date", models.DateTimeField()),
+                (
+                    "account",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="archived_income_account",
+                        to="tracker.account",
+                    ),
+                ),
+                (
+                    "transaction",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="income_transaction",
+                        to="tracker.archivedtransaction",
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="ArchivedExpense",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("amount", models.DecimalField(decimal_places=2, max_digits=10)),
+                (
+                    "category",
+                    models.CharField(
+                        choices=[
+                            ("accessories", "Accessories"),
+                            ("car", "Car"),
+                            ("cash", "Cash"),
+                            ("clothing", "Clothing"),
+                            ("coffees & snacks", "Coffees & Snacks"),
+                            ("dining out", "Dining Out"),
+                            ("entertainment", "Entertainment"),
+                            ("farm", "Farm"),
+                            ("fees", "Fees"),
+                            ("gifts", "Gifts"),
+                            ("groceries", "Groceries"),
+                            ("gym", "Gym"),
+                            ("housing", "Housing"),
+                            ("medical appointments", "Medical Appointments"),
+                            ("miscellaneous", "Miscellaneous"),
+                            ("personal care", "Personal Care"),
+                            ("personal development", "Personal Development"),
+                            ("pet", "Pet"),
+                            ("petrol", "Petrol"),
+                            ("pharmacy", "Pharmacy"),
+                            ("phone", "Phone"),
+                            ("sports", "Sports"),
+                            ("supplements", "Supplements"),
+                            ("tattoos", "Tattoos"),
+                            ("taxes", "Taxes"),
+                            ("transportation", "Transportation"),
+                            ("utilities", "Utilities"),
+                            ("vacation", "Vacation"),
+                            ("wedding", "Wedding"),
+                            ("workspace", "Workspace"),
+                        ],
+                        max_length=50,
+                    ),
+                ),
+                ("notes", models.TextField(blank=True, null=True)),
+                ("date", models.DateTimeField()),
+                (
+                    "source",
+                    models.CharField(
+                        choices=[("personal", "Personal"), ("shared", "Shared")],
+                        max_length=50,
+                    ),
+                ),
+                (
+                    "fixed_or_variable",
+                    models.CharField(
+                        choices=[("fixed", "Fixed"), ("variable", "Variable")],
+                        max_length=50,
+                    ),
+                ),
+                (
+                    "account",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="archived_expense_account",
+                        to="tracker.account",
+                    ),
+                ),
+                (
+                    "transaction",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="expense_transaction",
+                        to="tracker.archivedtransaction",
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="ArchiveCheckpoint",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("cutoff", models.DateTimeField()),
+                (
+                    "income",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                (
+                    "expenses",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="archive_checkpoint",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+    ]
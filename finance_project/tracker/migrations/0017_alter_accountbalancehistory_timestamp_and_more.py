@@ -0,0 +1,64 @@
+# Generated by Django 4.2 on 2026-10-19 09:47
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("tracker", "0016_openingbalance_archivedtransaction_archivedincome_and_more"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="accountbalancehistory",
+            name="timestamp",
+            field=models.DateTimeField(
+                db_index=True, default=django.utils.timezone.now
+            ),
+        ),
+        migrations.AlterField(
+            model_name="archivedtransaction",
+            name="date",
+            field=models.DateTimeField(db_index=True),
+        ),
+        migrations.AlterField(
+            model_name="expense",
+            name="date",
+            field=models.DateTimeField(
+                db_index=True, default=django.utils.timezone.now
+            ),
+        ),
+        migrations.AlterField(
+            model_name="income",
+            name="date",
+            field=models.DateTimeField(
+                db_index=True, default=django.utils.timezone.now
+            ),
+        ),
+        migrations.AlterField(
+            model_name="transaction",
+            name="date",
+            field=models.DateTimeField(
+                db_index=True, default=django.utils.timezone.now
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="expense",
+            index=models.Index(
+                fields=["category", "date"], name="tracker_exp_categor_50bf58_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="income",
+            index=models.Index(
+                fields=["category", "date"], name="tracker_inc_categor_a817c7_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(
+                fields=["type", "date"], name="tracker_tra_type_b068ef_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-19 09:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("tracker", "0017_alter_accountbalancehistory_timestamp_and_more"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(
+                fields=["user", "date", "id"], name="tracker_tra_user_id_b0ab4c_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,98 @@
+# Generated by Django 4.2 on 2026-10-19 09:51
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("tracker", "0019_ingestionbatch"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SyncSource",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=100)),
+                (
+                    "provider",
+                    models.CharField(
+                        choices=[("fake", "Fake bank feed")], max_length=20
+                    ),
+                ),
+                ("watermark", models.DateTimeField(blank=True, null=True)),
+                ("last_synced_at", models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="archivedtransaction",
+            name="external_id",
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name="transaction",
+            name="external_id",
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name="syncsource",
+            name="account",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="sync_sources",
+                to="tracker.account",
+            ),
+        ),
+        migrations.AddField(
+            model_name="syncsource",
+            name="user",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="sync_sources",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddField(
+            model_name="archivedtransaction",
+            name="sync_source",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="archived_transactions",
+                to="tracker.syncsource",
+            ),
+        ),
+        migrations.AddField(
+            model_name="transaction",
+            name="sync_source",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="transactions",
+                to="tracker.syncsource",
+            ),
+        ),
+        migrations.AlterUniqueTogether(
+            name="syncsource",
+            unique_together={("user", "name")},
+        ),
+        migrations.AddConstraint(
+            model_name="transaction",
+            constraint=models.UniqueConstraint(
+                fields=("sync_source", "external_id"),
+                name="unique_transaction_external_id",
+            ),
+        ),
+    ]
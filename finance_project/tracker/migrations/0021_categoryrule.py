@@ -0,0 +1,160 @@
+# Generated by Django 4.2 on 2026-10-19 09:55
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("tracker", "0020_syncsource_archivedtransaction_external_id_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CategoryRule",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("priority", models.PositiveIntegerField(default=100)),
+                (
+                    "match_type",
+                    models.CharField(
+                        choices=[
+                            ("contains", "Contains"),
+                            ("regex", "Regular expression"),
+                        ],
+                        default="contains",
+                        max_length=10,
+                    ),
+                ),
+                ("pattern", models.CharField(max_length=255)),
+                ("is_active", models.BooleanField(default=True)),
+                (
+                    "transaction_type",
+                    models.CharField(
+                        blank=True,
+                        choices=[
+                            ("income", "Income"),
+                            ("expense", "Expense"),
+                            ("internal", "Internal"),
+                            ("tax", "Tax"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                (
+                    "min_amount",
+                    models.DecimalField(
+                        blank=True, decimal_places=2, max_digits=10, null=True
+                    ),
+                ),
+                (
+                    "max_amount",
+                    models.DecimalField(
+                        blank=True, decimal_places=2, max_digits=10, null=True
+                    ),
+                ),
+                (
+                    "expense_category",
+                    models.CharField(
+                        blank=True,
+                        choices=[
+                            ("accessories", "Accessories"),
+                            ("car", "Car"),
+                            ("cash", "Cash"),
+                            ("clothing", "Clothing"),
+                            ("coffees & snacks", "Coffees & Snacks"),
+                            ("dining out", "Dining Out"),
+                            ("entertainment", "Entertainment"),
+                            ("farm", "Farm"),
+                            ("fees", "Fees"),
+                            ("gifts", "Gifts"),
+                            ("groceries", "Groceries"),
+                            ("gym", "Gym"),
+                            ("housing", "Housing"),
+                            ("medical appointments", "Medical Appointments"),
+                            ("miscellaneous", "Miscellaneous"),
+                            ("personal care", "Personal Care"),
+                            ("personal development", "Personal Development"),
+                            ("pet", "Pet"),
+                            ("petrol", "Petrol"),
+                            ("pharmacy", "Pharmacy"),
+                            ("phone", "Phone"),
+                            ("sports", "Sports"),
+                            ("supplements", "Supplements"),
+                            ("tattoos", "Tattoos"),
+                            ("taxes", "Taxes"),
+                            ("transportation", "Transportation"),
+                            ("utilities", "Utilities"),
+                            ("vacation", "Vacation"),
+                            ("wedding", "Wedding"),
+                            ("workspace", "Workspace"),
+                        ],
+                        max_length=50,
+                    ),
+                ),
+                (
+                    "income_category",
+                    models.CharField(
+                        blank=True,
+                        choices=[
+                            ("salary", "Salary"),
+                            ("interest", "Interest"),
+                            ("parents", "Parents"),
+                            ("joint transfer", "Joint Transfer"),
+                            ("birthday", "Birthday"),
+                            ("christmas", "Christmas"),
+                            ("tax", "Tax"),
+                            ("other", "Other"),
+                        ],
+                        max_length=50,
+                    ),
+                ),
+                (
+                    "source",
+                    models.CharField(
+                        blank=True,
+                        choices=[("personal", "Personal"), ("shared", "Shared")],
+                        max_length=50,
+                    ),
+                ),
+                (
+                    "fixed_or_variable",
+                    models.CharField(
+                        blank=True,
+                        choices=[("fixed", "Fixed"), ("variable", "Variable")],
+                        max_length=50,
+                    ),
+                ),
+                (
+                    "account",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="category_rules",
+                        to="tracker.account",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="category_rules",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["priority", "pk"],
+            },
+        ),
+    ]
@@ -28,7 +28,7 @@ class Account(models.Model):
 class AccountBalanceHistory(models.Model):
     account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='balance_history')
     balance = models.DecimalField(max_digits=12, decimal_places=2)
-    timestamp = models.DateTimeField(default=now)
+    timestamp = models.DateTimeField(default=now, db_index=True)
 
     class Meta:
         ordering = ['-timestamp']
@@ -46,22 +46,41 @@ class Transaction(models.Model):
         ('tax', 'Tax'),
     ]
 
+    # The account each type needs, as its Income/Expense row is booked on it
+    REQUIRED_ACCOUNTS = {
+        'income': 'destination_account',
+        'expense': 'origin_account',
+    }
+
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='transactions')
     description = models.TextField()
     type = models.CharField(max_length=10, choices=TRANSACTION_TYPES)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
-    date = models.DateTimeField(default=timezone.now)
+    date = models.DateTimeField(default=timezone.now, db_index=True)
     
     origin_account = models.ForeignKey(Account, related_name='transactions_from', on_delete=models.CASCADE, blank=True, null=True)
     destination_account = models.ForeignKey(Account, related_name='transactions_to', on_delete=models.CASCADE, blank=True, null=True)
 
+    # Set on transactions created by a bank sync, to recognise rows already imported
+    sync_source = models.ForeignKey('SyncSource', related_name='transactions', on_delete=models.SET_NULL, blank=True, null=True)
+    external_id = models.CharField(max_length=255, blank=True, null=True)
+
     objects = TransactionQuerySet.as_manager()
 
+    is_archived = False
+
     def __str__(self):
         return f'{self.type.capitalize()} - {self.amount} on {self.date}'
 
     class Meta:
         ordering = ['-date']
+        indexes = [
+            models.Index(fields=['type', 'date']),
+            models.Index(fields=['user', 'date', 'id']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['sync_source', 'external_id'], name='unique_transaction_external_id'),
+        ]
 
 
 class Income(models.Model):
@@ -79,11 +98,16 @@ class Income(models.Model):
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     category = models.CharField(max_length=50, choices=INCOME_CATEGORIES)
     notes = models.TextField(blank=True, null=True)
-    date = models.DateTimeField(default=timezone.now)
+    date = models.DateTimeField(default=timezone.now, db_index=True)
     
     transaction = models.OneToOneField('Transaction', on_delete=models.CASCADE, related_name='income_transaction')
     account = models.ForeignKey('Account', on_delete=models.CASCADE, related_name='income_account')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['category', 'date']),
+        ]
+
     def __str__(self):
         return f'{self.date} - {self.get_category_display()} income - {self.amount}€'
 
@@ -135,7 +159,7 @@ class Expense(models.Model):
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     category = models.CharField(max_length=50, choices=EXPENSE_CATEGORIES)
     notes = models.TextField(blank=True, null=True)
-    date = models.DateTimeField(default=timezone.now)
+    date = models.DateTimeField(default=timezone.now, db_index=True)
     
     source = models.CharField(max_length=50, choices=SOURCES)
     fixed_or_variable = models.CharField(max_length=50, choices=TYPES)
@@ -143,6 +167,11 @@ class Expense(models.Model):
     transaction = models.OneToOneField('Transaction', on_delete=models.CASCADE, related_name='expense_transaction')
     account = models.ForeignKey('Account', on_delete=models.CASCADE, related_name='expense_account')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['category', 'date']),
+        ]
+
     def __str__(self):
         return f'{self.date} - {self.get_category_display()} expense - {self.amount}€'
 
@@ -157,3 +186,260 @@ class Tax(models.Model):
 
     def __str__(self):
         return f'Tax - {self.amount} for {self.year}'
+
+
+class Budget(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='budgets')
+    category = models.CharField(max_length=50, choices=Expense.EXPENSE_CATEGORIES)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        ordering = ['category']
+        unique_together = ('user', 'category')
+
+    def __str__(self):
+        return f'{self.get_category_display()} budget - {self.amount}€ per month'
+
+
+class CategorySpend(models.Model):
+    """
+    Running total of a user's expenses and archived expenses per category and
+    month, kept up to date by every expense write path of the app and admin
+    (see tracker.budgets). Writes that bypass them, such as queryset updates
+    from a shell or a data migration, leave it off until rebuild_budget_spend runs.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='category_spends')
+    category = models.CharField(max_length=50, choices=Expense.EXPENSE_CATEGORIES)
+    month = models.DateField()
+    amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('user', 'month', 'category')
+
+    def __str__(self):
+        return f'{self.get_category_display()} spend in {self.month:%B %Y} - {self.amount}€'
+
+
+class ArchivedTransaction(models.Model):
+    """
+    Transaction moved out of the hot table by the archive_transactions command.
+
+    Keeps the primary key it had as a Transaction, and its Income/Expense rows use
+    the same related names, so filters and exports work on both tables alike.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_transactions')
+    description = models.TextField()
+    type = models.CharField(max_length=10, choices=Transaction.TRANSACTION_TYPES)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    date = models.DateTimeField(db_index=True)
+
+    origin_account = models.ForeignKey(Account, related_name='archived_transactions_from', on_delete=models.CASCADE, blank=True, null=True)
+    destination_account = models.ForeignKey(Account, related_name='archived_transactions_to', on_delete=models.CASCADE, blank=True, null=True)
+
+    sync_source = models.ForeignKey('SyncSource', related_name='archived_transactions', on_delete=models.SET_NULL, blank=True, null=True)
+    external_id = models.CharField(max_length=255, blank=True, null=True)
+
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    is_archived = True
+
+    def __str__(self):
+        return f'Archived {self.type} - {self.amount} on {self.date}'
+
+    class Meta:
+        ordering = ['-date']
+
+
+class ArchivedIncome(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    category = models.CharField(max_length=50, choices=Income.INCOME_CATEGORIES)
+    notes = models.TextField(blank=True, null=True)
+    date = models.DateTimeField()
+
+    transaction = models.OneToOneField(ArchivedTransaction, on_delete=models.CASCADE, related_name='income_transaction')
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='archived_income_account')
+
+    def __str__(self):
+        return f'{self.date} - {self.get_category_display()} archived income - {self.amount}€'
+
+
+class ArchivedExpense(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    category = models.CharField(max_length=50, choices=Expense.EXPENSE_CATEGORIES)
+    notes = models.TextField(blank=True, null=True)
+    date = models.DateTimeField()
+
+    source = models.CharField(max_length=50, choices=Expense.SOURCES)
+    fixed_or_variable = models.CharField(max_length=50, choices=Expense.TYPES)
+
+    transaction = models.OneToOneField(ArchivedTransaction, on_delete=models.CASCADE, related_name='expense_transaction')
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='archived_expense_account')
+
+    def __str__(self):
+        return f'{self.date} - {self.get_category_display()} archived expense - {self.amount}€'
+
+
+class OpeningBalance(models.Model):
+    """
+    Balance an account carries over from its archived transactions, added to the
+    balance computed from the hot Transaction table.
+    """
+    account = models.OneToOneField(Account, on_delete=models.CASCADE, related_name='opening_balance')
+    balance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f'{self.account.name} - opening balance {self.balance}'
+
+
+class ArchiveCheckpoint(models.Model):
+    """
+    How far a user's transactions have been archived, with the income and
+    expense totals of the archived transactions.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='archive_checkpoint')
+    cutoff = models.DateTimeField()
+    income = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    expenses = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f'{self.user} - archived before {self.cutoff}'
+
+
+class IngestionBatch(models.Model):
+    """
+    Outcome of an NDJSON ingestion request sent with an Idempotency-Key header,
+    returned again when the same key is retried.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ingestion_batches')
+    key = models.CharField(max_length=255)
+    rows = models.PositiveIntegerField(default=0)
+    created = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ('user', 'key')
+
+    def __str__(self):
+        return f'{self.user} - batch {self.key} ({self.created} of {self.rows} rows created)'
+
+
+class ApiToken(models.Model):
+    """
+    Bearer token authenticating API clients as a user (see tracker.api). Only a
+    hash of the token is stored; the token itself is shown once, when created
+    by the create_api_token command. Kept in the default database with the users.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='api_tokens')
+    name = models.CharField(max_length=100)
+    key_hash = models.CharField(max_length=64, unique=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f'{self.user} - {self.name}'
+
+
+class SyncSource(models.Model):
+    """
+    Bank feed an account's transactions are synced from. The watermark is the
+    date of the newest row imported, so later syncs skip everything older.
+    """
+    PROVIDERS = [
+        ('fake', 'Fake bank feed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sync_sources')
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='sync_sources')
+    name = models.CharField(max_length=100)
+    provider = models.CharField(max_length=20, choices=PROVIDERS)
+    watermark = models.DateTimeField(blank=True, null=True)
+    last_synced_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        unique_together = ('user', 'name')
+
+    def __str__(self):
+        return f'{self.name} ({self.get_provider_display()})'
+
+
+class CategoryRule(models.Model):
+    """
+    Categorises transactions whose description matches the pattern and which meet
+    the optional amount, account and type conditions (see tracker.categorization).
+    Rules are tried by ascending priority and the first match wins.
+    """
+    MATCH_TYPES = [
+        ('contains', 'Contains'),
+        ('regex', 'Regular expression'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='category_rules')
+    priority = models.PositiveIntegerField(default=100)
+    match_type = models.CharField(max_length=10, choices=MATCH_TYPES, default='contains')
+    pattern = models.CharField(max_length=255)
+    is_active = models.BooleanField(default=True)
+
+    # Conditions, ignored when empty
+    transaction_type = models.CharField(max_length=10, choices=Transaction.TRANSACTION_TYPES, blank=True)
+    min_amount = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    max_amount = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='category_rules', blank=True, null=True)
+
+    # Values set on matching transactions, left unchanged when empty
+    expense_category = models.CharField(max_length=50, choices=Expense.EXPENSE_CATEGORIES, blank=True)
+    income_category = models.CharField(max_length=50, choices=Income.INCOME_CATEGORIES, blank=True)
+    source = models.CharField(max_length=50, choices=Expense.SOURCES, blank=True)
+    fixed_or_variable = models.CharField(max_length=50, choices=Expense.TYPES, blank=True)
+
+    class Meta:
+        ordering = ['priority', 'pk']
+
+    def __str__(self):
+        return f'{self.get_match_type_display()} "{self.pattern}"'
+
+    def clean(self):
+        from tracker.categorization import validate_pattern
+        validate_pattern(self.match_type, self.pattern)
+
+
+class TaxReport(models.Model):
+    """
+    Yearly tax report of a user, built in the background by tracker.tax_reports and
+    kept until a transaction dated in that year changes (is_stale).
+    """
+    STATUSES = [
+        ('pending', 'Pending'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='tax_reports')
+    year = models.IntegerField()
+    status = models.CharField(max_length=10, choices=STATUSES, default='pending')
+    is_stale = models.BooleanField(default=True)
+    data = models.JSONField(blank=True, null=True)
+    csv_file = models.FileField(upload_to='tax-reports/', blank=True)
+    error = models.TextField(blank=True)
+    requested_at = models.DateTimeField(default=timezone.now)
+    generated_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        unique_together = ('user', 'year')
+
+    def __str__(self):
+        return f'Tax report {self.year} - {self.user}'
+
+
+class ShardAssignment(models.Model):
+    """
+    Pins a user's data to a database, overriding the consistent hashing of
+    tracker.sharding. Kept in the default database with the users.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='shard_assignment')
+    database = models.CharField(max_length=100)
+    assigned_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f'{self.user} - {self.database}'
@@ -0,0 +1,129 @@
+import heapq
+import math
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from tracker.models import Account, AccountBalanceHistory
+from tracker.account_directory import get_directory_version
+
+PERIODS = ('day', 'week', 'month')
+DEFAULT_MAX_POINTS = 200
+MAX_POINTS_LIMIT = 1000
+NET_WORTH_TIMEOUT = 60 * 60
+
+# Virtual tax accounts hold provisions set aside from real accounts, so they are
+# reported on their own but not added to the net worth total
+EXCLUDED_FROM_TOTAL = ('virtual_tax',)
+
+
+def get_period_start(timestamp, period):
+    """
+    Returns the first day of the day/week/month containing the timestamp, in the current timezone.
+    """
+    day = timezone.localdate(timestamp)
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    if period == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def get_next_period_start(day, period):
+    if period == 'week':
+        return day + timedelta(weeks=1)
+    if period == 'month':
+        return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return day + timedelta(days=1)
+
+
+def iter_account_history(account_id, account_type):
+    """
+    Yields (timestamp, account_id, account_type, balance) for one account, oldest first.
+    """
+    history = (
+        AccountBalanceHistory.objects.filter(account_id=account_id)
+        .order_by('timestamp')
+        .values_list('timestamp', 'balance')
+        .iterator(chunk_size=2000)
+    )
+    for timestamp, balance in history:
+        yield timestamp, account_id, account_type, balance
+
+
+def iter_net_worth(user, period='month', by_type=False):
+    """
+    Yields (period_start, {group: balance}) with the closing balances of every period.
+
+    Each account's history is read as its own ordered stream and the streams are
+    merged by timestamp, carrying forward each account's last known balance.
+    Periods without any change repeat the previous values, so the series is regular.
+    """
+    accounts = Account.objects.filter(user=user).values_list('pk', 'account_type')
+    merged = heapq.merge(*(iter_account_history(pk, account_type) for pk, account_type in accounts))
+
+    balances = {}
+    account_types = {}
+    current_period = None
+
+    def snapshot():
+        groups = {'total': Decimal(0)}
+        for account_id, balance in balances.items():
+            account_type = account_types[account_id]
+            if account_type not in EXCLUDED_FROM_TOTAL:
+                groups['total'] += balance
+            if by_type:
+                groups[account_type] = groups.get(account_type, Decimal(0)) + balance
+        return groups
+
+    for timestamp, account_id, account_type, balance in merged:
+        period_start = get_period_start(timestamp, period)
+
+        if current_period is not None and period_start != current_period:
+            # Close the current period and fill any quiet periods in between
+            values = snapshot()
+            while current_period < period_start:
+                yield current_period, values
+                current_period = get_next_period_start(current_period, period)
+
+        current_period = period_start
+        balances[account_id] = balance
+        account_types[account_id] = account_type
+
+    if current_period is not None:
+        yield current_period, snapshot()
+
+
+def downsample(points, max_points):
+    """
+    Keeps at most max_points points, taking the closing value of each group of consecutive points.
+    """
+    if len(points) <= max_points:
+        return points
+
+    step = math.ceil(len(points) / max_points)
+    return [points[min(i + step, len(points)) - 1] for i in range(0, len(points), step)]
+
+
+def get_net_worth_series(user, period='month', by_type=False, max_points=DEFAULT_MAX_POINTS):
+    """
+    Returns the downsampled net worth series as a list of {'date': ..., group: value} dicts.
+
+    Results are cached per user under the account data version, which is bumped
+    whenever an account balance or its history changes.
+    """
+    cache_key = f'tracker:net-worth:{user.pk}:{get_directory_version(user.pk)}:{period}:{int(by_type)}:{max_points}'
+    series = cache.get(cache_key)
+    if series is not None:
+        return series
+
+    points = downsample(list(iter_net_worth(user, period, by_type)), max_points)
+    series = [
+        {'date': period_start.isoformat(), **{group: float(value) for group, value in values.items()}}
+        for period_start, values in points
+    ]
+
+    cache.set(cache_key, series, timeout=NET_WORTH_TIMEOUT)
+    return series
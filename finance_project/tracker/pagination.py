@@ -0,0 +1,240 @@
+import hashlib
+import json
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db import DatabaseError, connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+
+from tracker import sharding
+
+# Below this many rows an exact COUNT(*) is cheap enough to always run
+EXACT_COUNT_THRESHOLD = 10000
+
+COUNT_CACHE_TIMEOUT = 5 * 60
+
+# Query parameters that move through the results rather than select them
+PAGING_PARAMS = {'page', 'cursor', 'scroll', 'format'}
+
+
+def get_page_query(params):
+    """
+    Returns the query string of the request without its page and cursor, ending
+    with '&' unless empty, so page links keep the filters: ?{{ page_query }}page=2
+    """
+    params = params.copy()
+    for key in ('page', 'cursor'):
+        params.pop(key, None)
+    query = params.urlencode()
+    return f'{query}&' if query else ''
+
+
+def get_estimated_count(queryset):
+    """
+    Returns the planner's row estimate for an unfiltered queryset on PostgreSQL,
+    or None when no estimate is available.
+    """
+    if not isinstance(queryset, QuerySet) or queryset.query.where or queryset.query.distinct:
+        return None
+
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [queryset.model._meta.db_table])
+        row = cursor.fetchone()
+
+    # reltuples is -1 until the table has been vacuumed or analyzed
+    return row[0] if row and row[0] >= 0 else None
+
+
+def get_planner_estimate(queryset):
+    """
+    Returns PostgreSQL's estimate of the number of rows a queryset of one user's
+    rows returns, or None on other databases, which have no per-query estimate.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+
+    sql, params = queryset.order_by().query.sql_with_params()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+    except DatabaseError:
+        return None
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def get_bounded_count(queryset, limit=EXACT_COUNT_THRESHOLD):
+    """
+    Counts the queryset's rows up to limit + 1, so the cost of the count is
+    bounded however many rows match.
+    """
+    return queryset.order_by()[:limit + 1].count()
+
+
+def _watermark_key(user_id):
+    return f'tracker:count-watermark:{user_id}'
+
+
+def get_count_watermark(user_id):
+    """
+    Returns the user's data watermark, which moves whenever their transactions
+    change, initialising it if missing.
+    """
+    watermark = cache.get(_watermark_key(user_id))
+    if watermark is None:
+        cache.add(_watermark_key(user_id), 1, timeout=None)
+        watermark = cache.get(_watermark_key(user_id), 1)
+    return watermark
+
+
+def bump_count_watermark(user_id):
+    try:
+        return cache.incr(_watermark_key(user_id))
+    except ValueError:
+        # The watermark key was evicted or never set
+        watermark = get_count_watermark(user_id) + 1
+        cache.set(_watermark_key(user_id), watermark, timeout=None)
+        return watermark
+
+
+def schedule_count_invalidation(user_ids):
+    """
+    Moves the watermark of each user once the outermost atomic block commits, or
+    right away outside of one, so counts cached from then on include the change.
+
+    Each user is bumped once per commit, however many writes of theirs the
+    block made.
+    """
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+
+    pending = sharding.get_commit_batch('count-invalidations', set, flush_count_invalidations)
+    if pending is None:
+        flush_count_invalidations(user_ids)
+    else:
+        pending.update(user_ids)
+
+
+def flush_count_invalidations(user_ids):
+    for user_id in user_ids:
+        bump_count_watermark(user_id)
+
+
+def get_count_key(user_id, params):
+    selected = sorted((key, value) for key, values in params.lists() if key not in PAGING_PARAMS for value in values)
+    digest = hashlib.md5(urlencode(selected).encode()).hexdigest()
+    return f'tracker:transaction-count:{user_id}:{get_count_watermark(user_id)}:{digest}'
+
+
+def count_queryset(queryset):
+    """
+    Returns (count, is_approximate): an exact count up to EXACT_COUNT_THRESHOLD
+    rows, and above it the planner's estimate when there is one and it is not
+    below the rows already counted.
+    """
+    count = get_bounded_count(queryset, EXACT_COUNT_THRESHOLD)
+    if count <= EXACT_COUNT_THRESHOLD:
+        return count, False
+
+    estimate = get_planner_estimate(queryset)
+    if estimate is not None and estimate >= count:
+        return estimate, True
+    return queryset.count(), False
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that skips COUNT(*) on large unfiltered tables and uses the
+    planner's estimate instead, so page counts are approximate there.
+    """
+
+    @cached_property
+    def count(self):
+        estimate = get_estimated_count(self.object_list)
+        if estimate is not None and estimate > EXACT_COUNT_THRESHOLD:
+            return estimate
+        return super().count
+
+
+class ReadAheadPage(Page):
+    """
+    Page that knows whether a next page exists from the extra row read with it,
+    rather than from the paginator's count.
+    """
+
+    def __init__(self, object_list, number, paginator, has_next):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Paginator for one user's filtered transactions that caches the count per
+    filter, keyed by the user's data watermark, and shows planner estimates on
+    large results (is_approximate).
+
+    The count only labels the pages. Each page reads one row more than it shows
+    to tell whether there is a next one, and an approximate count does not cap
+    the page numbers, so every row stays reachable however far off the estimate is.
+
+    The object list is a queryset or a CombinedResults of the hot and archived
+    querysets. Only the last part of a CombinedResults may be estimated, as the
+    counts of the others decide where each page starts.
+    """
+
+    def __init__(self, object_list, per_page, user_id, params, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.user_id = user_id
+        self.params = params
+        self._approximate = False
+
+    @property
+    def is_approximate(self):
+        self.count
+        return self._approximate
+
+    @cached_property
+    def count(self):
+        key = get_count_key(self.user_id, self.params)
+        parts = getattr(self.object_list, 'querysets', [self.object_list])
+        cached = cache.get(key)
+        # Counts cached for results split into other parts are not reused
+        if cached is None or len(cached[0]) != len(parts):
+            counts = [(part.count(), False) for part in parts[:-1]] + [count_queryset(parts[-1])]
+            cached = ([count for count, _ in counts], any(approximate for _, approximate in counts))
+            cache.set(key, cached, timeout=COUNT_CACHE_TIMEOUT)
+
+        counts, self._approximate = cached
+        if hasattr(self.object_list, 'querysets'):
+            self.object_list.counts = counts
+        return sum(counts)
+
+    def validate_number(self, number):
+        if not self.is_approximate:
+            return super().validate_number(number)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger("That page number is not an integer")
+        if number < 1:
+            raise EmptyPage("That page number is less than 1")
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        return ReadAheadPage(rows[:self.per_page], number, self, has_next=len(rows) > self.per_page)
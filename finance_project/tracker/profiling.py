@@ -0,0 +1,206 @@
+import cProfile
+import io
+import json
+import marshal
+import pstats
+import traceback
+import uuid
+from contextlib import ExitStack
+from time import perf_counter
+
+from django.conf import settings
+from django.core import signing
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import connections
+from django.utils import timezone
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_PARAM = '_profile'
+PROFILE_MODES = ('sql', 'cprofile')
+PROFILE_TOKEN_SALT = 'tracker.profiling'
+PROFILE_TOKEN_MAX_AGE = 60 * 60 * 24
+
+# Number of project frames kept as the call site of each query
+CALL_SITE_DEPTH = 3
+
+
+def get_profile_storage():
+    return FileSystemStorage(location=getattr(settings, 'PROFILING_ROOT', settings.BASE_DIR / 'profiles'))
+
+
+def make_profile_token(mode='sql'):
+    """
+    Returns a signed value for the X-Profile header enabling profiling in the given mode.
+    """
+    return signing.TimestampSigner(salt=PROFILE_TOKEN_SALT).sign(mode)
+
+
+def get_profile_mode(request):
+    """
+    Returns the profiling mode requested, or None when the request should not be profiled.
+
+    Profiling is enabled by a signed X-Profile header, or by a `_profile` query
+    parameter from a staff user. The user is only loaded when the parameter is present.
+    """
+    token = request.headers.get(PROFILE_HEADER)
+    if token:
+        try:
+            mode = signing.TimestampSigner(salt=PROFILE_TOKEN_SALT).unsign(token, max_age=PROFILE_TOKEN_MAX_AGE)
+        except signing.BadSignature:
+            return None
+        return mode if mode in PROFILE_MODES else None
+
+    mode = request.GET.get(PROFILE_PARAM)
+    if mode is not None:
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_staff:
+            return mode if mode in PROFILE_MODES else 'sql'
+
+    return None
+
+
+def get_call_site():
+    """
+    Returns the innermost project frames that led to the current query.
+    """
+    base_dir = str(settings.BASE_DIR)
+    frames = [
+        f'{frame.filename.removeprefix(base_dir)}:{frame.lineno} in {frame.name}'
+        for frame in traceback.extract_stack()
+        if frame.filename.startswith(base_dir) and 'site-packages' not in frame.filename
+        and not frame.filename.endswith('profiling.py')
+    ]
+    return frames[-CALL_SITE_DEPTH:]
+
+
+class QueryRecorder:
+    """
+    Database execute wrapper recording every query with its duration and call site.
+    """
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'database': self.alias,
+                'sql': sql,
+                'params': repr(params)[:500],
+                'many': many,
+                'duration_ms': round((perf_counter() - start) * 1000, 3),
+                'call_site': get_call_site(),
+            })
+
+
+class ProfilingMiddleware:
+    """
+    Captures SQL queries and optionally cProfile stats for selected requests.
+
+    Captures are saved to PROFILING_ROOT as a JSON file, plus a .pstats file in
+    cprofile mode, and listed in the admin. Requests that do not ask for
+    profiling only pay for a header and query parameter lookup.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = get_profile_mode(request)
+        if mode is None:
+            return self.get_response(request)
+
+        return self.profile(request, mode)
+
+    def profile(self, request, mode):
+        recorders = [QueryRecorder(connection.alias) for connection in connections.all()]
+        profiler = cProfile.Profile() if mode == 'cprofile' else None
+
+        started_at = timezone.now()
+        start = perf_counter()
+        with ExitStack() as stack:
+            for connection, recorder in zip(connections.all(), recorders):
+                stack.enter_context(connection.execute_wrapper(recorder))
+
+            if profiler:
+                profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                if profiler:
+                    profiler.disable()
+        duration_ms = round((perf_counter() - start) * 1000, 3)
+
+        queries = [query for recorder in recorders for query in recorder.queries]
+        capture_id = f"{started_at:%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}"
+        capture = {
+            'id': capture_id,
+            'started_at': started_at.isoformat(),
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status_code': response.status_code,
+            'duration_ms': duration_ms,
+            'mode': mode,
+            'query_count': len(queries),
+            'query_duration_ms': round(sum(query['duration_ms'] for query in queries), 3),
+            'queries': queries,
+        }
+        save_capture(capture, profiler)
+
+        response['X-Profile-Id'] = capture_id
+        return response
+
+
+def save_capture(capture, profiler=None):
+    storage = get_profile_storage()
+    storage.save(f"{capture['id']}.json", ContentFile(json.dumps(capture, indent=2).encode()))
+
+    if profiler:
+        profiler.create_stats()
+        # Same format as Profile.dump_stats, so the file loads with pstats or snakeviz
+        storage.save(f"{capture['id']}.pstats", ContentFile(marshal.dumps(profiler.stats)))
+
+
+def list_captures():
+    """
+    Returns the summary of every saved capture, newest first.
+    """
+    storage = get_profile_storage()
+    if not storage.exists(''):
+        return []
+
+    _, filenames = storage.listdir('')
+    captures = []
+    for filename in sorted((name for name in filenames if name.endswith('.json')), reverse=True):
+        with storage.open(filename) as f:
+            capture = json.load(f)
+        capture.pop('queries')
+        capture['has_pstats'] = storage.exists(f"{capture['id']}.pstats")
+        captures.append(capture)
+    return captures
+
+
+def load_capture(capture_id):
+    """
+    Returns a saved capture with its pstats report, or None if it does not exist.
+    """
+    storage = get_profile_storage()
+    if not capture_id.replace('-', '').isalnum() or not storage.exists(f'{capture_id}.json'):
+        return None
+
+    with storage.open(f'{capture_id}.json') as f:
+        capture = json.load(f)
+
+    capture['pstats_report'] = ''
+    if storage.exists(f'{capture_id}.pstats'):
+        report = io.StringIO()
+        stats = pstats.Stats(storage.path(f'{capture_id}.pstats'), stream=report)
+        stats.sort_stats('cumulative').print_stats(40)
+        capture['pstats_report'] = report.getvalue()
+
+    return capture
@@ -7,7 +7,13 @@ from decimal import Decimal, InvalidOperation
 
 from import_export import resources, fields
 from tracker.models import Transaction, Account, Expense, Income
-from tracker.tracker_helpers import adjust_account_balances
+from tracker.ledger import schedule_transaction_update
+from tracker.account_directory import get_account_directory
+from tracker.metrics import instrument
+from tracker.budgets import record_expense
+from tracker.categorization import get_rule_matcher
+from tracker.duplicates import is_stored_duplicate
+from tracker.importers import check_required_account
 from import_export.widgets import DateWidget, ForeignKeyWidget
 from import_export.results import RowResult
 
@@ -102,6 +108,26 @@ class TransactionImportResource(resources.ModelResource):
             'amount',          
         )
 
+    def before_import(self, dataset, **kwargs):
+        # Load the user's accounts once for the whole import instead of once per row
+        user = kwargs.get('user')
+        self.account_directory = get_account_directory(user) if user else None
+        self.rule_matcher = get_rule_matcher(user) if user else None
+
+    def resolve_account_id(self, name, user):
+        """
+        Resolves an account name to the id of one of the user's accounts.
+        """
+        if not name:
+            return None
+
+        directory = getattr(self, 'account_directory', None)
+        if directory is None:
+            directory = self.account_directory = get_account_directory(user)
+
+        return directory.resolve(name).id
+
+    @instrument('import_row')
     def import_row(self, row, *args, **kwargs):
         # Check if it's a dry run and get the user
         dry_run = kwargs.get('dry_run', False)
@@ -126,17 +152,17 @@ class TransactionImportResource(resources.ModelResource):
         # Step 3: Validate the transaction type
         if row['type'] not in dict(Transaction.TRANSACTION_TYPES):
             raise ValueError(f"Invalid transaction type: {row['type']}")
+        check_required_account(row['type'], row)
 
-        # Step 4: Resolve ForeignKey relationships for accounts
-        try:
-            row['origin_account'] = (
-                Account.objects.get(name=row['origin_account']) if row['origin_account'] else None
-            )
-            row['destination_account'] = (
-                Account.objects.get(name=row['destination_account']) if row['destination_account'] else None
-            )
-        except Account.DoesNotExist as e:
-            raise ValueError(f"Account not found: {e}")
+        # Step 4: Resolve ForeignKey relationships for accounts from the user's account directory
+        row['origin_account'] = self.resolve_account_id(row['origin_account'], user)
+        row['destination_account'] = self.resolve_account_id(row['destination_account'], user)
+
+        # Fill empty categories from the user's categorisation rules
+        rule_matcher = getattr(self, 'rule_matcher', None)
+        if rule_matcher is None:
+            rule_matcher = self.rule_matcher = get_rule_matcher(user)
+        rule_matcher.categorize_record(row)
 
         # Step 5: Check if transaction already exists, to avoid duplicates
         transaction = Transaction.objects.filter(
@@ -144,10 +170,19 @@ class TransactionImportResource(resources.ModelResource):
             type=row['type'],
             description=row['description'],
             amount=row['amount'],
-            origin_account=row.get('origin_account'),
-            destination_account=row.get('destination_account'),
+            origin_account_id=row.get('origin_account'),
+            destination_account_id=row.get('destination_account'),
         ).first()
 
+        # Optionally skip rows that look like a stored transaction with a slightly different description or date
+        if not transaction and kwargs.get('skip_duplicates') and is_stored_duplicate(
+            user, row['date'], row['type'], row['description'], row['amount'],
+            row.get('origin_account'), row.get('destination_account'),
+        ):
+            row_result = RowResult()
+            row_result.import_type = RowResult.IMPORT_TYPE_SKIP
+            return row_result
+
         # Step 6: Create Transaction instance if it doesn't exist
         if not transaction:
             transaction = Transaction(
@@ -156,13 +191,13 @@ class TransactionImportResource(resources.ModelResource):
                 type=row['type'],
                 description=row['description'],
                 amount=row['amount'],
-                origin_account=row.get('origin_account'),
-                destination_account=row.get('destination_account'),
+                origin_account_id=row.get('origin_account'),
+                destination_account_id=row.get('destination_account'),
             )
             # Do not save during dry run
             if not dry_run:
                 transaction.save()
-                adjust_account_balances(transaction)
+                schedule_transaction_update(transaction)
         else:
             logger.debug(f"Found existing transaction: {transaction}")
 
@@ -178,7 +213,7 @@ class TransactionImportResource(resources.ModelResource):
                 )
         elif transaction.type == 'expense':
             if not dry_run:
-                Expense.objects.create(
+                expense = Expense.objects.create(
                     transaction=transaction,
                     category=row.get('expense_category', ''),
                     source=row.get('source', ''),
@@ -187,6 +222,7 @@ class TransactionImportResource(resources.ModelResource):
                     account=transaction.origin_account,
                     date=transaction.date,
                 )
+                record_expense(expense)
 
         # Create a RowResult instance
         row_result = RowResult()
@@ -0,0 +1,461 @@
+import hashlib
+import weakref
+from bisect import bisect
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache, wraps
+
+from django.apps import apps
+from django.conf import settings
+from django.core import checks
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache
+from django.db import DEFAULT_DB_ALIAS, connections, transaction as db_transaction
+from django.db.models import AutoField
+from django.http import FileResponse
+
+from tracker.models import User, ShardAssignment
+from tracker.account_directory import invalidate_account_directory
+
+# Points each shard gets on the hash ring; more points spread users more evenly
+VIRTUAL_NODES = 100
+
+SHARD_CACHE_TIMEOUT = 5 * 60
+
+MOVE_BATCH_SIZE = 5000
+
+# Tracker models kept in the default database; every other tracker model lives in its user's shard
+UNSHARDED_MODELS = {'user', 'shardassignment', 'apitoken'}
+
+# Database of the user being served; unset outside of a request or use_shard() block
+_current_shard = ContextVar('tracker_shard', default=None)
+
+# Work batched until commit per connection, by name: (weak reference to its flush, batch)
+_commit_batches = weakref.WeakKeyDictionary()
+
+
+def is_sharding_enabled():
+    return bool(getattr(settings, 'TRACKER_SHARDS', None))
+
+
+def get_shard_aliases():
+    """
+    Returns the databases user data is spread over, just the default one when sharding is off.
+    """
+    return list(getattr(settings, 'TRACKER_SHARDS', None) or [DEFAULT_DB_ALIAS])
+
+
+def is_sharded_model(model):
+    return model._meta.app_label == 'tracker' and model._meta.model_name not in UNSHARDED_MODELS
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+
+@lru_cache(maxsize=8)
+def build_hash_ring(aliases):
+    """
+    Returns the sorted points of the hash ring and the shard owning each one.
+
+    Each shard owns VIRTUAL_NODES points, so adding a shard only takes over the
+    users whose points now fall just before one of its own, about 1/N of them.
+    """
+    points = sorted((_hash(f'{alias}:{node}'), alias) for alias in aliases for node in range(VIRTUAL_NODES))
+    return [point for point, _ in points], [alias for _, alias in points]
+
+
+def get_hashed_shard(user_id, aliases=None):
+    points, owners = build_hash_ring(tuple(aliases or get_shard_aliases()))
+    return owners[bisect(points, _hash(str(user_id))) % len(points)]
+
+
+def _assignment_key(user_id):
+    return f'tracker:shard-assignment:{user_id}'
+
+
+def get_user_shard(user):
+    """
+    Returns the database holding a user's data: their ShardAssignment if any,
+    otherwise their place on the hash ring.
+
+    The assignment is cached, as every request looks it up, so the cache must be
+    shared by every process (see check_shard_cache) for a move to reach them all.
+    The ring is not cached, so a change to TRACKER_SHARDS applies at once.
+    """
+    if not is_sharding_enabled():
+        return DEFAULT_DB_ALIAS
+
+    user_id = user.pk if hasattr(user, 'pk') else user
+    alias = cache.get(_assignment_key(user_id))
+    if alias is None:
+        alias = ShardAssignment.objects.filter(user_id=user_id).values_list('database', flat=True).first() or ''
+        cache.set(_assignment_key(user_id), alias, timeout=SHARD_CACHE_TIMEOUT)
+    return alias or get_hashed_shard(user_id)
+
+
+def assign_user_shard(user_id, alias):
+    """
+    Pins a user to a database. Only records the assignment, see move_user_shard to move their data.
+    """
+    ShardAssignment.objects.update_or_create(user_id=user_id, defaults={'database': alias})
+    cache.set(_assignment_key(user_id), alias, timeout=SHARD_CACHE_TIMEOUT)
+
+
+def check_shard_cache(app_configs, **kwargs):
+    """
+    System check: with sharding on, the cached shard assignments must live in a
+    cache every process shares, or processes keep sending moved users to their
+    old shard until the cached entry expires.
+    """
+    if not is_sharding_enabled():
+        return []
+    backend = settings.CACHES[DEFAULT_CACHE_ALIAS]['BACKEND']
+    if backend == 'django.core.cache.backends.locmem.LocMemCache':
+        return [checks.Error(
+            "TRACKER_SHARDS needs a cache shared by every process, such as Redis or Memcached.",
+            hint="Set CACHE_URL, e.g. to a Redis server; the local memory cache is per process.",
+            id='tracker.E001',
+        )]
+    return []
+
+
+def mirror_user(user, alias=None):
+    """
+    Copies the user's row into their shard, where the foreign keys and joins of
+    their data point at it. The copy in the default database stays authoritative.
+    """
+    alias = alias or get_user_shard(user)
+    if alias == DEFAULT_DB_ALIAS:
+        return
+    values = {field.attname: getattr(user, field.attname) for field in user._meta.concrete_fields if not field.primary_key}
+    User.objects.using(alias).update_or_create(pk=user.pk, defaults=values)
+
+
+def get_sharded_models():
+    """
+    Returns the sharded models, each after the sharded models it has foreign keys to.
+    """
+    remaining = [model for model in apps.get_app_config('tracker').get_models() if is_sharded_model(model)]
+    ordered = []
+    while remaining:
+        for model in remaining:
+            dependencies = {
+                field.related_model for field in model._meta.concrete_fields
+                if field.is_relation and is_sharded_model(field.related_model) and field.related_model is not model
+            }
+            if dependencies.issubset(ordered):
+                ordered.append(model)
+                remaining.remove(model)
+                break
+        else:
+            raise ValueError(f"Circular foreign keys between {remaining}")
+    return ordered
+
+
+def get_user_lookup(model):
+    """
+    Returns the lookup from a sharded model to the user owning its rows, e.g. 'transaction__user'.
+    """
+    if any(field.name == 'user' for field in model._meta.concrete_fields):
+        return 'user'
+    for field in model._meta.concrete_fields:
+        if field.is_relation and is_sharded_model(field.related_model):
+            return f'{field.name}__{get_user_lookup(field.related_model)}'
+    raise ValueError(f"{model.__name__} has no path to a user")
+
+
+def reserve_primary_keys(model, alias, count):
+    """
+    Takes the next `count` values of a model's primary key sequence in a database
+    and returns them, as if that many rows had been inserted.
+    """
+    connection = connections[alias]
+    table, column = model._meta.db_table, model._meta.pk.column
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                'SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)', [table, column, count]
+            )
+            return [row[0] for row in cursor.fetchall()]
+        if connection.vendor == 'sqlite':
+            # AUTOINCREMENT tables continue from sqlite_sequence, which has no row until the first insert
+            quoted_table, quoted_column = connection.ops.quote_name(table), connection.ops.quote_name(column)
+            cursor.execute(
+                f'SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = %s), 0), '
+                f'COALESCE((SELECT MAX({quoted_column}) FROM {quoted_table}), 0))',
+                [table],
+            )
+            last = cursor.fetchone()[0]
+            cursor.execute('DELETE FROM sqlite_sequence WHERE name = %s', [table])
+            cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)', [table, last + count])
+            return list(range(last + 1, last + count + 1))
+    raise NotImplementedError(f"Reserving primary keys is not supported on {connection.vendor}")
+
+
+def get_primary_key_source(model):
+    """
+    Returns the model whose sequence gives the model its primary keys: the model
+    itself, or for an archive table, the hot table its rows were moved from.
+    """
+    if isinstance(model._meta.pk, AutoField):
+        return model
+    # Imported here, as archiving routes its writes through this module
+    from tracker.archive import ARCHIVE_MODELS
+    for hot_model, archive_model in ARCHIVE_MODELS:
+        if archive_model is model:
+            return hot_model
+    raise ValueError(f"{model.__name__} has no primary key sequence to copy its rows under")
+
+
+def copy_user_rows(model, user, source, target, pk_maps, batch_size):
+    """
+    Copies a user's rows of one model between databases under new primary keys,
+    as the target's sequences are its own, pointing their foreign keys at the
+    copies made before. Records old -> new primary keys in pk_maps.
+
+    Archived rows keep the primary key they had in the hot table, so their new
+    keys are taken from the target's hot table sequence, where no hot or
+    archived row of the target can ever have them.
+    """
+    relations = [
+        field for field in model._meta.concrete_fields if field.is_relation and is_sharded_model(field.related_model)
+    ]
+    key_source = get_primary_key_source(model)
+    pk_map = pk_maps[model] = {}
+    rows = model.objects.using(source).filter(**{get_user_lookup(model): user}).order_by('pk')
+
+    def create(batch):
+        if key_source is model:
+            for obj in batch:
+                obj.pk = None
+        else:
+            for obj, pk in zip(batch, reserve_primary_keys(key_source, target, len(batch))):
+                obj.pk = pk
+        return model.objects.using(target).bulk_create(batch)
+
+    batch, old_pks = [], []
+    for obj in rows.iterator(chunk_size=batch_size):
+        for field in relations:
+            value = getattr(obj, field.attname)
+            if value is not None:
+                setattr(obj, field.attname, pk_maps[field.related_model][value])
+        old_pks.append(obj.pk)
+        batch.append(obj)
+        if len(batch) == batch_size:
+            pk_map.update(zip(old_pks, (obj.pk for obj in create(batch))))
+            batch, old_pks = [], []
+    if batch:
+        pk_map.update(zip(old_pks, (obj.pk for obj in create(batch))))
+    return len(pk_map)
+
+
+def move_user_data(user, target, batch_size=MOVE_BATCH_SIZE):
+    """
+    Moves a user's data to another shard and returns the number of rows moved per model.
+
+    Step by step, so an interruption never loses data: the rows are copied to
+    the target in one transaction, the user is then pinned to the target, and
+    only then removed from the source. Writes made by the user while moving are
+    not carried over, so it is meant to run while they are inactive.
+    """
+    source = get_user_shard(user)
+    if target not in get_shard_aliases():
+        raise ValueError(f"{target} is not one of the shards: {', '.join(get_shard_aliases())}")
+    if source == target:
+        return {}
+
+    models = get_sharded_models()
+    if any(model.objects.using(target).filter(**{get_user_lookup(model): user}).exists() for model in models):
+        raise ValueError(f"{user} already has data in {target}, left by an interrupted move?")
+
+    # Step 1: Copy the user row and then their data, parents first
+    mirror_user(user, target)
+    pk_maps = {}
+    moved = {}
+    with db_transaction.atomic(using=target):
+        for model in models:
+            moved[model.__name__] = copy_user_rows(model, user, source, target, pk_maps, batch_size)
+
+    # Step 2: Point the user at the copies, and drop the cached lookups holding the old primary keys
+    assign_user_shard(user.pk, target)
+    # Imported here, as the index routes its own writes through this module
+    from tracker.description_index import invalidate_description_index
+    invalidate_account_directory(user.pk)
+    invalidate_description_index(user.pk)
+
+    # Step 3: Remove the originals, children first
+    with db_transaction.atomic(using=source):
+        for model in reversed(models):
+            model.objects.using(source).filter(**{get_user_lookup(model): user}).delete()
+    return moved
+
+
+def get_current_db():
+    return _current_shard.get() or DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def use_shard(alias):
+    """
+    Routes the tracker queries run inside the block to the given database.
+    """
+    token = _current_shard.set(alias)
+    try:
+        yield alias
+    finally:
+        _current_shard.reset(token)
+
+
+def use_user_shard(user):
+    return use_shard(get_user_shard(user))
+
+
+def activate_user_shard(user):
+    """
+    Routes the rest of the request to the user's shard, or to the default database for anonymous users.
+    """
+    _current_shard.set(get_user_shard(user) if user.is_authenticated else None)
+
+
+def iter_shards():
+    """
+    Yields each shard alias with its queries routed to it, for commands that work across users.
+    """
+    for alias in get_shard_aliases():
+        with use_shard(alias):
+            yield alias
+
+
+def atomic(func=None):
+    """
+    Like django.db.transaction.atomic, on the database of the current shard. Works
+    as a decorator too, resolving the database on each call.
+    """
+    if callable(func):
+        @wraps(func)
+        def inner(*args, **kwargs):
+            with db_transaction.atomic(using=get_current_db()):
+                return func(*args, **kwargs)
+        return inner
+    return db_transaction.atomic(using=get_current_db())
+
+
+def on_commit(func):
+    db_transaction.on_commit(func, using=get_current_db())
+
+
+def get_commit_batch(name, factory, flush):
+    """
+    Returns the collection (made with factory) gathering work for the atomic block
+    open on the current shard, or None outside of one.
+
+    flush(batch) runs once, on that shard, when the outermost block commits.
+    A batch belongs to its block: when the block or the savepoint it was started
+    in rolls back, Django drops the flush and the next write starts a new batch,
+    so nothing leaks into a later block of the same thread.
+    """
+    alias = get_current_db()
+    connection = connections[alias]
+    if not connection.in_atomic_block:
+        return None
+
+    batches = _commit_batches.setdefault(connection, {})
+    current = batches.get(name)
+    # The dropped commit hooks of a rolled back block held the last reference to its flush
+    if current is not None and current[0]() is not None:
+        return current[1]
+
+    batch = factory()
+
+    def run_flush():
+        # Matched by its batch: a reference to itself would keep it alive once dropped
+        if name in batches and batches[name][1] is batch:
+            del batches[name]
+        with use_shard(alias):
+            flush(batch)
+
+    db_transaction.on_commit(run_flush, using=alias)
+    batches[name] = (weakref.ref(run_flush), batch)
+    return batch
+
+
+class ShardRouter:
+    """
+    Sends the tracker tables of each user to their shard.
+
+    Objects stay on the database they were read from, and queries started from a
+    user (user.transactions.all()) go to that user's shard. Other queries go to
+    the shard of the current request or use_shard() block. Users and shard
+    assignments stay in the default database. The router does nothing unless
+    TRACKER_SHARDS is set.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not is_sharding_enabled():
+            return None
+        if not is_sharded_model(model):
+            return DEFAULT_DB_ALIAS if model._meta.app_label == 'tracker' else None
+
+        instance = hints.get('instance')
+        if isinstance(instance, User):
+            return get_user_shard(instance)
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        return get_current_db()
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if not is_sharding_enabled():
+            return None
+        # Users are mirrored into the shards, so sharded rows can point at the default database's copy
+        if isinstance(obj1, User) or isinstance(obj2, User):
+            return True
+        if is_sharded_model(type(obj1)) and is_sharded_model(type(obj2)):
+            return obj1._state.db == obj2._state.db
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if app_label == 'tracker' and model_name in UNSHARDED_MODELS - {'user'}:
+            return db == DEFAULT_DB_ALIAS
+        return None
+
+
+class ShardMiddleware:
+    """
+    Routes the tracker queries of each request to the logged in user's shard.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        # Reset on the way out, so no shard set during the request (here or by
+        # API token authentication) is left behind for the thread's next request
+        token = _current_shard.set(None)
+        try:
+            if is_sharding_enabled():
+                activate_user_shard(request.user)
+            response = self.get_response(request)
+            alias = _current_shard.get()
+        finally:
+            _current_shard.reset(token)
+
+        # Streamed bodies are read after the middleware returns
+        if alias is not None and response.streaming and not isinstance(response, FileResponse) and not response.is_async:
+            response.streaming_content = stream_on_shard(response.streaming_content, alias)
+        return response
+
+
+def stream_on_shard(content, alias):
+    """
+    Yields the chunks of a streamed body, producing each one on the given database.
+    """
+    chunks = iter(content)
+    while True:
+        # Entered and left around each chunk, as the server may read them from another context
+        with use_shard(alias):
+            chunk = next(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
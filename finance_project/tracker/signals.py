@@ -0,0 +1,31 @@
+from django.db.models.signals import post_save, post_delete
+from django.db import DEFAULT_DB_ALIAS
+from django.dispatch import receiver
+
+from tracker.models import User, Account, Transaction
+from tracker.account_directory import invalidate_account_directory
+from tracker.description_index import schedule_description_invalidation, schedule_description_update
+from tracker.sharding import mirror_user
+
+
+@receiver(post_save, sender=Account)
+@receiver(post_delete, sender=Account)
+def invalidate_account_directory_on_write(sender, instance, **kwargs):
+    invalidate_account_directory(instance.user_id)
+
+
+@receiver(post_save, sender=Transaction)
+def update_description_index_on_save(sender, instance, created, update_fields=None, **kwargs):
+    # Bulk writes bypass signals and update the index themselves
+    if created:
+        schedule_description_update(instance.user_id, [(instance.description, instance.date)])
+    elif update_fields is None or {'description', 'date'} & set(update_fields):
+        # An edit may have retired the old description, which only a rebuild can tell
+        schedule_description_invalidation(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def mirror_user_on_save(sender, instance, using, **kwargs):
+    # Only saves to the default database are mirrored, the shard copies are written from here
+    if using == DEFAULT_DB_ALIAS:
+        mirror_user(instance)
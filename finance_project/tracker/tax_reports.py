@@ -0,0 +1,275 @@
+import contextvars
+import csv
+import io
+import json
+import logging
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Min, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from tracker.models import (
+    Transaction, Income, Expense, Tax, CategorySpend, ArchivedTransaction, ArchivedIncome, TaxReport,
+)
+from tracker.metrics import instrument
+from tracker import sharding
+
+logger = logging.getLogger(__name__)
+
+# A pending report older than this is assumed lost, e.g. with a restarted worker, and is queued again
+PENDING_TIMEOUT = timedelta(minutes=10)
+
+# A failed report is only built again on request, or when viewed this long after the failed attempt
+FAILED_RETRY_DELAY = timedelta(hours=1)
+
+CENTS = Decimal('0.01')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class ReportEncoder(DjangoJSONEncoder):
+    """
+    Stores amounts as strings with two decimal places, so the JSON keeps their
+    exact value whatever scale the database returns sums with.
+    """
+
+    def default(self, o):
+        if isinstance(o, Decimal):
+            return str(o.quantize(CENTS))
+        return super().default(o)
+
+
+def get_report_year(date):
+    """
+    Returns the calendar year a transaction date falls in, in the current timezone.
+    """
+    if timezone.is_aware(date):
+        date = timezone.localtime(date)
+    return date.year
+
+
+def mark_reports_stale(user_years):
+    """
+    Marks the reports of the given (user_id, year) pairs as stale, so they are
+    rebuilt on next request. Runs in the caller's transaction, so a rolled back
+    write leaves the reports as they were.
+    """
+    years = defaultdict(set)
+    for user_id, year in user_years:
+        years[user_id].add(year)
+    for user_id, user_years in years.items():
+        TaxReport.objects.filter(user_id=user_id, year__in=user_years, is_stale=False).update(is_stale=True)
+
+
+def mark_transactions_stale(*transactions):
+    mark_reports_stale((transaction.user_id, get_report_year(transaction.date)) for transaction in transactions)
+
+
+def mark_queryset_stale(queryset, user_field='user_id'):
+    """
+    Marks the reports of every year a queryset of transactions (or of Income/Expense
+    rows, with user_field='transaction__user_id') has rows in as stale.
+    """
+    mark_reports_stale(queryset.order_by().values_list(user_field, 'date__year').distinct())
+
+
+def get_report_years(user):
+    """
+    Returns the years a report can be requested for, newest first.
+    """
+    first_dates = [
+        model.objects.filter(user=user).aggregate(first=Min('date'))['first']
+        for model in (Transaction, ArchivedTransaction)
+    ]
+    first_dates = [date for date in first_dates if date is not None]
+    current_year = timezone.localdate().year
+    first_year = min(get_report_year(date) for date in first_dates) if first_dates else current_year
+    return list(range(current_year, first_year - 1, -1))
+
+
+def build_tax_report(user, year):
+    """
+    Computes the report of one year from grouped queries: income per category and
+    month, expenses per category from the budget spend counters, and the tax set
+    aside in and paid from virtual tax accounts.
+    """
+    start = timezone.make_aware(datetime(year, 1, 1))
+    end = timezone.make_aware(datetime(year + 1, 1, 1))
+    income_labels = dict(Income.INCOME_CATEGORIES)
+    expense_labels = dict(Expense.EXPENSE_CATEGORIES)
+
+    # Step 1: Income per category and month, from the live and archived tables
+    income_by_category = defaultdict(Decimal)
+    income_by_month = defaultdict(Decimal)
+    for model in (Income, ArchivedIncome):
+        rows = (
+            model.objects.filter(transaction__user=user, date__gte=start, date__lt=end)
+            .order_by()
+            .annotate(month=TruncMonth('date'))
+            .values('month', 'category')
+            .annotate(total=Sum('amount'))
+            .values_list('month', 'category', 'total')
+        )
+        for month, category, total in rows:
+            income_by_category[income_labels.get(category, category or 'Uncategorised')] += total
+            income_by_month[f'{month:%Y-%m}'] += total
+
+    # Step 2: Expenses per category, from the monthly budget spend counters
+    expenses_by_category = {
+        expense_labels.get(category, category or 'Uncategorised'): total
+        for category, total in CategorySpend.objects.filter(user=user, month__year=year)
+        .values('category')
+        .annotate(total=Sum('amount'))
+        .values_list('category', 'total')
+        if total
+    }
+
+    # Step 3: Tax transactions moving money into (provisions) and out of (payments) virtual tax accounts
+    tax_by_account = defaultdict(lambda: {'provisions': Decimal(0), 'payments': Decimal(0)})
+    for model in (Transaction, ArchivedTransaction):
+        tax_transactions = model.objects.filter(user=user, type='tax', date__gte=start, date__lt=end).order_by()
+        for kind, side in (('provisions', 'destination_account'), ('payments', 'origin_account')):
+            rows = (
+                tax_transactions.filter(**{f'{side}__account_type': 'virtual_tax'})
+                .values(f'{side}__name')
+                .annotate(total=Sum('amount'))
+                .values_list(f'{side}__name', 'total')
+            )
+            for name, total in rows:
+                tax_by_account[name][kind] += total
+
+    provisions = sum((account['provisions'] for account in tax_by_account.values()), Decimal(0))
+    payments = sum((account['payments'] for account in tax_by_account.values()), Decimal(0))
+    assessed = Tax.objects.filter(transaction__user=user, year=year).aggregate(total=Sum('amount'))['total']
+
+    report = {
+        'year': year,
+        'income': {
+            'total': sum(income_by_category.values(), Decimal(0)),
+            'by_category': dict(sorted(income_by_category.items())),
+            'by_month': dict(sorted(income_by_month.items())),
+        },
+        'expenses': {
+            'total': sum(expenses_by_category.values(), Decimal(0)),
+            'by_category': dict(sorted(expenses_by_category.items())),
+        },
+        'tax': {
+            'provisions': provisions,
+            'payments': payments,
+            'outstanding': provisions - payments,
+            'assessed': assessed or Decimal(0),
+            'by_account': dict(sorted(tax_by_account.items())),
+        },
+    }
+    return json.loads(json.dumps(report, cls=ReportEncoder))
+
+
+def render_report_csv(data):
+    """
+    Renders a report as CSV rows of section, item and amount.
+    """
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(['section', 'item', 'amount'])
+    for section in ('income', 'expenses'):
+        for category, amount in data[section]['by_category'].items():
+            writer.writerow([section, category, amount])
+        writer.writerow([section, 'total', data[section]['total']])
+    for month, amount in data['income']['by_month'].items():
+        writer.writerow(['income_by_month', month, amount])
+    for name, totals in data['tax']['by_account'].items():
+        writer.writerow(['tax_provisions', name, totals['provisions']])
+        writer.writerow(['tax_payments', name, totals['payments']])
+    for item in ('provisions', 'payments', 'outstanding', 'assessed'):
+        writer.writerow(['tax', item, data['tax'][item]])
+    return output.getvalue()
+
+
+@instrument('tax_report')
+def generate_tax_report(report_id):
+    """
+    Builds a queued report and stores its JSON data and CSV file.
+
+    The stale flag is cleared before reading, so a transaction written while the
+    report is being built marks it stale again and it is rebuilt on next request.
+    """
+    report = TaxReport.objects.select_related('user').get(pk=report_id)
+    TaxReport.objects.filter(pk=report_id).update(is_stale=False)
+
+    try:
+        data = build_tax_report(report.user, report.year)
+        content = render_report_csv(data)
+    except Exception as e:
+        logger.exception("Failed to build tax report %s", report_id)
+        TaxReport.objects.filter(pk=report_id).update(status='failed', error=str(e), is_stale=True)
+        return
+
+    # Replace the previous artifact
+    if report.csv_file:
+        report.csv_file.delete(save=False)
+    report.csv_file.save(f'tax-report-{report.user_id}-{report.year}.csv', ContentFile(content.encode()), save=False)
+
+    TaxReport.objects.filter(pk=report_id).update(
+        status='ready', data=data, csv_file=report.csv_file.name, error='', generated_at=timezone.now(),
+    )
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'TAX_REPORT_WORKERS', 2), thread_name_prefix='tax-report',
+            )
+        return _executor
+
+
+def run_tax_report(report_id):
+    try:
+        generate_tax_report(report_id)
+    finally:
+        # Worker threads open their own connections, which nothing else would close
+        connections.close_all()
+
+
+def request_tax_report(user, year, retry=False):
+    """
+    Returns the user's report for the year, queueing a background build when it
+    is new or stale. A stale report keeps its previous data until the new one is
+    ready. A failed report is kept as failed, so viewing it does not rebuild it
+    over and over, until retry is set or FAILED_RETRY_DELAY has passed.
+    """
+    report, created = TaxReport.objects.get_or_create(user=user, year=year)
+    now = timezone.now()
+
+    if not created:
+        if report.status == 'ready' and not report.is_stale:
+            return report
+        if report.status == 'pending' and report.requested_at > now - PENDING_TIMEOUT:
+            return report
+        if report.status == 'failed' and not retry and report.requested_at > now - FAILED_RETRY_DELAY:
+            return report
+
+        # Claim the rebuild with a conditional update, so concurrent requests queue it once
+        claimed = TaxReport.objects.filter(pk=report.pk, status=report.status, requested_at=report.requested_at).update(
+            status='pending', requested_at=now,
+        )
+        if not claimed:
+            return report
+        report.status = 'pending'
+        report.requested_at = now
+
+    # Queued after commit, so the worker finds the report row, and run in a copy
+    # of the caller's context, so it reads from the same shard
+    sharding.on_commit(lambda: get_executor().submit(contextvars.copy_context().run, run_tax_report, report.pk))
+    return report
@@ -1,3 +1,1228 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections
+from django.http import QueryDict
+from django.test import Client, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from tracker.models import (
+    User, Account, AccountBalanceHistory, Transaction, Income, Expense, Budget, CategorySpend,
+    ArchivedTransaction, ArchivedIncome, ArchivedExpense, OpeningBalance, ArchiveCheckpoint, SyncSource,
+    CategoryRule, TaxReport,
+)
+from tracker.tracker_helpers import get_movement_totals, calculate_balance, update_account_balance, update_account_balances
+from tracker.account_directory import get_account_directory, get_directory_version
+from tracker.ledger import schedule_balance_update, schedule_queryset_update
+from tracker.archive import CombinedResults, archive_transactions
+from tracker.pagination import CachedCountPaginator, bump_count_watermark, get_count_watermark
+from tracker.api import create_api_token
+from tracker.budgets import get_budget_status, rebuild_spend
+from tracker.bank_sync import StatementRow, sync_source
+from tracker.categorization import RuleMatcher, apply_category_rules
+from tracker.description_index import get_description_suggestions, load_description_index
+from tracker.tax_reports import FAILED_RETRY_DELAY, build_tax_report, generate_tax_report
+from tracker import metrics, sharding
+
+CSV_HEADER = 'date,type,description,amount,income_category,expense_category,source,fixed_or_variable,origin_account,destination_account\n'
+
+
+class TrackerTestCase(TestCase):
+    """
+    Logs a user with two accounts in through an HTMX client, on an empty cache.
+
+    Balance recomputes and cache invalidations run on commit, which never comes
+    inside a TestCase, so requests are made through post/get/delete here, which
+    run those callbacks as the request ends.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('tester', password='tester')
+        self.account = Account.objects.create(user=self.user, name='Main')
+        self.savings = Account.objects.create(user=self.user, name='Savings')
+        self.client = Client(HTTP_HX_REQUEST='true')
+        self.client.force_login(self.user)
+
+    def post(self, path, data=None, **extra):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(path, data, **extra)
+
+    def get(self, path, data=None, **extra):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.get(path, data, **extra)
+
+    def delete(self, path, **extra):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.delete(path, **extra)
+
+    def import_csv(self, rows):
+        file = SimpleUploadedFile('transactions.csv', (CSV_HEADER + rows).encode())
+        return self.post('/transactions/import', {'file': file})
+
+
+class AccountDirectoryTests(TrackerTestCase):
+    def test_accounts_sharing_a_name_are_kept_apart(self):
+        other = Account.objects.create(user=self.user, name='Main', balance=Decimal('5'))
+        directory = get_account_directory(self.user)
+        self.assertEqual({entry.id for entry in directory}, {self.account.pk, self.savings.pk, other.pk})
+
+        response = self.get('/transactions/', HTTP_HX_REQUEST='')
+        self.assertContains(response, '<th class="text-center">Main</th>', count=2)
+
+    def test_import_rejects_an_ambiguous_account_name(self):
+        Account.objects.create(user=self.user, name='Main')
+        response = self.import_csv('01-01-2024,income,Salary,100.00,salary,,,,,Main\n')
+        self.assertContains(response, 'ambiguous')
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_import_resolves_unique_names(self):
+        response = self.import_csv('01-01-2024,internal,Move,100.00,,,,,Main,Savings\n')
+        self.assertContains(response, '1 transactions uploaded successfully')
+        transaction = Transaction.objects.get()
+        self.assertEqual((transaction.origin_account_id, transaction.destination_account_id), (self.account.pk, self.savings.pk))
+
+
+class LedgerTests(TrackerTestCase):
+    def test_one_flush_per_block_with_every_account(self):
+        with mock.patch('tracker.ledger.update_account_balances') as update:
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                for _ in range(3):
+                    schedule_balance_update([self.account.pk])
+                schedule_balance_update([self.savings.pk, None])
+        self.assertEqual(len(callbacks), 1)
+        update.assert_called_once_with({self.account.pk, self.savings.pk})
+
+    def test_rolled_back_block_drops_its_accounts(self):
+        with mock.patch('tracker.ledger.update_account_balances') as update:
+            with self.captureOnCommitCallbacks(execute=True):
+                with self.assertRaises(RuntimeError):
+                    with sharding.atomic():
+                        schedule_balance_update([self.account.pk])
+                        raise RuntimeError
+                schedule_balance_update([self.savings.pk])
+        update.assert_called_once_with({self.savings.pk})
+
+    def test_next_block_starts_a_new_batch(self):
+        with mock.patch('tracker.ledger.update_account_balances') as update:
+            for account in (self.account, self.savings):
+                with self.captureOnCommitCallbacks(execute=True):
+                    schedule_balance_update([account.pk])
+        self.assertEqual(update.call_args_list, [mock.call({self.account.pk}), mock.call({self.savings.pk})])
+
+    def test_balances_follow_writes(self):
+        self.import_csv('01-01-2024,income,Salary,100.00,salary,,,,,Main\n02-01-2024,internal,Move,30.00,,,,,Main,Savings\n')
+        self.assertEqual(Account.objects.get(pk=self.account.pk).balance, Decimal('70'))
+
+        transaction = Transaction.objects.get(description='Move')
+        self.delete(f'/transactions/{transaction.pk}/delete/')
+        self.assertEqual(Account.objects.get(pk=self.account.pk).balance, Decimal('100'))
+        self.assertEqual(Account.objects.get(pk=self.savings.pk).balance, Decimal('0'))
+
+    def test_balance_update_invalidates_the_directory_once(self):
+        Transaction.objects.create(
+            user=self.user, type='internal', description='Move', amount=Decimal('30'),
+            origin_account=self.account, destination_account=self.savings,
+        )
+        version = get_directory_version(self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            update_account_balances({self.account.pk, self.savings.pk})
+
+        self.assertEqual(AccountBalanceHistory.objects.count(), 2)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(get_directory_version(self.user.pk), version + 1)
+
+
+class BulkEditTests(TrackerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.import_csv(
+            '01-01-2024,income,Salary,1000.00,salary,,,,,Main\n'
+            '02-01-2024,expense,Food,50.00,,groceries,personal,variable,Main,\n'
+            '03-01-2024,internal,Move,100.00,,,,,Main,Savings\n'
+        )
+        self.ids = list(Transaction.objects.values_list('pk', flat=True))
+
+    def balances(self):
+        return dict(Account.objects.filter(user=self.user).values_list('name', 'balance'))
+
+    def test_bulk_update_moves_and_recategorises(self):
+        response = self.post('/transactions/bulk/update/', {
+            'ids': self.ids, 'expense_category': 'car', 'origin_account': self.savings.pk,
+        })
+        self.assertEqual(response.status_code, 200)
+        expense = Expense.objects.get()
+        self.assertEqual((expense.category, expense.account), ('car', self.savings))
+        self.assertEqual(self.balances(), {'Main': Decimal('1000'), 'Savings': Decimal('-50')})
+
+    def test_bulk_delete_by_ids_and_by_filter(self):
+        self.post('/transactions/bulk/delete/', {'selection': 'filter', 'transaction_type': 'expense'})
+        self.assertEqual(Transaction.objects.count(), 2)
+        self.assertFalse(Expense.objects.exists())
+        self.assertEqual(self.balances(), {'Main': Decimal('900'), 'Savings': Decimal('100')})
+
+        self.post('/transactions/bulk/delete/', {'ids': self.ids})
+        self.assertFalse(Transaction.objects.exists())
+        self.assertEqual(self.balances(), {'Main': Decimal('0'), 'Savings': Decimal('0')})
+
+    def test_selection_is_limited_to_the_user(self):
+        other = User.objects.create_user('other', password='other')
+        account = Account.objects.create(user=other, name='Main')
+        transaction = Transaction.objects.create(
+            user=other, type='income', description='Theirs', amount=5, destination_account=account,
+        )
+        self.post('/transactions/bulk/delete/', {'ids': [transaction.pk]})
+        self.assertTrue(Transaction.objects.filter(pk=transaction.pk).exists())
+
+
+class ReconcileLedgerTests(TrackerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.import_csv(
+            '01-01-2024,income,Salary,100.00,salary,,,,,Main\n'
+            '02-01-2024,income,Bonus,50.00,salary,,,,,Savings\n'
+        )
+
+    def reconcile(self, **options):
+        output = io.StringIO()
+        call_command('reconcile_ledger', workers=1, stdout=output, **options)
+        return output.getvalue()
+
+    def test_clean_ledger_has_no_drift(self):
+        self.assertIn('no drift found', self.reconcile())
+
+    def test_repairs_balance_drift(self):
+        Account.objects.filter(pk=self.account.pk).update(balance=Decimal('1'))
+        self.assertIn('found 1 issues.', self.reconcile())
+
+        self.assertIn('found 1 issues, 1 repaired.', self.reconcile(repair=True))
+        self.assertEqual(Account.objects.get(pk=self.account.pk).balance, Decimal('100'))
+        self.assertIn('no drift found', self.reconcile())
+
+    def test_counts_issues_needing_manual_attention(self):
+        Account.objects.filter(pk=self.account.pk).update(balance=Decimal('1'))
+        Income.objects.filter(transaction__description='Bonus').delete()
+
+        output = self.reconcile(repair=True)
+        self.assertIn('missing Income record', output)
+        self.assertIn('found 2 issues, 1 repaired, 1 need manual attention.', output)
+
+
+class ExportTests(TrackerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.import_csv('01-01-2024,income,Salary,100.00,salary,,,,,Main\n')
+
+    def export(self, data=None, **headers):
+        response = self.client.get('/transactions/export', data, HTTP_HX_REQUEST='', **headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_csv_export(self):
+        response, body = self.export()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Salary', body)
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_accept_encoding_compresses_the_transfer(self):
+        response, body = self.export(HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn(b'Salary', gzip.decompress(body))
+
+    def test_refused_encodings_are_not_used(self):
+        response, body = self.export(HTTP_ACCEPT_ENCODING='gzip;q=0, zstd;q=0')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertIn(b'Salary', body)
+
+    def test_explicit_refusal_beats_the_wildcard(self):
+        response, body = self.export(HTTP_ACCEPT_ENCODING='zstd;q=0, *')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn(b'Salary', gzip.decompress(body))
+
+        response, body = self.export(HTTP_ACCEPT_ENCODING='gzip;q=0, *;q=1')
+        self.assertNotEqual(response.get('Content-Encoding'), 'gzip')
+
+    def test_refusing_identity_and_every_compression_is_not_acceptable(self):
+        response, _ = self.export(HTTP_ACCEPT_ENCODING='gzip;q=0, zstd;q=0, identity;q=0')
+        self.assertEqual(response.status_code, 406)
+        response, _ = self.export(HTTP_ACCEPT_ENCODING='*;q=0')
+        self.assertEqual(response.status_code, 406)
+
+    def test_compress_parameter_sends_a_compressed_file(self):
+        response, body = self.export({'compress': 'gzip'})
+        self.assertIn('.csv.gz', response['Content-Disposition'])
+        self.assertIn(b'Salary', gzip.decompress(body))
+
+    def test_unknown_compression_is_rejected(self):
+        response, _ = self.export({'compress': 'brotli'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_ndjson_export(self):
+        response, body = self.export({'format': 'ndjson'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(body.splitlines()), 1)
+        self.assertIn(b'"Salary"', body)
+
+    def test_arrow_and_parquet_exports(self):
+        self.import_csv('02-01-2024,expense,Food,50.00,,groceries,personal,variable,Main,\n')
+
+        _, body = self.export({'format': 'arrow'})
+        table = pa.ipc.open_stream(body).read_all()
+        self.assertEqual(table.column('amount').to_pylist(), [Decimal('100.00'), Decimal('50.00')])
+
+        _, body = self.export({'format': 'parquet', 'transaction_type': 'expense'})
+        table = pq.read_table(io.BytesIO(body))
+        self.assertEqual(table.column('expense_category').to_pylist(), ['groceries'])
+
+    def test_unknown_format_is_rejected(self):
+        response, _ = self.export({'format': 'xml'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ColumnarImportTests(TrackerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.table = pa.table({
+            'date': pa.array([date(2024, 1, 1), date(2024, 1, 2), date(2024, 1, 2), date(2024, 1, 3)]),
+            'type': ['income', 'expense', 'expense', 'internal'],
+            'description': ['Salary', 'Food', 'Food', 'Move'],
+            'amount': pa.array([Decimal('1000'), Decimal('50'), Decimal('50'), Decimal('100')], pa.decimal128(12, 2)),
+            'income_category': ['salary', None, None, None],
+            'expense_category': [None, 'groceries', 'groceries', None],
+            'origin_account': [None, 'Main', 'Main', 'Main'],
+            'destination_account': ['Main', None, None, 'Savings'],
+        })
+
+    def upload(self, filename, content):
+        return self.post('/transactions/import', {'file': SimpleUploadedFile(filename, content)})
+
+    def parquet(self, table):
+        buffer = io.BytesIO()
+        pq.write_table(table, buffer)
+        return buffer.getvalue()
+
+    def test_parquet_import_skips_duplicates_within_the_file(self):
+        response = self.upload('transactions.parquet', self.parquet(self.table))
+        self.assertContains(response, '3 transactions uploaded successfully')
+        self.assertEqual(Account.objects.get(pk=self.account.pk).balance, Decimal('850'))
+        self.assertEqual(Expense.objects.get().category, 'groceries')
+
+    def test_arrow_stream_reimport_adds_nothing(self):
+        self.upload('transactions.parquet', self.parquet(self.table))
+        sink = io.BytesIO()
+        with pa.ipc.new_stream(sink, self.table.schema) as writer:
+            writer.write_table(self.table)
+        self.assertContains(self.upload('transactions.arrows', sink.getvalue()), '0 transactions uploaded successfully')
+        self.assertEqual(Transaction.objects.count(), 3)
+
+    def test_invalid_row_rejects_the_file(self):
+        table = self.table.set_column(1, 'type', pa.array(['income', 'bogus', 'expense', 'internal']))
+        self.assertContains(self.upload('transactions.parquet', self.parquet(table)), 'Row 2: invalid transaction type: bogus')
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_expense_without_origin_is_a_row_error(self):
+        table = self.table.set_column(6, 'origin_account', pa.array([None, 'Main', None, 'Main']))
+        self.assertContains(
+            self.upload('transactions.parquet', self.parquet(table)), 'Row 3: expense transactions need origin_account set',
+        )
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_income_without_destination_is_a_row_error(self):
+        table = self.table.set_column(7, 'destination_account', pa.array([None, None, None, 'Savings']))
+        self.assertContains(
+            self.upload('transactions.parquet', self.parquet(table)), 'Row 1: income transactions need destination_account set',
+        )
+
+
+class ProfilingTests(TrackerTestCase):
+    def setUp(self):
+        super().setUp()
+        profiles = tempfile.TemporaryDirectory()
+        self.addCleanup(profiles.cleanup)
+        profiling_root = override_settings(PROFILING_ROOT=profiles.name)
+        profiling_root.enable()
+        self.addCleanup(profiling_root.disable)
+        self.user.is_staff = True
+        self.user.save()
+
+    def test_sql_capture_is_listed_and_has_no_cpu_profile(self):
+        response = self.get('/transactions/', {'_profile': 'sql'}, HTTP_HX_REQUEST='')
+        capture_id = response['X-Profile-Id']
+
+        self.assertContains(self.client.get('/admin/profiles/'), capture_id)
+        self.assertEqual(self.client.get(f'/admin/profiles/{capture_id}/').status_code, 200)
+        self.assertEqual(self.client.get(f'/admin/profiles/{capture_id}/', {'download': 'pstats'}).status_code, 404)
+
+    def test_cprofile_capture_can_be_downloaded(self):
+        response = self.get('/transactions/', {'_profile': 'cprofile'}, HTTP_HX_REQUEST='')
+        download = self.client.get(f"/admin/profiles/{response['X-Profile-Id']}/", {'download': 'pstats'})
+        self.assertEqual(download.status_code, 200)
+        self.assertTrue(b''.join(download.streaming_content))
+
+
+class MetricsTests(TrackerTestCase):
+    def setUp(self):
+        super().setUp()
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.root = Path(root.name)
+        metrics_root = override_settings(METRICS_ROOT=self.root)
+        metrics_root.enable()
+        self.addCleanup(metrics_root.disable)
+
+    @override_settings(METRICS_TOKEN=None, DEBUG=False)
+    def test_closed_without_a_token_outside_debug(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+    @override_settings(METRICS_TOKEN='secret', DEBUG=False)
+    def test_token_is_required(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertContains(response, 'tracker_requests_total{view="metrics",method="GET",status="403"}')
+
+    def test_files_of_exited_processes_are_folded(self):
+        process = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'], capture_output=True, text=True)
+        exited = self.root / f'metrics-{process.stdout.strip()}-dead.json'
+        exited.write_text(json.dumps({'counters': [['tracker_exited_total', [], 3]], 'histograms': []}))
+
+        counters, _ = metrics.registry.collect()
+        self.assertEqual(counters[('tracker_exited_total', ())], 3)
+        self.assertFalse(exited.exists())
+        self.assertTrue((self.root / metrics.EXITED_FILENAME).exists())
+
+        counters, _ = metrics.registry.collect()
+        self.assertEqual(counters[('tracker_exited_total', ())], 3)
+
+    def test_forked_worker_writes_its_own_file(self):
+        registry = metrics.MetricsRegistry()
+        counter = registry.counter('tracker_forked_total', 'Forked', ())
+        counter.inc()
+        registry.flush()
+        parent_file = self.root / registry.filename
+
+        # A preforked worker inherits the registry built in its parent
+        with mock.patch('os.getpid', return_value=registry.pid + 1):
+            counter.inc(2)
+            registry.flush()
+        child_file = self.root / registry.filename
+
+        self.assertNotEqual(parent_file, child_file)
+        self.assertTrue(child_file.name.startswith(f'metrics-{registry.pid}-'))
+        self.assertEqual(json.loads(parent_file.read_text())['counters'], [['tracker_forked_total', [], 1]])
+        self.assertEqual(json.loads(child_file.read_text())['counters'], [['tracker_forked_total', [], 2]])
+
+
+class StartupTests(SimpleTestCase):
+    # Imported only by the code paths that use them, so workers boot without them
+    HEAVY_MODULES = ('tablib', 'pyarrow', 'zstandard', 'import_export')
+
+    def test_boot_skips_heavy_modules(self):
+        script = (
+            'import sys, django\n'
+            'from importlib import import_module\n'
+            'django.setup()\n'
+            'from django.conf import settings\n'
+            'from django.core.wsgi import get_wsgi_application\n'
+            'get_wsgi_application()\n'
+            'import_module(settings.ROOT_URLCONF)\n'
+            f'print(",".join(name for name in {self.HEAVY_MODULES!r} if name in sys.modules))\n'
+        )
+        process = subprocess.run(
+            [sys.executable, '-c', script], capture_output=True, text=True, cwd=settings.BASE_DIR, check=True,
+        )
+        self.assertEqual(process.stdout.strip(), '')
+
+
+class NetWorthTests(TrackerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tax = Account.objects.create(user=self.user, name='Tax', account_type='virtual_tax')
+
+    def record(self, account, day, balance):
+        AccountBalanceHistory.objects.create(
+            account=account, balance=balance, timestamp=timezone.make_aware(datetime(*day)),
+        )
+
+    def test_monthly_series_carries_balances_forward(self):
+        self.record(self.account, (2024, 1, 5), 100)
+        self.record(self.savings, (2024, 1, 20), 50)
+        self.record(self.account, (2024, 3, 2), 80)
+        self.record(self.tax, (2024, 3, 3), 10)
+        self.record(self.savings, (2024, 3, 30), 70)
+
+        points = self.get('/net-worth/', {'by_type': '1'}).json()['points']
+        self.assertEqual(points, [
+            {'date': '2024-01-01', 'total': 150.0, 'normal': 150.0},
+            {'date': '2024-02-01', 'total': 150.0, 'normal': 150.0},
+            {'date': '2024-03-01', 'total': 150.0, 'normal': 150.0, 'virtual_tax': 10.0},
+        ])
+
+    def test_daily_series_is_downsampled(self):
+        self.record(self.account, (2024, 1, 5), 100)
+        self.record(self.savings, (2024, 3, 30), 50)
+
+        points = self.get('/net-worth/', {'period': 'day', 'max_points': 10}).json()['points']
+        self.assertLessEqual(len(points), 10)
+        self.assertEqual(points[-1], {'date': '2024-03-30', 'total': 150.0})
+
+    def test_invalid_period_is_rejected(self):
+        self.assertEqual(self.get('/net-worth/', {'period': 'year'}).status_code, 400)
+
+
+class BudgetTests(TrackerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.import_csv('02-01-2024,expense,Food,50.00,,groceries,personal,variable,Main,\n')
+        self.expense = Expense.objects.get()
+
+    def spend(self):
+        return dict(CategorySpend.objects.filter(user=self.user).values_list('category', 'amount'))
+
+    def test_import_counts_spend_against_the_budget(self):
+        Budget.objects.create(user=self.user, category='groceries', amount=40)
+        self.assertEqual(self.spend(), {'groceries': Decimal('50')})
+        status = get_budget_status(self.user, date(2024, 1, 5)).get()
+        self.assertEqual((status.spent, status.remaining), (Decimal('50'), Decimal('-10')))
+
+    def test_edits_move_the_spend(self):
+        self.post('/transactions/bulk/update/', {'ids': [self.expense.transaction_id], 'expense_category': 'car'})
+        self.assertEqual(self.spend(), {'groceries': Decimal('0'), 'car': Decimal('50')})
+
+        self.post(f'/transactions/{self.expense.transaction_id}/update/', {
+            'type': 'expense', 'date': '2024-01-02', 'description': 'Food', 'amount': '70',
+            'origin_account': self.account.pk, 'expense_category': 'car',
+            'expense_source': 'personal', 'expense_type': 'variable',
+        })
+        self.assertEqual(self.spend()['car'], Decimal('70'))
+
+        self.delete(f'/transactions/{self.expense.transaction_id}/delete/')
+        self.assertEqual(self.spend()['car'], Decimal('0'))
+
+    def test_rebuild_repairs_counters(self):
+        CategorySpend.objects.update(amount=999)
+        rebuild_spend(self.user)
+        self.assertEqual(self.spend(), {'groceries': Decimal('50')})
+
+
+class ArchiveTests(TrackerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.import_csv(
+            '01-01-2024,income,Salary,1000.00,salary,,,,,Main\n'
+            '02-01-2024,expense,Food,50.00,,groceries,personal,variable,Main,\n'
+            '03-01-2024,internal,Move,100.00,,,,,Main,Savings\n'
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            output = io.StringIO()
+            call_command('archive_transactions', before='2024-01-03', batch_size=1, stdout=output)
+        self.assertIn('Archived 2 transactions', output.getvalue())
+
+    def test_archived_rows_keep_balances_and_totals(self):
+        self.assertEqual(Transaction.objects.count(), 1)
+        self.assertEqual(ArchivedTransaction.objects.count(), 2)
+        self.assertEqual(ArchivedExpense.objects.get().category, 'groceries')
+        self.assertEqual(OpeningBalance.objects.get(account=self.account).balance, Decimal('950'))
+        checkpoint = ArchiveCheckpoint.objects.get(user=self.user)
+        self.assertEqual((checkpoint.income, checkpoint.expenses), (Decimal('1000'), Decimal('50')))
+
+        for account in (self.account, self.savings):
+            update_account_balance(account)
+        balances = dict(Account.objects.filter(user=self.user).values_list('name', 'balance'))
+        self.assertEqual(balances, {'Main': Decimal('850'), 'Savings': Decimal('100')})
+
+        output = io.StringIO()
+        call_command('reconcile_ledger', workers=1, stdout=output)
+        self.assertIn('no drift', output.getvalue())
+
+    def test_list_and_export_include_the_archive_on_request(self):
+        def descriptions(data=None):
+            response = self.get('/transactions/', data, HTTP_HX_REQUEST='')
+            return [transaction.description for transaction in response.context['transactions']]
+
+        self.assertEqual(descriptions(), ['Move'])
+        self.assertEqual(descriptions({'include_archive': 'on'}), ['Move', 'Food', 'Salary'])
+
+        response = self.client.get('/transactions/export', {'format': 'ndjson', 'include_archive': 'on'}, HTTP_HX_REQUEST='')
+        body = b''.join(response.streaming_content)
+        self.assertEqual(len(body.splitlines()), 3)
+        self.assertLess(body.index(b'Salary'), body.index(b'Move'))
+
+
+class AdminTests(TrackerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.import_csv(
+            '01-01-2024,income,Salary,1000.00,salary,,,,,Main\n'
+            '02-01-2024,expense,Food,50.00,,groceries,personal,variable,Main,\n'
+        )
+        self.admin = Client()
+        self.admin.force_login(User.objects.create_superuser('admin', password='admin'))
+
+    def test_changelists_run_a_fixed_number_of_queries(self):
+        for model in (
+            'transaction', 'income', 'expense', 'accountbalancehistory', 'account', 'budget', 'categoryspend',
+            'archivedtransaction', 'openingbalance', 'shardassignment', 'apitoken',
+        ):
+            with self.subTest(model=model), CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.admin.get(f'/admin/tracker/{model}/').status_code, 200)
+            self.assertLess(len(queries), 15)
+
+    def test_admin_edit_goes_through_the_ledger(self):
+        transaction = Transaction.objects.get(description='Food')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.admin.post(f'/admin/tracker/transaction/{transaction.pk}/delete/', {'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Account.objects.get(pk=self.account.pk).balance, Decimal('1000'))
+
+    def test_admin_edit_and_delete_move_the_budget_spend(self):
+        Budget.objects.create(user=self.user, category='groceries', amount=40)
+        transaction = Transaction.objects.get(description='Food')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.admin.post(f'/admin/tracker/transaction/{transaction.pk}/change/', {
+                'user': self.user.pk, 'description': 'Food', 'type': 'expense', 'amount': '70.00',
+                'date_0': '2024-02-03', 'date_1': '12:00:00', 'origin_account': self.account.pk,
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(get_budget_status(self.user, date(2024, 1, 5)).get().spent, Decimal('0'))
+        status = get_budget_status(self.user, date(2024, 2, 5)).get()
+        self.assertEqual((status.spent, status.remaining), (Decimal('70'), Decimal('-30')))
+        self.assertEqual(Expense.objects.get().amount, Decimal('70'))
+        self.assertEqual(Account.objects.get(pk=self.account.pk).balance, Decimal('930'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.admin.post('/admin/tracker/transaction/', {'action': 'delete_selected', '_selected_action': [transaction.pk], 'post': 'yes'})
+        self.assertFalse(Transaction.objects.filter(pk=transaction.pk).exists())
+        self.assertEqual(get_budget_status(self.user, date(2024, 2, 5)).get().spent, Decimal('0'))
+
+    def test_expense_admin_moves_the_budget_spend(self):
+        expense = Expense.objects.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.admin.post(f'/admin/tracker/expense/{expense.pk}/change/', {
+                'amount': '50.00', 'category': 'car', 'date_0': '2024-01-02', 'date_1': '00:00:00',
+                'source': 'personal', 'fixed_or_variable': 'variable',
+                'transaction': expense.transaction_id, 'account': self.account.pk,
+            })
+        self.assertEqual(response.status_code, 302)
+        spend = dict(CategorySpend.objects.filter(user=self.user).values_list('category', 'amount'))
+        self.assertEqual(spend, {'groceries': Decimal('0'), 'car': Decimal('50')})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.admin.post(f'/admin/tracker/expense/{expense.pk}/delete/', {'post': 'yes'})
+        self.assertEqual(CategorySpend.objects.get(category='car').amount, Decimal('0'))
+
+
+class ApiTests(TrackerTestCase):
+    NDJSON = (
+        '{"date": "2024-01-01", "type": "income", "description": "Salary", "amount": "100.00", "destination_account": "Main"}\n'
+        '{"date": "2024-01-02", "type": "expense", "description": "Food", "amount": "20.50", "origin_account": "Main"}\n'
+    )
+
+    def setUp(self):
+        super().setUp()
+        self.token = create_api_token(self.user, 'test')
+        # A client without a session, like a script
+        self.api_client = Client(enforce_csrf_checks=True)
+
+    def ingest(self, body, client=None, **headers):
+        client = client or self.api_client
+        headers.setdefault('HTTP_AUTHORIZATION', f'Bearer {self.token}')
+        with self.captureOnCommitCallbacks(execute=True):
+            return client.post('/api/transactions/ingest/', body, content_type='application/x-ndjson', **headers)
+
+    def test_ingest_with_a_token(self):
+        response = self.ingest(self.NDJSON)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {'rows': 2, 'created': 2, 'replayed': False})
+        self.assertEqual(Account.objects.get(pk=self.account.pk).balance, Decimal('79.50'))
+
+    def test_retry_with_the_same_key_is_replayed(self):
+        first = self.ingest(self.NDJSON, HTTP_IDEMPOTENCY_KEY='batch-1')
+        retry = self.ingest(self.NDJSON, HTTP_IDEMPOTENCY_KEY='batch-1')
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.json(), {'rows': 2, 'created': 2, 'replayed': True})
+        self.assertEqual(Transaction.objects.count(), 2)
+
+    def test_invalid_row_creates_nothing(self):
+        response = self.ingest(self.NDJSON + '{"date": "2024-01-03", "type": "gift", "amount": "1"}\n')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Row 3', response.json()['error'])
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_income_without_destination_is_a_row_error(self):
+        response = self.ingest('{"date": "2024-01-03", "type": "income", "amount": "1", "origin_account": "Main"}\n')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'Row 1: income transactions need destination_account set')
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_expense_without_origin_is_a_row_error(self):
+        response = self.ingest(self.NDJSON + '{"date": "2024-01-03", "type": "expense", "amount": "1"}\n')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Row 3: expense transactions need origin_account set', response.json()['error'])
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_unknown_token_and_anonymous_requests_are_rejected(self):
+        self.assertEqual(self.ingest(self.NDJSON, HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+        self.assertEqual(self.ingest(self.NDJSON, HTTP_AUTHORIZATION='').status_code, 401)
+
+    def test_session_requests_still_need_a_csrf_token(self):
+        browser = Client(enforce_csrf_checks=True)
+        browser.force_login(self.user)
+        self.assertEqual(self.ingest(self.NDJSON, client=browser, HTTP_AUTHORIZATION='').status_code, 403)
+
+    def test_listing_with_cursor_and_fields(self):
+        self.ingest(self.NDJSON)
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {self.token}'}
+        response = self.api_client.get('/api/transactions/', {'limit': 1, 'fields': 'description,amount'}, **headers)
+        page = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(page['results'], [{'description': 'Food', 'amount': '20.50'}])
+
+        response = self.api_client.get('/api/transactions/', {'limit': 1, 'cursor': page['next']}, **headers)
+        page = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([row['description'] for row in page['results']], ['Salary'])
+        self.assertIsNone(page['next'])
+
+
+class BankSyncTests(TrackerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.source = SyncSource.objects.create(user=self.user, account=self.account, name='Main feed', provider='fake')
+
+    def sync(self, rows=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return sync_source(self.source, rows=rows)
+
+    def test_second_sync_creates_nothing(self):
+        first = self.sync()
+        self.assertGreater(first.created, 0)
+        self.assertEqual((first.fetched, first.below_watermark), (first.created, 0))
+        count = Transaction.objects.count()
+
+        second = self.sync()
+        self.assertEqual(second.created, 0)
+        self.assertEqual(second.below_watermark + second.already_seen, second.fetched)
+        self.assertEqual(Transaction.objects.count(), count)
+
+        account = Account.objects.get(pk=self.account.pk)
+        totals = get_movement_totals([account.pk])
+        self.assertEqual(account.balance, calculate_balance(account.account_type, totals[account.pk]))
+
+    def test_rows_at_the_watermark_are_matched_by_external_id(self):
+        self.sync()
+        self.source.refresh_from_db()
+        row = StatementRow('late-1', self.source.watermark, 'Late', Decimal('-5'))
+        result = self.sync(rows=[row, row])
+        self.assertEqual((result.created, result.already_seen), (1, 1))
+        self.assertEqual(Transaction.objects.filter(external_id='late-1').count(), 1)
+
+
+class CategoryRuleTests(TrackerTestCase):
+    def add_rule(self, pattern, **values):
+        return CategoryRule.objects.create(user=self.user, pattern=pattern, **values)
+
+    def test_patterns_that_do_not_compile_on_their_own_are_invalid(self):
+        for pattern in ('a)|(b', '(?P<shop>x)', r'(a)\1', 'x(?i)y', '['):
+            rule = CategoryRule(user=self.user, match_type='regex', pattern=pattern, expense_category='groceries')
+            with self.assertRaises(ValidationError, msg=pattern):
+                rule.full_clean()
+        CategoryRule(user=self.user, match_type='regex', pattern=r'shop\s*\d+', expense_category='groceries').full_clean()
+
+    def test_first_matching_rule_by_priority_wins(self):
+        matcher = RuleMatcher([
+            CategoryRule(pk=1, priority=20, pattern='food', expense_category='groceries'),
+            CategoryRule(pk=2, priority=10, pattern='big food', expense_category='housing', min_amount=Decimal('100')),
+            CategoryRule(pk=3, priority=5, match_type='regex', pattern=r'^salary\b', income_category='salary'),
+        ])
+        self.assertEqual(matcher.match('expense', 'BIG FOOD shop', Decimal('150')).pk, 2)
+        self.assertEqual(matcher.match('expense', 'BIG FOOD shop', Decimal('50')).pk, 1)
+        self.assertEqual(matcher.match('income', 'Salary March').pk, 3)
+        self.assertIsNone(matcher.match('income', 'Food'))
+
+    def test_imports_skip_rules_saved_without_validation(self):
+        self.add_rule('a)|(b', match_type='regex', expense_category='housing')
+        self.add_rule('coffee', expense_category='restaurants')
+
+        response = self.import_csv('01-01-2024,expense,Coffee shop,3.00,,,,,Main,\n')
+        self.assertContains(response, '1 transactions uploaded successfully')
+        self.assertEqual(Expense.objects.get().category, 'restaurants')
+
+    def test_rules_are_applied_to_existing_transactions(self):
+        self.import_csv('01-01-2024,expense,Coffee shop,3.00,,,,,Main,\n')
+        self.add_rule('coffee', expense_category='restaurants', source='personal')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            changed = apply_category_rules(self.user)
+        self.assertEqual(changed, {'income': 0, 'expense': 1})
+        expense = Expense.objects.get()
+        self.assertEqual((expense.category, expense.source), ('restaurants', 'personal'))
+
+
+class DuplicateTests(TrackerTestCase):
+    def import_pairs(self, count):
+        today = timezone.localdate().strftime('%d-%m-%Y')
+        self.import_csv(''.join(
+            f'{today},expense,Card payment {number},{number}.00,,groceries,personal,variable,Main,\n'
+            f'{today},expense,CARD PAYMENT {number}.,{number}.00,,groceries,personal,variable,Main,\n'
+            for number in range(1, count + 1)
+        ))
+
+    def test_similar_transactions_are_paired(self):
+        self.import_pairs(2)
+        self.import_csv(f"{timezone.localdate():%d-%m-%Y},expense,Rent,1.00,,housing,personal,fixed,Main,\n")
+
+        response = self.get('/transactions/duplicates/')
+        self.assertEqual(len(response.context['duplicates']), 2)
+        for first, second, _ in response.context['duplicates']:
+            self.assertEqual(first.amount, second.amount)
+
+    def test_days_are_clamped(self):
+        response = self.get('/transactions/duplicates/', {'days': '1000000'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get('/transactions/duplicates/', {'days': 'many'}).status_code, 400)
+
+    def test_page_links_keep_the_period(self):
+        self.import_pairs(21)
+        response = self.get('/transactions/duplicates/', {'days': '30'})
+        self.assertContains(response, 'href="?days=30&amp;page=2"')
+
+        response = self.get('/transactions/duplicates/', {'days': '30', 'page': '2'})
+        self.assertEqual(response.context['days'], 30)
+        self.assertEqual(len(response.context['duplicates']), 1)
+
+
+class DescriptionIndexTests(TrackerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.import_csv(
+            '01-01-2024,income,Salary ACME,100.00,salary,,,,,Main\n'
+            '01-02-2024,income,Salary ACME,100.00,salary,,,,,Main\n'
+            '02-01-2024,income,Sale of bike,80.00,salary,,,,,Main\n'
+        )
+
+    def suggest(self, prefix):
+        return get_description_suggestions(self.user, prefix)
+
+    def test_most_used_descriptions_first(self):
+        response = self.get('/transactions/descriptions/', {'description': 'sa'})
+        self.assertEqual(response.context['suggestions'], ['Salary ACME', 'Sale of bike'])
+        self.assertEqual(self.suggest('sale'), ['Sale of bike'])
+        self.assertEqual(self.suggest('x'), [])
+
+    def test_new_transactions_are_added_on_a_copy(self):
+        published, _ = load_description_index(self.user.pk)
+        self.import_csv('03-01-2024,income,Sales commission,10.00,salary,,,,,Main\n')
+
+        self.assertIn('Sales commission', self.suggest('sales'))
+        self.assertNotIn('Sales commission', published.stats)
+
+    def test_rolled_back_transactions_are_not_added(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError):
+                with sharding.atomic():
+                    Transaction.objects.create(
+                        user=self.user, type='income', description='Savings bonus', amount=1, date=timezone.now(),
+                    )
+                    raise RuntimeError
+        self.assertEqual(self.suggest('savings'), [])
+
+    def test_edited_descriptions_are_retired(self):
+        self.assertEqual(self.suggest('sal'), ['Salary ACME', 'Sale of bike'])
+        transaction = Transaction.objects.get(description='Sale of bike')
+        self.post(f'/transactions/{transaction.pk}/update/', {
+            'type': 'income', 'date': '2024-01-02', 'description': 'Sold the bike', 'amount': '80',
+            'destination_account': self.account.pk, 'income_category': 'salary',
+        })
+        self.assertEqual(self.suggest('sal'), ['Salary ACME'])
+        self.assertEqual(self.suggest('sold'), ['Sold the bike'])
+
+
+class TaxReportTests(TrackerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.import_csv(
+            '01-01-2024,income,Salary,1000.00,salary,,,,,Main\n'
+            '01-02-2024,income,Salary,1000.00,salary,,,,,Main\n'
+            '03-01-2024,expense,Food,45.50,,groceries,personal,variable,Main,\n'
+            '03-01-2023,expense,Food,10.00,,groceries,personal,variable,Main,\n'
+        )
+        executor = mock.patch('tracker.tax_reports.get_executor')
+        self.executor = executor.start()
+        self.addCleanup(executor.stop)
+
+    def test_report_totals(self):
+        data = build_tax_report(self.user, 2024)
+        self.assertEqual(data['income']['total'], '2000.00')
+        self.assertEqual(data['income']['by_month'], {'2024-01': '1000.00', '2024-02': '1000.00'})
+        self.assertEqual(data['expenses']['total'], '45.50')
+
+    def test_report_is_built_in_the_background_and_marked_stale_by_writes(self):
+        response = self.get('/reports/tax/', {'year': 2024})
+        report = response.context['report']
+        self.assertEqual(report.status, 'pending')
+        self.assertEqual(self.executor.return_value.submit.call_count, 1)
+
+        generate_tax_report(report.pk)
+        report.refresh_from_db()
+        self.assertEqual((report.status, report.is_stale), ('ready', False))
+        self.assertContains(self.get('/reports/tax/2024/csv'), b'income,total,2000.00')
+
+        self.import_csv('05-05-2024,income,Bonus,5.00,salary,,,,,Main\n')
+        report.refresh_from_db()
+        self.assertTrue(report.is_stale)
+
+    def test_failed_report_is_only_rebuilt_on_request(self):
+        TaxReport.objects.create(user=self.user, year=2024, status='failed', error='boom')
+
+        response = self.get('/reports/tax/', {'year': 2024})
+        self.assertEqual(response.context['report'].status, 'failed')
+        self.assertNotContains(response, 'hx-trigger="every 2s"')
+        self.assertFalse(self.executor.return_value.submit.called)
+
+        response = self.post('/reports/tax/', {'year': 2024})
+        self.assertEqual(response.context['report'].status, 'pending')
+        self.assertEqual(self.executor.return_value.submit.call_count, 1)
+
+    def test_failed_report_is_rebuilt_after_a_delay(self):
+        TaxReport.objects.create(
+            user=self.user, year=2024, status='failed', requested_at=timezone.now() - FAILED_RETRY_DELAY * 2,
+        )
+        self.assertEqual(self.get('/reports/tax/', {'year': 2024}).context['report'].status, 'pending')
+
+
+@mock.patch('tracker.views.PAGE_TRANSACTIONS', 4)
+class InfiniteScrollTests(TrackerTestCase):
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        for number in range(10):
+            Transaction.objects.create(
+                user=self.user, type='expense', description=f'T{number:02d}', amount=1,
+                origin_account=self.account, date=now - timedelta(days=number),
+            )
+        self.descriptions = [f'T{number:02d}' for number in range(10)]
+
+    def scroll(self, **params):
+        descriptions = []
+        response = self.get('/transactions/', {'scroll': 'on', **params}, HTTP_HX_TARGET='transaction-rows')
+        while True:
+            descriptions.extend(transaction.description for transaction in response.context['transactions'])
+            cursor = response.context['next_cursor']
+            if not cursor:
+                return descriptions
+            response = self.get('/transactions/', {'scroll': 'on', 'cursor': cursor, **params})
+
+    def test_rows_only_response(self):
+        full = self.get('/transactions/', HTTP_HX_REQUEST='')
+        rows = self.get('/transactions/', {'page': 2}, HTTP_HX_TARGET='transaction-rows')
+        self.assertContains(full, 'Account Totals')
+        self.assertNotContains(rows, 'Account Totals')
+        self.assertContains(rows, 'hx-swap-oob="true"')
+        self.assertEqual([transaction.description for transaction in rows.context['transactions']], self.descriptions[4:8])
+
+    def test_scroll_reads_every_row_once(self):
+        self.assertEqual(self.scroll(), self.descriptions)
+
+    def test_scroll_continues_into_the_archive(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            archive_transactions(self.user, timezone.now() - timedelta(days=5, hours=12))
+        self.assertEqual(self.scroll(include_archive='on'), self.descriptions)
+
+    def test_backdated_hot_rows_are_listed_among_the_archived_ones(self):
+        now = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            archive_transactions(self.user, now - timedelta(days=5, hours=12))
+        # Created after archiving but dated before the cutoff
+        for description, days in (('B07', 7.5), ('B20', 20)):
+            Transaction.objects.create(
+                user=self.user, type='expense', description=description, amount=1,
+                origin_account=self.account, date=now - timedelta(days=days),
+            )
+        expected = self.descriptions[:8] + ['B07'] + self.descriptions[8:] + ['B20']
+
+        self.assertEqual(self.scroll(include_archive='on'), expected)
+
+        pages = []
+        for number in range(1, 4):
+            response = self.get('/transactions/', {'include_archive': 'on', 'page': number}, HTTP_HX_TARGET='transaction-rows')
+            pages.extend(transaction.description for transaction in response.context['transactions'])
+        self.assertEqual(pages, expected)
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.get('/transactions/', {'scroll': 'on', 'cursor': 'zz'}, HTTP_HX_TARGET='transaction-rows')
+        self.assertEqual(response.status_code, 400)
+
+
+class TransactionCountTests(TrackerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.import_csv(''.join(f'01-01-2024,income,Salary {number},1.00,salary,,,,,Main\n' for number in range(23)))
+        self.transactions = Transaction.objects.filter(user=self.user).order_by('pk')
+
+    def paginate(self, estimate):
+        with mock.patch('tracker.pagination.EXACT_COUNT_THRESHOLD', 3), \
+                mock.patch('tracker.pagination.get_planner_estimate', return_value=estimate):
+            paginator = CachedCountPaginator(self.transactions, 5, self.user.pk, QueryDict(f'estimate={estimate}'))
+            paginator.count
+        return paginator
+
+    def test_low_estimate_does_not_hide_rows(self):
+        paginator = self.paginate(estimate=4)
+        self.assertTrue(paginator.is_approximate)
+        self.assertEqual(paginator.num_pages, 1)
+
+        rows, page = [], paginator.get_page(1)
+        while True:
+            rows.extend(page.object_list)
+            if not page.has_next():
+                break
+            page = paginator.get_page(page.next_page_number())
+        self.assertEqual(rows, list(self.transactions))
+        self.assertEqual(page.number, 5)
+        self.assertEqual(list(paginator.get_page(9).object_list), [])
+
+    def test_estimate_below_the_counted_rows_is_ignored(self):
+        paginator = self.paginate(estimate=2)
+        self.assertEqual((paginator.count, paginator.is_approximate), (23, False))
+
+    def test_estimated_archive_is_read_to_the_end(self):
+        results = CombinedResults(self.transactions[:20], self.transactions[20:])
+        results.counts = [20, 1]
+        self.assertEqual(results[15:25], list(self.transactions[15:]))
+
+    def test_import_bumps_the_watermark_once(self):
+        watermark = get_count_watermark(self.user.pk)
+        with mock.patch('tracker.pagination.bump_count_watermark', wraps=bump_count_watermark) as bump:
+            self.import_csv(''.join(f'0{day}-01-2024,income,Bonus,1.00,salary,,,,,Main\n' for day in range(1, 6)))
+        bump.assert_called_once_with(self.user.pk)
+        self.assertEqual(get_count_watermark(self.user.pk), watermark + 1)
+
+    def test_writes_drop_cached_counts(self):
+        def count():
+            return self.get('/transactions/', HTTP_HX_REQUEST='').context['page_obj'].paginator.count
+
+        self.assertEqual(count(), 23)
+        self.import_csv('02-01-2024,income,Bonus,1.00,salary,,,,,Main\n')
+        self.assertEqual(count(), 24)
+
+        self.delete(f'/transactions/{self.transactions.first().pk}/delete/')
+        self.assertEqual(count(), 23)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            schedule_queryset_update(self.transactions.filter(description='Bonus'))
+            self.transactions.filter(description='Bonus').delete()
+        self.assertEqual(count(), 22)
+
+
+@pytest.mark.stress
+@unittest.skipUnless(connection.features.has_select_for_update, "Needs PostgreSQL, see TEST_DATABASE_NAME in settings/test.py")
+class ConcurrentBalanceUpdateTests(TransactionTestCase):
+    """
+    Hammers one account with concurrent creates, updates and deletes and checks
+    that no balance update is lost.
+    """
+    THREADS = 8
+    ROUNDS = 10
+
+    def setUp(self):
+        self.user = User.objects.create_user('stress', password='stress')
+        self.account = Account.objects.create(user=self.user, name='Main')
+        self.savings = Account.objects.create(user=self.user, name='Savings')
+
+    def run_client(self, worker, errors):
+        client = Client(HTTP_HX_REQUEST='true')
+        client.force_login(self.user)
+        try:
+            for round_number in range(self.ROUNDS):
+                description = f'stress-{worker}-{round_number}'
+                client.post('/transactions/create/', {
+                    'type': 'income',
+                    'date': '2024-01-01',
+                    'description': description,
+                    'amount': '10',
+                    'destination_account': self.account.pk,
+                    'income_category': 'salary',
+                })
+                transaction = Transaction.objects.get(description=description)
+
+                if round_number % 3 == 0:
+                    client.delete(f'/transactions/{transaction.pk}/delete/')
+                elif round_number % 3 == 1:
+                    client.post(f'/transactions/{transaction.pk}/update/', {
+                        'type': 'internal',
+                        'date': '2024-01-01',
+                        'description': description,
+                        'amount': '4',
+                        'origin_account': self.account.pk,
+                        'destination_account': self.savings.pk,
+                    })
+                else:
+                    client.post(f'/transactions/{transaction.pk}/update/', {
+                        'type': 'income',
+                        'date': '2024-01-01',
+                        'description': description,
+                        'amount': '25',
+                        'destination_account': self.account.pk,
+                        'income_category': 'salary',
+                    })
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connections.close_all()
+
+    def test_concurrent_writes_keep_balance_equal_to_ledger(self):
+        errors = []
+        threads = [threading.Thread(target=self.run_client, args=(worker, errors)) for worker in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+        totals = get_movement_totals([self.account.pk, self.savings.pk])
+        for account in Account.objects.filter(pk__in=[self.account.pk, self.savings.pk]):
+            self.assertEqual(account.balance, calculate_balance(account.account_type, totals[account.pk]))
+
+        # Per thread: rounds 1, 4, 7 move 4 out, rounds 2, 5, 8 add 25 and the rest are deleted
+        self.assertEqual(Account.objects.get(pk=self.account.pk).balance, Decimal(self.THREADS * (3 * 25 - 3 * 4)))
+        self.assertEqual(Account.objects.get(pk=self.savings.pk).balance, Decimal(self.THREADS * 3 * 4))
+
+
+@override_settings(TRACKER_SHARDS=['shard_1', 'shard_2', 'shard_3'])
+class ShardingTests(TransactionTestCase):
+    """
+    Spreads users over three SQLite shards and moves them between shards.
+    """
+    databases = {'default', 'shard_1', 'shard_2', 'shard_3'}
+
+    def setUp(self):
+        cache.clear()
+
+    def create_user(self, username, shard=None):
+        """
+        Creates a user with two accounts and a year of transactions, half of them
+        archived, on the given shard or their place on the hash ring.
+        """
+        user = User.objects.create_user(username, password=username)
+        if shard:
+            sharding.assign_user_shard(user.pk, shard)
+        sharding.mirror_user(user)
+        with sharding.use_user_shard(user):
+            Account.objects.create(user=user, name='Main')
+            Account.objects.create(user=user, name='Savings')
+
+        client = Client(HTTP_HX_REQUEST='true')
+        client.force_login(user)
+        rows = (
+            '01-06-2023,income,Salary,1000.00,salary,,,,,Main\n'
+            '02-06-2023,expense,Food,40.00,,groceries,personal,variable,Main,\n'
+            '03-06-2023,internal,Move,100.00,,,,,Main,Savings\n'
+            '01-02-2024,income,Bonus,50.00,salary,,,,,Main\n'
+            '02-02-2024,expense,Rent,300.00,,housing,personal,fixed,Main,\n'
+        )
+        response = client.post('/transactions/import', {'file': SimpleUploadedFile('t.csv', (CSV_HEADER + rows).encode())})
+        self.assertContains(response, '5 transactions uploaded successfully')
+        call_command('archive_transactions', before='2024-01-01', user=user.pk, stdout=io.StringIO())
+        return user, client
+
+    def assert_user_data(self, user, client, shard):
+        self.assertEqual(sharding.get_user_shard(user), shard)
+        for alias in {'shard_1', 'shard_2', 'shard_3'} - {shard}:
+            self.assertFalse(Account.objects.using(alias).filter(user=user).exists())
+        balances = dict(Account.objects.using(shard).filter(user=user).values_list('name', 'balance'))
+        self.assertEqual(balances, {'Main': Decimal('610'), 'Savings': Decimal('100')})
+        self.assertEqual(Transaction.objects.using(shard).filter(user=user).count(), 2)
+
+        archived = ArchivedTransaction.objects.using(shard).filter(user=user)
+        self.assertEqual(archived.count(), 3)
+        self.assertEqual(
+            ArchivedIncome.objects.using(shard).get(transaction__user=user).transaction.description, 'Salary'
+        )
+        self.assertEqual(ArchivedExpense.objects.using(shard).get(transaction__user=user).account.user, user)
+
+        response = client.get('/transactions/', {'include_archive': 'on'}, HTTP_HX_REQUEST='')
+        for description in ('Salary', 'Food', 'Move', 'Bonus', 'Rent'):
+            self.assertContains(response, description)
+        self.assertContains(response, '610.00')
+
+    def test_rolled_back_block_drops_its_batch(self):
+        flushed = []
+        with self.assertRaises(RuntimeError):
+            with sharding.atomic():
+                sharding.get_commit_batch('test', list, flushed.append).append(1)
+                raise RuntimeError
+        with sharding.atomic():
+            sharding.get_commit_batch('test', list, flushed.append).append(2)
+            sharding.get_commit_batch('test', list, flushed.append).append(3)
+        self.assertEqual(flushed, [[2, 3]])
+
+    def test_move_with_archived_rows_across_shards(self):
+        alice, alice_client = self.create_user('alice', shard='shard_1')
+        bob, bob_client = self.create_user('bob', shard='shard_2')
+        # Both shards numbered their rows from 1, so the archived ids of alice and bob overlap
+        self.assertTrue(
+            set(ArchivedTransaction.objects.using('shard_1').values_list('pk', flat=True))
+            & set(ArchivedTransaction.objects.using('shard_2').values_list('pk', flat=True))
+        )
+
+        for target in ('shard_2', 'shard_3', 'shard_1'):
+            moved = sharding.move_user_data(alice, target)
+            self.assertEqual((moved['Transaction'], moved['ArchivedTransaction']), (2, 3))
+            self.assert_user_data(alice, alice_client, target)
+        self.assert_user_data(bob, bob_client, 'shard_2')
+
+        # The keys given to the moved archived rows are never handed out again on the way
+        response = bob_client.post('/transactions/import', {
+            'file': SimpleUploadedFile('t.csv', (CSV_HEADER + '01-03-2024,income,Gift,5.00,salary,,,,,Main\n').encode()),
+        })
+        self.assertContains(response, '1 transactions uploaded successfully')
+        call_command('archive_transactions', before='2025-01-01', user=bob.pk, stdout=io.StringIO())
+        self.assertEqual(ArchivedTransaction.objects.using('shard_2').filter(user=bob).count(), 6)
+
+    def test_streamed_export_is_read_from_the_user_shard(self):
+        _, client = self.create_user('alice', shard='shard_2')
+        response = client.get('/transactions/export', {'format': 'ndjson'}, HTTP_HX_REQUEST='')
+        # The request's shard is not left behind for the thread's next request
+        self.assertIsNone(sharding._current_shard.get())
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 2)
+
+    def test_pinned_users_keep_their_shard_when_one_is_added(self):
+        with override_settings(TRACKER_SHARDS=['shard_1', 'shard_2']):
+            users = [self.create_user(f'user{number}') for number in range(12)]
+            homes = {user.pk: sharding.get_user_shard(user) for user, _ in users}
+            call_command('pin_user_shards', stdout=io.StringIO())
+
+        # With the new shard on the ring every user still finds their data
+        for user, client in users:
+            self.assert_user_data(user, client, homes[user.pk])
+
+        call_command('rebalance_shards', stdout=io.StringIO())
+        moved = [user for user, _ in users if sharding.get_hashed_shard(user.pk) == 'shard_3']
+        self.assertTrue(moved)
+        for user, client in users:
+            self.assert_user_data(user, client, sharding.get_hashed_shard(user.pk))
+
+    def test_shared_cache_is_required(self):
+        self.assertEqual([error.id for error in sharding.check_shard_cache(None)], ['tracker.E001'])
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+        with override_settings(CACHES=shared):
+            self.assertEqual(sharding.check_shard_cache(None), [])
@@ -1,64 +1,110 @@
+from collections import defaultdict
 from django.db.models import Sum
 from django.utils.timezone import now
 from decimal import Decimal
 
-from tracker.models import AccountBalanceHistory
+from tracker.models import Account, AccountBalanceHistory, Transaction, OpeningBalance
+from tracker.metrics import instrument
+from tracker.account_directory import invalidate_account_directory
+from tracker import sharding
 
 
-def adjust_account_balances(transaction):
+def get_affected_account_ids(transactions):
     """
-    Adjusts the balances of the involved accounts based on the transaction type.
+    Returns the ids of every account touched by the given transactions queryset.
     """
-    # Handle income transactions
-    if transaction.type == 'income':
-        # Update the destination account balance
-        update_account_balance(transaction.destination_account)
+    account_ids = set()
+    for origin_id, destination_id in transactions.order_by().values_list('origin_account_id', 'destination_account_id').distinct():
+        account_ids.update((origin_id, destination_id))
+    account_ids.discard(None)
+    return account_ids
 
-    # Handle expense transactions
-    elif transaction.type == 'expense':
-        # Update the origin account balance
-        update_account_balance(transaction.origin_account)
 
-    # Handle internal transactions
-    elif transaction.type == 'internal':
-        # Update balances for both the origin and destination accounts
-        update_account_balance(transaction.origin_account)
-        update_account_balance(transaction.destination_account)
+@instrument('update_account_balances')
+@sharding.atomic
+def update_account_balances(account_ids):
+    """
+    Recalculates the balance of each of the given accounts exactly once.
+
+    All the accounts are locked up front in primary key order, so concurrent
+    updates touching the same accounts wait for each other rather than deadlock.
+    The locks are FOR NO KEY UPDATE, which does not wait for the FOR KEY SHARE
+    locks taken by writes of transactions pointing at the accounts.
+    """
+    accounts = Account.objects.select_for_update(no_key=True).filter(pk__in=set(account_ids)).order_by('pk')
+    for account in accounts:
+        update_account_balance(account)
+
+
+def get_movement_totals(account_ids, transactions=None):
+    """
+    Returns the summed transaction amounts per account, keyed by (direction, type),
+    using one grouped query per direction for all of the given accounts.
+
+    Totals cover every hot transaction unless a narrower queryset is given.
+    """
+    if transactions is None:
+        transactions = Transaction.objects.all()
+    totals = defaultdict(lambda: defaultdict(Decimal))
+
+    for direction, field in (('in', 'destination_account_id'), ('out', 'origin_account_id')):
+        movements = (
+            transactions.filter(**{f'{field}__in': account_ids})
+            .order_by()
+            .values(field, 'type')
+            .annotate(total=Sum('amount'))
+            .values_list(field, 'type', 'total')
+        )
+        for account_id, transaction_type, total in movements:
+            totals[account_id][(direction, transaction_type)] = Decimal(total or 0)
+
+    return totals
+
+
+def get_opening_balances(account_ids):
+    """
+    Returns the balance carried over from archived transactions per account.
+    """
+    opening_balances = defaultdict(Decimal)
+    for account_id, balance in OpeningBalance.objects.filter(account_id__in=account_ids).values_list('account_id', 'balance'):
+        opening_balances[account_id] = balance
+    return opening_balances
+
 
-    # Handle tax-related transactions
-    elif transaction.type == 'tax':
-        if transaction.origin_account:
-            # Tax payment (expense, deduct from tax account)
-            update_account_balance(transaction.origin_account)
-        else:
-            # Tax related to income (add to tax account)
-            update_account_balance(transaction.destination_account)
+def calculate_balance(account_type, totals):
+    """
+    Calculates an account balance from its movement totals.
+    """
+    if account_type == 'virtual_tax':
+        return totals[('in', 'tax')] - totals[('out', 'tax')]
+
+    return (
+        totals[('in', 'income')] - totals[('out', 'expense')]
+        + totals[('in', 'internal')] - totals[('out', 'internal')]
+    )
 
 
+@sharding.atomic
 def update_account_balance(account):
     """
     Calculates the balance for the given account based on related transactions
     and updates the balance field directly.
-    """
-    # Get all movements
-    incoming = Decimal(account.transactions_to.filter(type='income').aggregate(total=Sum('amount'))['total'] or 0)
-    outgoing = Decimal(account.transactions_from.filter(type='expense').aggregate(total=Sum('amount'))['total'] or 0)
-
-    internal_in = Decimal(account.transactions_to.filter(type='internal').aggregate(total=Sum('amount'))['total'] or 0)
-    internal_out = Decimal(account.transactions_from.filter(type='internal').aggregate(total=Sum('amount'))['total'] or 0)
 
-    tax_in = Decimal(account.transactions_to.filter(type='tax').aggregate(total=Sum('amount'))['total'] or 0)
-    tax_out = Decimal(account.transactions_from.filter(type='tax').aggregate(total=Sum('amount'))['total'] or 0)
+    The account row stays locked until the surrounding transaction commits, so
+    concurrent recalculations run one after the other and the last one always
+    sees every committed transaction.
+    """
+    # Lock the account before reading its movements
+    account_type = Account.objects.select_for_update(no_key=True).values_list('account_type', flat=True).get(pk=account.pk)
 
-    # Calculate new balance
-    if account.account_type == 'virtual_tax':
-        new_balance = tax_in - tax_out
-    else:
-        new_balance = incoming - outgoing + internal_in - internal_out
+    # Get all movements and calculate the new balance on top of the archived one
+    totals = get_movement_totals([account.pk])[account.pk]
+    new_balance = get_opening_balances([account.pk])[account.pk] + calculate_balance(account_type, totals)
 
-    # Update the balance and save
+    # Write only the balance, so concurrent edits to other fields are not overwritten
+    Account.objects.filter(pk=account.pk).update(balance=new_balance)
     account.balance = new_balance
-    account.save()
+    schedule_directory_invalidation(account.user_id)
 
     # Record the updated balance in the history
     record_account_balance(account)
@@ -82,3 +128,23 @@ def record_account_balance(account):
         balance=account.balance,
         timestamp=current_time,
     )
+    # Balance history feeds cached series such as net worth, keyed by the directory version
+    schedule_directory_invalidation(account.user_id)
+
+
+def schedule_directory_invalidation(user_id):
+    """
+    Drops the user's cached account directory once the outermost atomic block
+    commits, or right away outside of one, however many accounts and history
+    rows the block wrote.
+    """
+    pending = sharding.get_commit_batch('directory-invalidations', set, flush_directory_invalidations)
+    if pending is None:
+        invalidate_account_directory(user_id)
+    else:
+        pending.add(user_id)
+
+
+def flush_directory_invalidations(user_ids):
+    for user_id in user_ids:
+        invalidate_account_directory(user_id)
@@ -1,18 +1,30 @@
 from django.urls import path
 from tracker import views
 
-from .views import TransactionsListView, TransactionsCreateView, TransactionsUpdateView, TransactionsDeleteView, TransactionsExportView, TransactionsImportView, TotalsView
+from .views import TransactionsListView, TransactionsCreateView, TransactionsUpdateView, TransactionsDeleteView, TransactionsBulkUpdateView, TransactionsBulkDeleteView, TransactionsExportView, TransactionsImportView, TotalsView, NetWorthView, TransactionsApiView, TransactionsIngestView, TransactionsDuplicatesView, DescriptionSuggestionsView, TaxReportView, TaxReportDownloadView
 
 
 urlpatterns = [
     path("", views.index, name='index'),
     path('transactions/', TransactionsListView.as_view(), name='transactions-list'),
     path('totals/', TotalsView.as_view(), name='totals-view'),
+    path('net-worth/', NetWorthView.as_view(), name='net-worth'),
+    path('reports/tax/', TaxReportView.as_view(), name='tax-report'),
+    path('reports/tax/<int:year>/csv', TaxReportDownloadView.as_view(), name='tax-report-csv'),
     path('transactions/create/', TransactionsCreateView.as_view(), name='create-transaction'),
 
     path('transactions/<int:pk>/update/', TransactionsUpdateView.as_view(), name='update-transaction'),
     path('transactions/<int:pk>/delete/', TransactionsDeleteView.as_view(), name='delete-transaction'),
+    path('transactions/bulk/update/', TransactionsBulkUpdateView.as_view(), name='bulk-update-transactions'),
+    path('transactions/bulk/delete/', TransactionsBulkDeleteView.as_view(), name='bulk-delete-transactions'),
 
     path('transactions/export', TransactionsExportView.as_view(), name='export'),
     path('transactions/import', TransactionsImportView.as_view(), name='import'),
+    path('transactions/descriptions/', DescriptionSuggestionsView.as_view(), name='description-suggestions'),
+    path('transactions/duplicates/', TransactionsDuplicatesView.as_view(), name='duplicate-transactions'),
+
+    path('api/transactions/', TransactionsApiView.as_view(), name='api-transactions'),
+    path('api/transactions/ingest/', TransactionsIngestView.as_view(), name='api-ingest-transactions'),
+
+    path('metrics', views.metrics_view, name='metrics'),
 ]
@@ -1,31 +1,60 @@
+from datetime import timedelta
+
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView, View
+from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
+from django.middleware.csrf import CsrfViewMiddleware
 from django.shortcuts import render
-from django.http import HttpResponseNotAllowed, HttpResponse
+from django.conf import settings
+from django.http import Http404, JsonResponse, HttpResponseForbidden, HttpResponseNotAllowed, HttpResponse, HttpResponseBadRequest, StreamingHttpResponse, FileResponse
 from django.core.paginator import Paginator
 from django.db.models import Sum
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
 
-from tracker.models import Transaction, Income, Expense, Account
+from tracker.models import Transaction, Income, Expense, ArchiveCheckpoint, TaxReport
 from tracker.filters import TransactionFilter
-from tracker.forms import TransactionForm
-from tracker.resources import TransactionExportResource, TransactionImportResource
-from tracker.tracker_helpers import adjust_account_balances
-
-from tablib import Dataset
+from tracker.forms import TransactionForm, TransactionBulkUpdateForm
+from tracker import exporters
+from tracker.importers import ARROW_EXTENSIONS, import_arrow_transactions, import_ndjson_transactions
+from tracker import profiling
+from tracker import metrics
+from tracker.tracker_helpers import get_affected_account_ids
+from tracker.ledger import schedule_balance_update, schedule_transaction_update
+from tracker.account_directory import get_account_directory
+from tracker import net_worth
+from tracker import api
+from tracker.archive import combine_with_archive, get_archived_transactions
+from tracker.pagination import CachedCountPaginator, get_page_query, schedule_count_invalidation
+from tracker.budgets import apply_spend_changes, collect_expense_spend, diff_spend, get_budget_status
+from tracker.duplicates import find_duplicates
+from tracker.description_index import get_description_suggestions, invalidate_description_index
+from tracker.tax_reports import get_report_years, mark_queryset_stale, mark_transactions_stale, request_tax_report
+from tracker import sharding
 
 PAGE_TRANSACTIONS = 20
 
+# Default and largest number of days back the duplicates review looks at
+DUPLICATE_REVIEW_DAYS = 90
+MAX_DUPLICATE_REVIEW_DAYS = 10 * 366
+
 def index(request):
     return render(request, 'tracker/index.html')
 
 
 class TransactionsListView(LoginRequiredMixin, ListView):
+    """
+    Lists the user's transactions, with three HTMX responses besides the full page:
+    the whole container after a form post, only the table rows (with the pagination
+    swapped out of band) on filter changes and page turns, and the next batch of
+    rows after a keyset cursor in infinite scroll mode.
+    """
     model = Transaction
     context_object_name = 'transactions'
 
-    # Specify accounts to display
-    ACCOUNTS_TO_DISPLAY = ['BPI', 'Trade Republic', 'ActivoBank']
-
     def get_queryset(self):
         """Fetches and filters the queryset based on user and optional filtering."""
         queryset = Transaction.objects.filter(user=self.request.user).select_related('expense_transaction', 'income_transaction')
@@ -35,41 +64,65 @@ class TransactionsListView(LoginRequiredMixin, ListView):
             return transaction_filter.qs
         return queryset
 
-    def get_context_data(self, **kwargs):
-        """Adds filtered transactions, pagination, and income/expense totals to the context."""
-        self.object_list = self.get_queryset()
-        
-        # Call the parent's method to initialize context
-        context = super().get_context_data(**kwargs)
-
-        # Apply filtering
+    def get_filtered_transactions(self):
+        """
+        Returns the filter and the querysets to list, the hot transactions and
+        the archive when it is included.
+        """
         transaction_filter = TransactionFilter(self.request.GET, queryset=self.get_queryset())
-        filtered_transactions = transaction_filter.qs
+        querysets = [transaction_filter.qs]
+
+        if transaction_filter.includes_archive():
+            archived_filter = TransactionFilter(self.request.GET, queryset=get_archived_transactions(self.request.user))
+            querysets.append(archived_filter.qs)
+        return transaction_filter, querysets
+
+    def get_rows_context(self):
+        """
+        Returns the context of the table rows: one page of transactions, or in
+        infinite scroll mode the batch after the `cursor` and the next cursor.
+        """
+        transaction_filter, querysets = self.get_filtered_transactions()
+        context = {'filter': transaction_filter, 'scroll': self.request.GET.get('scroll') == 'on'}
+
+        if context['scroll']:
+            transactions, next_cursor = api.get_cursor_page(querysets, self.request.GET.get('cursor'), PAGE_TRANSACTIONS)
+            context.update({'transactions': transactions, 'next_cursor': next_cursor})
+            return context
 
         # Pagination logic
-        paginator = Paginator(filtered_transactions, PAGE_TRANSACTIONS)
+        filtered_transactions = querysets[0] if len(querysets) == 1 else combine_with_archive(self.request.user, *querysets)
+        paginator = CachedCountPaginator(filtered_transactions, PAGE_TRANSACTIONS, self.request.user.pk, self.request.GET)
         page_number = self.request.GET.get('page')
         page_obj = paginator.get_page(page_number)
-
-        # Get balances for each account
-        accounts = Account.objects.filter(name__in=self.ACCOUNTS_TO_DISPLAY, user=self.request.user)
-        account_balances = {
-            account.name: account.balance
-            for account in accounts
-        }
-
-        # Add to context
-        context = {
-            'filter': transaction_filter,
+        context.update({
             'page_obj': page_obj,
             'transactions': page_obj.object_list,
-            'account_balances': account_balances,
-        }
+            'page_query': get_page_query(self.request.GET),
+        })
+        return context
+
+    def get_context_data(self, **kwargs):
+        """Adds filtered transactions, pagination, and income/expense totals to the context."""
+        context = self.get_rows_context()
+
+        # Get balances for each account from the cached account directory
+        context['account_balances'] = list(get_account_directory(self.request.user))
+        context['budgets'] = get_budget_status(self.request.user)
         return context
 
     def get(self, request, *args, **kwargs):
         """Handles both regular and HTMX requests to render partials or full templates."""
-        context = self.get_context_data()
+        # Rows only: the account totals, budgets and filter form are left as they are on the page
+        rows_only = request.htmx and (request.GET.get('cursor') or request.htmx.target == 'transaction-rows')
+        try:
+            context = self.get_rows_context() if rows_only else self.get_context_data()
+        except ValueError as e:
+            return HttpResponseBadRequest(str(e))
+
+        if rows_only:
+            context['oob'] = not request.GET.get('cursor')
+            return render(request, 'tracker/partials/transaction-rows.html', context)
         if request.htmx:
             return render(request, 'tracker/partials/transactions-container.html', context)
 
@@ -82,15 +135,18 @@ class TransactionsCreateView(LoginRequiredMixin, CreateView):
     template_name = 'tracker/partials/create-transaction.html'
     success_url = '/transactions/success/'
 
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs['user'] = self.request.user
+        return kwargs
+
     def form_valid(self, form):
         # Set the user before saving the transaction
         form.instance.user = self.request.user
 
-        # Save the transaction
-        response = super().form_valid(form)
-
-        # Adjust account balances based on the newly created transaction
-        adjust_account_balances(form.instance)
+        # Save the transaction; the form schedules the balance update for when it commits
+        with sharding.atomic():
+            response = super().form_valid(form)
 
         # Handle HTMX requests
         if self.request.htmx:
@@ -119,6 +175,11 @@ class TransactionsUpdateView(LoginRequiredMixin, UpdateView):
     template_name = 'tracker/partials/update-transaction.html'
     success_url = '/transactions/success/'
 
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs['user'] = self.request.user
+        return kwargs
+
     def get_initial(self):
         initial = super().get_initial()
         transaction = self.object
@@ -157,66 +218,45 @@ class TransactionsUpdateView(LoginRequiredMixin, UpdateView):
         # Get the new transaction from the form without saving to the DB
         transaction = form.save(commit=False)
 
-        # Get the original transaction values before updating
-        original_transaction = Transaction.objects.get(pk=transaction.pk)
-        original_amount = original_transaction.amount
-        original_origin_account = original_transaction.origin_account
-        original_destination_account = original_transaction.destination_account
+        with sharding.atomic():
+            # Lock the original transaction so concurrent edits of it are applied one at a time
+            original_transaction = Transaction.objects.select_for_update().get(pk=transaction.pk)
+            account_ids = {original_transaction.origin_account_id, original_transaction.destination_account_id}
+            original_spend = collect_expense_spend(Expense.objects.filter(transaction=original_transaction))
+
+            # Update the Income/Expense record associated with the transaction
+            if transaction.type == 'income':
+                income, created = Income.objects.update_or_create(
+                    transaction=transaction,
+                    defaults={
+                        'amount': transaction.amount,
+                        'date': transaction.date,
+                        'category': form.cleaned_data.get('income_category'),
+                        'account': transaction.destination_account,
+                    }
+                )
+            elif transaction.type == 'expense':
+                expense, created = Expense.objects.update_or_create(
+                    transaction=transaction,
+                    defaults={
+                        'amount': transaction.amount,
+                        'date': transaction.date,
+                        'category': form.cleaned_data.get('expense_category'),
+                        'account': transaction.origin_account,
+                        'fixed_or_variable': form.cleaned_data.get('expense_type'),
+                        'source': form.cleaned_data.get('expense_source'),
+                    }
+                )
 
-        # Adjust balances based on the type of transaction and the original values
-        if transaction.type == 'income':
-            # Deduct the original amount from the original destination account
-            original_destination_account.balance -= original_amount
-            original_destination_account.save()
-
-            # Update the Income record associated with the transaction
-            income, created = Income.objects.update_or_create(
-                transaction=transaction,
-                defaults={
-                    'amount': transaction.amount,
-                    'date': transaction.date,
-                    'category': form.cleaned_data.get('income_category'),
-                    'account': transaction.destination_account,
-                }
-            )
-        elif transaction.type == 'expense':
-            # Add the original amount to the original origin account
-            original_origin_account.balance += original_amount
-            original_origin_account.save()
-
-            # Update the Expense record associated with the transaction
-            expense, created = Expense.objects.update_or_create(
-                transaction=transaction,
-                defaults={
-                    'amount': transaction.amount,
-                    'date': transaction.date,
-                    'category': form.cleaned_data.get('expense_category'),
-                    'account': transaction.origin_account,
-                    'fixed_or_variable': form.cleaned_data.get('expense_type'),
-                    'source': form.cleaned_data.get('expense_source'),
-                }
-            )
-        elif transaction.type == 'internal':
-            # Restore original amounts to both origin and destination accounts
-            original_origin_account.balance += original_amount
-            original_origin_account.save()
-            original_destination_account.balance -= original_amount
-            original_destination_account.save()
-        elif transaction.type == 'tax':
-            # Income-related tax transaction
-            if original_destination_account:
-                original_destination_account.balance -= original_amount
-                original_destination_account.save()
-            # Expense-related tax transaction
-            elif original_origin_account:
-                original_origin_account.balance += original_amount
-                original_origin_account.save()
-
-        # Save the updated transaction
-        transaction.save()
-
-        # Adjust account balances after the update
-        adjust_account_balances(transaction)
+            # Save the updated transaction
+            transaction.save()
+
+            # Recalculate the original and the new accounts from the ledger once the update commits
+            account_ids.update((transaction.origin_account_id, transaction.destination_account_id))
+            schedule_balance_update(account_ids)
+            mark_transactions_stale(original_transaction, transaction)
+            schedule_count_invalidation([transaction.user_id])
+            apply_spend_changes(diff_spend(original_spend, collect_expense_spend(Expense.objects.filter(transaction=transaction))))
 
         if self.request.htmx:
             return render(
@@ -242,12 +282,14 @@ class TransactionsDeleteView(LoginRequiredMixin, DeleteView):
         # Store the transaction details to display a message
         amount = self.object.amount
         date = self.object.date
+        spend = collect_expense_spend(Expense.objects.filter(transaction=self.object))
 
-        # Perform the deletion
-        self.object.delete()
-
-        # Adjust the account balances after deleting the transaction
-        adjust_account_balances(self.object)
+        # Perform the deletion and adjust the account balances once it commits
+        with sharding.atomic():
+            self.object.delete()
+            schedule_transaction_update(self.object)
+            apply_spend_changes(spend, sign=-1)
+            sharding.on_commit(lambda: invalidate_description_index(request.user.pk))
 
         context = {
             'message': f"Transaction of {amount} on {date} was deleted successfully!"
@@ -255,6 +297,126 @@ class TransactionsDeleteView(LoginRequiredMixin, DeleteView):
         return render(request, self.template_name, context)
 
 
+class BulkSelectionMixin:
+    """
+    Resolves the transactions a bulk action applies to, either from explicitly
+    selected ids or, when `selection=filter` is given, from the current filter.
+    """
+
+    def get_selection(self, data):
+        user_transactions = Transaction.objects.filter(user=self.request.user)
+
+        if data.get('selection') == 'filter':
+            transaction_filter = TransactionFilter(data, queryset=user_transactions)
+            selected = transaction_filter.qs
+        else:
+            ids = [pk for pk in data.getlist('ids') if pk.isdigit()]
+            selected = user_transactions.filter(pk__in=ids)
+
+        # Re-select by primary key so the queryset supports a single DELETE/UPDATE
+        return Transaction.objects.filter(pk__in=selected.values('pk'))
+
+    def get_selection_params(self, data):
+        return [
+            (name, value)
+            for name, values in data.lists()
+            if name != 'csrfmiddlewaretoken'
+            for value in values
+        ]
+
+
+class TransactionsBulkDeleteView(LoginRequiredMixin, BulkSelectionMixin, View):
+    template_name = 'tracker/partials/transaction-success.html'
+
+    def post(self, request, *args, **kwargs):
+        with sharding.atomic():
+            selected = self.get_selection(request.POST)
+            count = selected.count()
+            account_ids = get_affected_account_ids(selected)
+            spend = collect_expense_spend(Expense.objects.filter(transaction__in=selected))
+            mark_queryset_stale(selected)
+            schedule_count_invalidation([request.user.pk])
+
+            # Income/Expense/Tax rows are removed by the cascade in the same transaction
+            selected.delete()
+
+            # Recompute each affected account once and remove the spend from the budgets
+            schedule_balance_update(account_ids)
+            apply_spend_changes(spend, sign=-1)
+            sharding.on_commit(lambda: invalidate_description_index(request.user.pk))
+
+        return render(request, self.template_name, {
+            'message': f"{count} transactions were deleted successfully!",
+        })
+
+
+class TransactionsBulkUpdateView(LoginRequiredMixin, BulkSelectionMixin, View):
+    template_name = 'tracker/partials/bulk-update-transaction.html'
+
+    def get(self, request, *args, **kwargs):
+        context = {
+            'form': TransactionBulkUpdateForm(user=request.user),
+            'selection_params': self.get_selection_params(request.GET),
+        }
+        return render(request, self.template_name, context)
+
+    def post(self, request, *args, **kwargs):
+        form = TransactionBulkUpdateForm(request.POST, user=request.user)
+        if not form.is_valid():
+            context = {
+                'form': form,
+                'selection_params': self.get_selection_params(request.POST),
+            }
+            return render(request, self.template_name, context)
+
+        changes = form.get_changes()
+
+        with sharding.atomic():
+            selected = self.get_selection(request.POST)
+            count = selected.count()
+            account_ids = get_affected_account_ids(selected)
+            original_spend = collect_expense_spend(Expense.objects.filter(transaction__in=selected))
+            mark_queryset_stale(selected)
+            schedule_count_invalidation([request.user.pk])
+
+            # Step 1: Recategorise the related Expense and Income rows
+            expense_changes = {
+                field: changes[key]
+                for key, field in (('expense_category', 'category'), ('expense_source', 'source'), ('expense_type', 'fixed_or_variable'))
+                if key in changes
+            }
+            if 'origin_account' in changes:
+                expense_changes['account'] = changes['origin_account']
+            if expense_changes:
+                Expense.objects.filter(transaction__in=selected.filter(type='expense')).update(**expense_changes)
+
+            income_changes = {'category': changes['income_category']} if 'income_category' in changes else {}
+            if 'destination_account' in changes:
+                income_changes['account'] = changes['destination_account']
+            if income_changes:
+                Income.objects.filter(transaction__in=selected.filter(type='income')).update(**income_changes)
+
+            # Step 2: Move the transactions themselves, only on the side they already use
+            if 'origin_account' in changes:
+                selected.filter(origin_account__isnull=False).update(origin_account=changes['origin_account'])
+                account_ids.add(changes['origin_account'].pk)
+            if 'destination_account' in changes:
+                selected.filter(destination_account__isnull=False).update(destination_account=changes['destination_account'])
+                account_ids.add(changes['destination_account'].pk)
+
+            # Step 3: Recompute each affected account once, after commit
+            if 'origin_account' in changes or 'destination_account' in changes:
+                schedule_balance_update(account_ids)
+
+            # Step 4: Move the spend between budget categories
+            if 'expense_category' in changes:
+                apply_spend_changes(diff_spend(original_spend, collect_expense_spend(Expense.objects.filter(transaction__in=selected))))
+
+        return render(request, 'tracker/partials/transaction-success.html', {
+            'message': f"{count} transactions successfully updated!",
+        })
+
+
 class TransactionsExportView(LoginRequiredMixin, View):
     def get(self, request, *args, **kwargs):
         if request.htmx:
@@ -262,12 +424,61 @@ class TransactionsExportView(LoginRequiredMixin, View):
 
         transaction_filter = TransactionFilter(
             request.GET,
-            queryset=Transaction.objects.filter(user=request.user).select_related('expense_transaction', 'income_transaction')
+            queryset=Transaction.objects.filter(user=request.user).select_related(
+                'expense_transaction', 'income_transaction', 'origin_account', 'destination_account',
+            )
         )
 
-        data = TransactionExportResource().export(transaction_filter.qs)
-        response = HttpResponse(data.csv, content_type="text/csv")
-        response['Content-Disposition'] = 'attachment; filename="transactions.csv"'
+        export_format = request.GET.get('format', 'csv')
+        if export_format not in exporters.EXPORT_FORMATS:
+            return HttpResponseBadRequest(f"Unsupported export format: {export_format}")
+        try:
+            encoding, as_file = exporters.negotiate_compression(request)
+        except exporters.EncodingNotAcceptable as e:
+            return HttpResponse(str(e), status=406, content_type='text/plain')
+        except ValueError as e:
+            return HttpResponseBadRequest(str(e))
+
+        # Archived transactions are exported first, keeping the output in date order
+        querysets = [transaction_filter.qs]
+        if transaction_filter.includes_archive():
+            archived_filter = TransactionFilter(
+                request.GET,
+                queryset=get_archived_transactions(request.user).select_related('origin_account', 'destination_account'),
+            )
+            querysets.insert(0, archived_filter.qs)
+
+        # Rows are read in batches and written out as they are produced
+        content_type, filename = exporters.EXPORT_FORMATS[export_format]
+        if export_format == 'parquet':
+            # Parquet columns are already compressed internally
+            with metrics.track('export_parquet'):
+                output = exporters.write_parquet(*querysets)
+            return FileResponse(
+                output,
+                as_attachment=True,
+                filename=filename,
+                content_type=content_type,
+            )
+
+        streams = {
+            'csv': exporters.stream_csv,
+            'ndjson': exporters.stream_ndjson,
+            'arrow': exporters.stream_arrow,
+        }
+        chunks = metrics.track_stream(f'export_{export_format}', streams[export_format](*querysets))
+
+        if encoding:
+            chunks = exporters.compress_stream(chunks, encoding)
+            if as_file:
+                extension, content_type = exporters.COMPRESSIONS[encoding]
+                filename = f'{filename}.{extension}'
+
+        response = StreamingHttpResponse(chunks, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        patch_vary_headers(response, ['Accept-Encoding'])
+        if encoding and not as_file:
+            response['Content-Encoding'] = encoding
         return response
 
 
@@ -280,6 +491,23 @@ class TransactionsImportView(LoginRequiredMixin, View):
         if not file:
             return render(request, 'tracker/partials/transaction-success.html', {'message': 'No file uploaded.'})
 
+        # Optionally skip rows that look like a stored transaction, see tracker.duplicates
+        skip_duplicates = request.POST.get('skip_duplicates') == 'on'
+
+        # Columnar files are validated and inserted in batches, bypassing the row-by-row resource
+        if file.name.lower().endswith(ARROW_EXTENSIONS):
+            try:
+                created = import_arrow_transactions(file, file.name.lower(), request.user, skip_duplicates)
+            except Exception as e:
+                return render(request, 'tracker/partials/transaction-success.html', {'message': f"Error during import: {e}"})
+
+            return render(request, 'tracker/partials/transaction-success.html', {'message': f'{created} transactions uploaded successfully!'})
+
+        # The import/export machinery is only loaded when a CSV import actually happens
+        from tablib import Dataset
+        from import_export.results import RowResult
+        from tracker.resources import TransactionImportResource
+
         resource = TransactionImportResource()
         dataset = Dataset()
 
@@ -291,7 +519,9 @@ class TransactionsImportView(LoginRequiredMixin, View):
         
         # Dry run the import to first check for errors
         try:
-            result = resource.import_data(dataset, user=request.user, dry_run=True, raise_errors=True)
+            result = resource.import_data(
+                dataset, user=request.user, dry_run=True, raise_errors=True, skip_duplicates=skip_duplicates,
+            )
         except Exception as e:
             return render(request, 'tracker/partials/transaction-success.html', {'message': f"Error during dry run: {e}"})
 
@@ -307,14 +537,197 @@ class TransactionsImportView(LoginRequiredMixin, View):
                 'errors': errors,
             })
 
-        # Perform the actual import
+        # Perform the actual import in one transaction, so each account is recalculated once at the end
         try:
-            resource.import_data(dataset, user=request.user, dry_run=False)
+            with sharding.atomic():
+                result = resource.import_data(dataset, user=request.user, dry_run=False, skip_duplicates=skip_duplicates)
         except Exception as e:
             return render(request, 'tracker/partials/transaction-success.html', {'message': f"Error during actual import: {e}"})
 
         # Return the success message after the transaction import
-        return render(request, 'tracker/partials/transaction-success.html', {'message': f'{len(dataset)} transactions uploaded successfully!'})
+        skipped = result.totals[RowResult.IMPORT_TYPE_SKIP]
+        message = f'{len(dataset) - skipped} transactions uploaded successfully!'
+        if skipped:
+            message += f' {skipped} suspected duplicates were skipped.'
+        return render(request, 'tracker/partials/transaction-success.html', {'message': message})
+
+
+class DescriptionSuggestionsView(LoginRequiredMixin, View):
+    """
+    Suggests descriptions the user has used before that start with the typed
+    text, as <option> elements for the description field's datalist.
+    """
+
+    def get(self, request, *args, **kwargs):
+        suggestions = get_description_suggestions(request.user, request.GET.get('description', '').strip())
+        return render(request, 'tracker/partials/description-suggestions.html', {'suggestions': suggestions})
+
+
+class TransactionsDuplicatesView(LoginRequiredMixin, View):
+    """
+    Lists pairs of recent transactions that look like the same bank movement
+    imported twice, so one of them can be deleted.
+    """
+
+    def get(self, request, *args, **kwargs):
+        try:
+            days = int(request.GET.get('days', DUPLICATE_REVIEW_DAYS))
+        except ValueError:
+            return HttpResponseBadRequest("days must be a number")
+
+        days = min(max(days, 1), MAX_DUPLICATE_REVIEW_DAYS)
+        since = timezone.now() - timedelta(days=days)
+        pairs = find_duplicates(Transaction.objects.filter(user=request.user, date__gte=since))
+
+        paginator = Paginator(pairs, PAGE_TRANSACTIONS)
+        page_obj = paginator.get_page(request.GET.get('page'))
+
+        # Load the transactions of the current page only
+        transactions = Transaction.objects.select_related('expense_transaction', 'income_transaction').in_bulk(
+            {pk for pair in page_obj for pk in (pair.first_id, pair.second_id)}
+        )
+        context = {
+            'days': days,
+            'page_obj': page_obj,
+            'page_query': get_page_query(request.GET),
+            'duplicates': [
+                (transactions[pair.first_id], transactions[pair.second_id], pair.similarity)
+                for pair in page_obj
+            ],
+        }
+        if request.htmx:
+            return render(request, 'tracker/partials/duplicate-transactions.html', context)
+        return render(request, 'tracker/duplicate-transactions.html', context)
+
+
+class TaxReportView(LoginRequiredMixin, View):
+    """
+    Shows the user's precomputed tax report for a year. The report is built in the
+    background, so while it is pending the partial polls until it is ready. A
+    failed report is built again by posting the year.
+    """
+
+    def get(self, request, *args, **kwargs):
+        return self.render_report(request, request.GET.get('year'))
+
+    def post(self, request, *args, **kwargs):
+        return self.render_report(request, request.POST.get('year'), retry=True)
+
+    def render_report(self, request, year, retry=False):
+        years = get_report_years(request.user)
+        try:
+            year = int(year or years[0])
+        except ValueError:
+            return HttpResponseBadRequest("year must be a number")
+        if year not in years:
+            raise Http404("No transactions in that year")
+
+        context = {'report': request_tax_report(request.user, year, retry=retry), 'years': years}
+        if request.htmx:
+            return render(request, 'tracker/partials/tax-report.html', context)
+        return render(request, 'tracker/tax-report.html', context)
+
+
+class TaxReportDownloadView(LoginRequiredMixin, View):
+    def get(self, request, year, *args, **kwargs):
+        report = TaxReport.objects.filter(user=request.user, year=year, status='ready').first()
+        if report is None or not report.csv_file:
+            raise Http404("Tax report not ready")
+        return FileResponse(report.csv_file.open('rb'), as_attachment=True, filename=f'tax-report-{year}.csv')
+
+
+class NetWorthView(LoginRequiredMixin, View):
+    def get(self, request, *args, **kwargs):
+        period = request.GET.get('period', 'month')
+        if period not in net_worth.PERIODS:
+            return HttpResponseBadRequest(f"Unsupported period: {period}")
+
+        try:
+            max_points = int(request.GET.get('max_points', net_worth.DEFAULT_MAX_POINTS))
+        except ValueError:
+            return HttpResponseBadRequest("max_points must be a number")
+        max_points = min(max(max_points, 1), net_worth.MAX_POINTS_LIMIT)
+
+        by_type = request.GET.get('by_type') in ('1', 'true')
+        series = net_worth.get_net_worth_series(request.user, period, by_type, max_points)
+
+        return JsonResponse({'period': period, 'points': series})
+
+
+class ApiAuthMixin:
+    """
+    Authenticates API requests by an `Authorization: Bearer <token>` header (see
+    the create_api_token command) or by the browser session. Token requests carry
+    no cookies, so they skip the CSRF check; session requests still go through it.
+    """
+
+    @method_decorator(csrf_exempt)
+    def dispatch(self, request, *args, **kwargs):
+        authorization = request.headers.get('Authorization', '')
+        if authorization.startswith('Bearer '):
+            user = api.authenticate_token(authorization.partition(' ')[2].strip())
+            if user is None:
+                return JsonResponse({'error': "Invalid API token"}, status=401)
+            request.user = user
+            sharding.activate_user_shard(user)
+        elif not request.user.is_authenticated:
+            return JsonResponse({'error': "Authentication required"}, status=401)
+        else:
+            rejected = CsrfViewMiddleware(lambda request: None).process_view(request, None, (), {})
+            if rejected is not None:
+                return rejected
+        return super().dispatch(request, *args, **kwargs)
+
+
+class TransactionsApiView(ApiAuthMixin, View):
+    """
+    Read-only JSON listing of the user's transactions, with the same filters as
+    the list view, keyset cursors (`cursor`), page size (`limit`) and a sparse
+    fieldset (`fields=date,amount,...`).
+    """
+
+    def get(self, request, *args, **kwargs):
+        try:
+            fields = api.parse_fields(request.GET.get('fields'))
+            limit = api.parse_limit(request.GET.get('limit'))
+            transaction_filter = TransactionFilter(request.GET, queryset=Transaction.objects.filter(user=request.user))
+            if not transaction_filter.is_valid():
+                return JsonResponse({'error': transaction_filter.errors.get_json_data()}, status=400)
+            queryset = api.apply_cursor(transaction_filter.qs, request.GET.get('cursor'))
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        chunks = metrics.track_stream('api_transactions', api.stream_page(queryset, fields, limit))
+        return StreamingHttpResponse(chunks, content_type='application/json')
+
+
+class TransactionsIngestView(ApiAuthMixin, View):
+    """
+    Bulk creation of transactions from an NDJSON request body, one JSON object per
+    line with the columns of the CSV import. Retries sent with the same
+    Idempotency-Key header return the first outcome without importing again, and
+    ?skip_duplicates=1 also skips rows that look like a stored transaction.
+    """
+    content_types = ('application/x-ndjson', 'application/jsonl', 'application/json')
+
+    def post(self, request, *args, **kwargs):
+        if request.content_type not in self.content_types:
+            return JsonResponse({'error': f"Unsupported content type: {request.content_type}"}, status=415)
+
+        idempotency_key = request.headers.get('Idempotency-Key')
+        if idempotency_key is not None and not 0 < len(idempotency_key) <= 255:
+            return JsonResponse({'error': "Idempotency-Key must be 1 to 255 characters"}, status=400)
+
+        # The body is read line by line instead of being loaded at once
+        try:
+            result = import_ndjson_transactions(
+                request, request.user, idempotency_key,
+                skip_duplicates=request.GET.get('skip_duplicates') in ('1', 'true'),
+            )
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        return JsonResponse(result, status=200 if result['replayed'] else 201)
 
 
 class TotalsView(LoginRequiredMixin, ListView):
@@ -331,9 +744,14 @@ class TotalsView(LoginRequiredMixin, ListView):
         self.object_list = self.get_queryset()
         context = super().get_context_data(**kwargs)
 
-        # Calculate totals
-        total_income = Transaction.objects.filter(type='income').aggregate(Sum('amount'))['amount__sum'] or 0
-        total_expenses = Transaction.objects.filter(type='expense').aggregate(Sum('amount'))['amount__sum'] or 0
+        # Calculate totals from the hot table plus the totals carried over by archiving
+        total_income = self.object_list.filter(type='income').aggregate(Sum('amount'))['amount__sum'] or 0
+        total_expenses = self.object_list.filter(type='expense').aggregate(Sum('amount'))['amount__sum'] or 0
+
+        checkpoint = ArchiveCheckpoint.objects.filter(user=self.request.user).first()
+        if checkpoint:
+            total_income += checkpoint.income
+            total_expenses += checkpoint.expenses
         
         context = {
             'total_income': total_income,
@@ -342,3 +760,53 @@ class TotalsView(LoginRequiredMixin, ListView):
         }
         
         return context
+
+
+@method_decorator(staff_member_required, name='dispatch')
+class ProfileCaptureListView(View):
+    template_name = 'tracker/admin/profile-captures.html'
+
+    def get(self, request, *args, **kwargs):
+        context = {
+            **admin.site.each_context(request),
+            'title': 'Request profiles',
+            'captures': profiling.list_captures(),
+        }
+        return render(request, self.template_name, context)
+
+
+@method_decorator(staff_member_required, name='dispatch')
+class ProfileCaptureDetailView(View):
+    template_name = 'tracker/admin/profile-capture.html'
+
+    def get(self, request, capture_id, *args, **kwargs):
+        capture = profiling.load_capture(capture_id)
+        if capture is None:
+            raise Http404("Profile capture not found")
+
+        if request.GET.get('download') == 'pstats':
+            storage = profiling.get_profile_storage()
+            if not storage.exists(f'{capture_id}.pstats'):
+                raise Http404("This capture has no CPU profile")
+            return FileResponse(storage.open(f'{capture_id}.pstats'), as_attachment=True, filename=f'{capture_id}.pstats')
+
+        context = {
+            **admin.site.each_context(request),
+            'title': f"Profile {capture_id}",
+            'capture': capture,
+            'queries': sorted(capture['queries'], key=lambda query: query['duration_ms'], reverse=True),
+        }
+        return render(request, self.template_name, context)
+
+
+def metrics_view(request):
+    """Exposes the metrics of every worker process in the Prometheus text format."""
+    # Closed unless a scrape token is configured, except in development
+    token = settings.METRICS_TOKEN
+    if token:
+        if request.headers.get('Authorization') != f'Bearer {token}':
+            return HttpResponseForbidden()
+    elif not settings.DEBUG:
+        return HttpResponseForbidden()
+
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')